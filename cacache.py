@@ -0,0 +1,155 @@
+"""Finds published package tarballs in the local npm cache.
+
+npm keeps every tarball it downloads in a content-addressed store, usually
+`~/.npm/_cacache`. Content is stored under the digest of its Subresource
+Integrity string, and bucketed index files map request keys, which contain
+the tarball URL, to that integrity string.
+"""
+
+import os
+import json
+import base64
+import hashlib
+import urllib
+import urlparse
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.npm', '_cacache')
+INDEX_DIR = 'index-v5'
+CONTENT_DIR = 'content-v2'
+
+# strongest first
+SUPPORTED_ALGORITHMS = ['sha512', 'sha384', 'sha256', 'sha1']
+
+def build_index(cache_dir):
+    """Read the cache index into memory.
+
+    Args:
+        cache_dir (str): The location of the cacache store.
+
+    Returns:
+        dict: Maps 'name@version' to the integrity string of its tarball, for
+            every tarball present in the index.
+    """
+    integrity_by_key = {}
+    for dirpath, _, filenames in os.walk(os.path.join(cache_dir, INDEX_DIR)):
+        for filename in filenames:
+            with open(os.path.join(dirpath, filename), 'r') as bucket:
+                for key, integrity in read_bucket(bucket):
+                    if integrity is None:
+                        integrity_by_key.pop(key, None) # entry was deleted
+                    else:
+                        integrity_by_key[key] = integrity
+
+    index = {}
+    for key, integrity in integrity_by_key.iteritems():
+        name_version = parse_tarball_key(key)
+        if name_version is not None:
+            index['%s@%s' % name_version] = integrity
+    return index
+
+def read_bucket(bucket):
+    """Yield (key, integrity) for each valid entry of an index bucket file.
+
+    Each line holds the SHA-1 of an entry followed by a tab and the entry as
+    JSON. Later lines supersede earlier ones for the same key. Lines that were
+    only partially written are skipped.
+    """
+    for line in bucket:
+        line = line.rstrip('\n')
+        if '\t' not in line:
+            continue
+        entry_hash, entry_str = line.split('\t', 1)
+        if hashlib.sha1(entry_str).hexdigest() != entry_hash:
+            continue
+        try:
+            entry = json.loads(entry_str)
+        except ValueError:
+            continue
+        if 'key' in entry:
+            yield str(entry['key']), entry.get('integrity')
+
+def parse_tarball_key(key):
+    """Get the package name and version from a cache key for a tarball.
+
+    Sample keys:
+    make-fetch-happen:request-cache:https://registry.npmjs.org/bigi/-/bigi-1.4.1.tgz
+    make-fetch-happen:request-cache:https://registry.npmjs.org/@babel/core/-/core-7.0.0.tgz
+
+    Returns:
+        tuple: (name, version) as `str`s, or `None` if `key` is not for a
+            package tarball.
+    """
+    url_start = key.find('http')
+    if url_start == -1:
+        return None
+    path = urllib.unquote(urlparse.urlparse(key[url_start:]).path)
+    if '/-/' not in path or not path.endswith('.tgz'):
+        return None
+
+    name_path, filename = path.rsplit('/-/', 1)
+    name_parts = name_path.strip('/').split('/')
+    # registries may be hosted below a path prefix, so only keep the name and
+    # its scope, if any
+    if len(name_parts) >= 2 and name_parts[-2].startswith('@'):
+        name = '/'.join(name_parts[-2:])
+    else:
+        name = name_parts[-1]
+
+    prefix = name.split('/')[-1] + '-'
+    if not filename.startswith(prefix):
+        return None
+    return name, filename[len(prefix):-len('.tgz')]
+
+def get_strongest_digest(integrity):
+    """Pick the strongest supported hash from a Subresource Integrity string.
+
+    Returns:
+        tuple: (algorithm, digest) where `digest` is the raw digest as a
+            `str`, or `None` if no supported algorithm is listed.
+    """
+    digests = {}
+    for item in integrity.split():
+        algorithm, _, b64_digest = item.partition('-')
+        b64_digest = b64_digest.split('?', 1)[0] # drop options
+        if algorithm in SUPPORTED_ALGORITHMS and algorithm not in digests:
+            try:
+                digests[algorithm] = base64.b64decode(b64_digest)
+            except TypeError:
+                continue
+    for algorithm in SUPPORTED_ALGORITHMS:
+        if algorithm in digests:
+            return algorithm, digests[algorithm]
+    return None
+
+def get_content_path(cache_dir, algorithm, digest):
+    """Get the filename under which content with this digest is stored."""
+    hex_digest = digest.encode('hex')
+    return os.path.join(cache_dir, CONTENT_DIR, algorithm, hex_digest[0:2],
+                        hex_digest[2:4], hex_digest[4:])
+
+class IntegrityReader(object):
+    """Wraps a file, hashing everything read through it.
+
+    Lets a tarball be checked against its integrity string in the same pass
+    that its members are hashed.
+    """
+
+    def __init__(self, in_file, algorithm):
+        self._in_file = in_file
+        self._hash = hashlib.new(algorithm)
+
+    def read(self, size=-1):
+        """Read from the wrapped file."""
+        data = self._in_file.read(size)
+        self._hash.update(data)
+        return data
+
+    def digest(self):
+        """Read the rest of the wrapped file and return its digest."""
+        while self.read(65536):
+            pass
+        return self._hash.digest()
+
+    def close(self):
+        """Close the wrapped file."""
+        self._in_file.close()
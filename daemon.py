@@ -0,0 +1,206 @@
+"""Serve verification requests from a long-lived process.
+
+Starting `npm_dependency_check.py` for every check pays for interpreter
+startup, reading the npm cache index and parsing the baseline each time. The
+daemon keeps a `Verifier` session, which holds parsed baselines, file hashes
+and the npm cache index in memory, and answers requests over a Unix socket,
+one JSON object per line:
+
+    request:  {"target_dir": "/srv/app", "baseline": "/srv/app.json"}
+    response: {"num_packages": 42, "warnings": [...], "num_warnings": 0,
+               "elapsed_ms": 3.1}
+
+`baseline` may be `null` to only run the checks that do not need one. A
+response with an 'error' attribute means the request could not be served.
+
+Usage:
+    python daemon.py serve socket-path [npm_dependency_check.py options]
+    python daemon.py check socket-path target-dir [--input baseline-json]
+"""
+
+import argparse
+import os
+import sys
+import json
+import stat
+import signal
+import socket
+import threading
+import SocketServer
+
+import npm_dependency_check # npm_dependency_check.py
+
+def verify(verifier, request_json):
+    """Serve a single request with a `Verifier`.
+
+    Returns:
+        dict: The response.
+    """
+    target_dir = request_json.get('target_dir')
+    baseline = request_json.get('baseline')
+    if not isinstance(target_dir, basestring):
+        return {'error': "Request does not specify 'target_dir'."}
+    if not os.path.isabs(target_dir) or (
+            baseline is not None and not os.path.isabs(baseline)):
+        return {'error': "Request locations must be absolute."}
+
+    try:
+        if baseline is None:
+            return verifier.scan(str(target_dir), include_package_data=False)
+        return verifier.compare(str(target_dir), str(baseline))
+    except (ValueError, IOError, OSError) as err:
+        return {'error': str(err)}
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+    """Answers each line received on a connection."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request_json = json.loads(line)
+            except ValueError:
+                response_json = {'error': "Request is not valid JSON."}
+            else:
+                if isinstance(request_json, dict):
+                    response_json = verify(self.server.verifier,
+                                           request_json)
+                else:
+                    response_json = {'error': "Request is not an object."}
+            self.wfile.write(json.dumps(response_json) + '\n')
+            self.wfile.flush()
+
+class VerifierServer(SocketServer.ThreadingUnixStreamServer):
+    """Serves each connection from its own thread."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, verifier):
+        SocketServer.ThreadingUnixStreamServer.__init__(self, socket_path,
+                                                        RequestHandler)
+        self.verifier = verifier
+
+def serve_main(argv):
+    """Load the shared state and serve requests until interrupted."""
+    parser = argparse.ArgumentParser(
+        prog='%s serve' % os.path.basename(sys.argv[0]),
+        description=('Serve verification requests over a Unix socket. Options '
+                     'after the socket are those of npm_dependency_check.py '
+                     'and apply to every request.'))
+    parser.add_argument('socket_path', type=str, metavar='socket-path',
+                        help='where to create the Unix socket.')
+    parser.add_argument('options', nargs=argparse.REMAINDER,
+                        help='npm_dependency_check.py options.')
+    args = parser.parse_args(argv)
+
+    err = check_socket_path(args.socket_path)
+    if err is not None:
+        parser.error(err)
+    try:
+        verifier = npm_dependency_check.Verifier(args.options)
+    except ValueError as err:
+        parser.error(str(err))
+    if os.path.exists(args.socket_path):
+        os.remove(args.socket_path)
+    # the daemon reports on any directory it can read, so only its own user
+    # may connect. the socket is created without access for anyone else,
+    # rather than restricted after it has been bound.
+    old_umask = os.umask(0177)
+    try:
+        server = VerifierServer(args.socket_path, verifier)
+    finally:
+        os.umask(old_umask)
+    os.chmod(args.socket_path, 0600)
+    # shut down cleanly when stopped by a service manager. The server loop
+    # swallows exceptions raised while it handles a connection, so it is
+    # asked to stop from another thread instead.
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(
+        target=server.shutdown).start())
+    print "Serving verification requests on '%s'." % args.socket_path
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        verifier.close()
+        os.remove(args.socket_path)
+
+def check_socket_path(socket_path):
+    """Check that nothing but a stale socket would be replaced by serving on
+    `socket_path`.
+
+    Returns:
+        str: Why the daemon cannot serve on `socket_path`, or `None`.
+    """
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except OSError:
+        return None # nothing there yet
+    if not stat.S_ISSOCK(mode):
+        return "'%s' exists and is not a socket." % socket_path
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except socket.error:
+        return None # left behind by a daemon that has stopped
+    finally:
+        client.close()
+    return "A daemon is already serving on '%s'." % socket_path
+
+def check_main(argv):
+    """Send a single request to a running daemon and report the result.
+
+    Exits with status 1 if there were warnings and 2 if the request failed.
+    """
+    parser = argparse.ArgumentParser(
+        prog='%s check' % os.path.basename(sys.argv[0]),
+        description='Ask a running daemon to verify a directory.')
+    parser.add_argument('socket_path', type=str, metavar='socket-path',
+                        help='the Unix socket the daemon is serving on.')
+    parser.add_argument('target_dir', type=str, metavar='target-dir',
+                        help='the npm package directory to verify.')
+    parser.add_argument('--input', type=str, metavar='baseline-json',
+                        help='baseline to compare the directory to.')
+    args = parser.parse_args(argv)
+
+    request_json = {'target_dir': os.path.abspath(args.target_dir),
+                    'baseline': None}
+    if args.input is not None:
+        request_json['baseline'] = os.path.abspath(args.input)
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(args.socket_path)
+        client.sendall(json.dumps(request_json) + '\n')
+        response = client.makefile('r').readline()
+    finally:
+        client.close()
+
+    try:
+        response_json = json.loads(response)
+    except ValueError:
+        response_json = {'error': "No response from daemon."}
+    if 'error' in response_json:
+        print >> sys.stderr, "ERROR: %s" % response_json['error']
+        sys.exit(2)
+
+    for warning in response_json['warnings']:
+        print "WARNING: %s" % warning
+    num_warnings = response_json['num_warnings']
+    if num_warnings > 0:
+        print("ATTENTION: Execution produced %d warning%s." %
+              (num_warnings, 's' if num_warnings != 1 else ''))
+        sys.exit(1)
+    print "No changes detected between npm installations."
+
+def main():
+    """Dispatch to the `serve` or `check` command."""
+    commands = {'serve': serve_main, 'check': check_main}
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        print >> sys.stderr, __doc__.strip()
+        sys.exit(2)
+    commands[sys.argv[1]](sys.argv[2:])
+
+if __name__ == '__main__':
+    main()
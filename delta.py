@@ -0,0 +1,245 @@
+"""Incremental baselines.
+
+A delta records how the packages in a baseline have changed: the data for
+packages that were added or rescanned, and the locations of packages that
+were removed. Packages are identified by their location relative to the
+top-level package in the same form used by npm lockfiles, e.g.
+'node_modules/a/node_modules/b', or '' for the top-level package itself.
+
+Baselines do not keep the directory of each package, so its location is
+derived from its name and that of its parent. A package installed in a
+directory not named after it, such as an npm alias, records its location in
+an 'install_location' attribute instead.
+"""
+
+import lockfile # lockfile.py
+
+DELTA_FORMAT = 1
+
+def index_packages(package_data_json):
+    """Flatten a baseline into a `dict` of packages keyed by location.
+
+    Args:
+        package_data_json (dict): A baseline, as written with `--output`.
+
+    Returns:
+        dict: Maps the location of every package to a shallow copy of its data
+            without the 'submodules' attribute.
+    """
+    index = {}
+    stack = [('', package_data_json)]
+    while stack:
+        key, package_json = stack.pop()
+        record = dict(package_json)
+        submodules = record.pop('submodules', [])
+        index[key] = record
+        for submodule in submodules:
+            child_key = get_key(key, submodule)
+            stack.append((child_key, submodule))
+    return index
+
+def build_tree(index):
+    """Rebuild a baseline from a `dict` returned by `index_packages`.
+
+    Packages whose parent is not in the index are dropped.
+
+    Returns:
+        dict: The top-level package with nested submodules, or `None` if the
+            index does not contain a top-level package.
+    """
+    if '' not in index:
+        return None
+    packages = dict((key, dict(record)) for key, record in index.iteritems())
+    # each submodule is inserted at the front, so iterate in reverse order to
+    # keep submodules sorted by location
+    for key in sorted(packages, reverse=True):
+        parent_key = lockfile.get_parent_key(key)
+        if parent_key is None or parent_key not in packages:
+            continue
+        packages[parent_key].setdefault('submodules', []).insert(
+            0, packages[key])
+    return packages['']
+
+def make_delta(prev_index, new_index):
+    """Describe how to turn one indexed baseline into another.
+
+    Args:
+        prev_index (dict): The previous baseline, as returned by
+            `index_packages`.
+        new_index (dict): The current baseline, as returned by
+            `index_packages`.
+
+    Returns:
+        dict: The delta, with attributes:
+            * delta_format (int)
+            * changed (dict): maps the location of each added or changed
+                package to its data, without submodules.
+            * removed (List[str]): the locations of removed packages.
+    """
+    changed = {}
+    for key, record in new_index.iteritems():
+        if prev_index.get(key) != record:
+            changed[key] = record
+    removed = [key for key in prev_index if key not in new_index]
+    return make_delta_json(changed, removed)
+
+def make_delta_json(changed, removed):
+    """Build a delta from the changed packages and removed locations.
+
+    See `make_delta` for the format.
+    """
+    return {'delta_format': DELTA_FORMAT, 'changed': changed,
+            'removed': sorted(removed)}
+
+def iter_keyed(package_records):
+    """Add the location of each package to the records of a traversal.
+
+    Args:
+        package_records (iterable): The (depth, json_obj) tuples yielded by
+            `iter_package_data`.
+
+    Yields:
+        tuple: (key, depth, json_obj) where `key` is the location of the
+            package, as for `index_packages`.
+    """
+    keys = []
+    for depth, package_json in package_records:
+        del keys[depth:]
+        key = '' if depth == 0 else get_key(keys[-1], package_json)
+        keys.append(key)
+        yield key, depth, package_json
+
+def get_key(parent_key, package_json):
+    """Get the location of a dependency of the package at `parent_key`.
+
+    Args:
+        package_json (dict): The data for the dependency.
+    """
+    install_location = package_json.get('install_location')
+    if install_location is not None:
+        return install_location
+    return lockfile.get_child_key(parent_key, package_json['package_name'])
+
+def get_install_location(key, package_name):
+    """Get the 'install_location' to record for the package named
+    `package_name` at `key`.
+
+    Returns:
+        str: `key`, or `None` if it can be derived from `package_name`.
+    """
+    parent_key = lockfile.get_parent_key(key)
+    if parent_key is None or \
+            lockfile.get_child_key(parent_key, package_name) == key:
+        return None
+    return key
+
+def apply_delta(index, delta_json):
+    """Destructively apply a delta to an indexed baseline.
+
+    Raises:
+        ValueError: If `delta_json` is not in a supported format.
+    """
+    if delta_json.get('delta_format') != DELTA_FORMAT:
+        raise ValueError("Unsupported delta format '%s'." %
+                         str(delta_json.get('delta_format')))
+    for key in delta_json.get('removed', []):
+        index.pop(key, None)
+    for key, record in delta_json.get('changed', {}).iteritems():
+        index[key] = record
+
+def apply_deltas(package_data_json, deltas):
+    """Apply a sequence of deltas, oldest first, to a baseline.
+
+    Returns:
+        dict: The resulting baseline.
+    """
+    index = index_packages(package_data_json)
+    for delta_json in deltas:
+        apply_delta(index, delta_json)
+    return build_tree(index)
+
+class PriorState(object):
+    """What is known about the target directory before it is scanned.
+
+    Holds the entries of the target's lockfile, if it has one, and optionally
+    a previous baseline whose file hashes can be reused for packages that
+    appear unchanged, or trusted for packages that are unchanged in the
+    lockfile.
+    """
+
+    def __init__(self, root, prev_index=None, baseline_index=None,
+                 changed_keys=None):
+        """
+        Args:
+            root (str): The top-level directory being scanned.
+            prev_index (dict): The previous baseline, as returned by
+                `index_packages`, if file hashes may be reused.
+            baseline_index (dict): The previous baseline, as returned by
+                `index_packages`, if it is to be trusted for packages whose
+                lockfile entries have not changed.
+            changed_keys (set): The locations of packages whose lockfile
+                entries have changed since `baseline_index` was made, as
+                returned by `lockfile.get_changed_keys`.
+        """
+        self.lock_entries = lockfile.read_lockfile(root)
+        self.prev_index = prev_index or {}
+        self.baseline_index = baseline_index or {}
+        self.changed_keys = changed_keys
+
+    def lock_integrity(self, key):
+        """Get what the lockfile says the package at `key` should contain.
+
+        Returns:
+            str: The integrity of the package, or where it was resolved from
+                if the lockfile does not record an integrity. `None` if the
+                package is not in the lockfile.
+        """
+        entry = self.lock_entries.get(key)
+        if entry is None:
+            return None
+        return entry.get('integrity', entry.get('resolved'))
+
+    def trusted_record(self, key, package_version, lock_integrity):
+        """Get the data from the trusted baseline for a package that is
+        unchanged in the lockfile.
+
+        A package is trusted without being scanned if its lockfile entry has
+        not changed, and the baseline has the same version and was made from
+        the same lockfile entry.
+
+        Returns:
+            dict: The data for the package in the baseline, or `None` if the
+                package must be scanned.
+        """
+        if (self.changed_keys is None or key in self.changed_keys or
+                key not in self.lock_entries or lock_integrity is None):
+            return None
+        record = self.baseline_index.get(key)
+        if (record is None or 'link_of' in record or
+                record.get('package_version') != package_version or
+                record.get('lock_integrity') != lock_integrity):
+            return None
+        return record
+
+    def reusable_files(self, key, package_version, lock_integrity,
+                       stat_signature):
+        """Get the file data from the previous baseline for an unchanged
+        package.
+
+        A package is considered unchanged if its version, lockfile entry and
+        stat signature all match those recorded in the previous baseline.
+
+        Returns:
+            List[dict]: A copy of the 'files' of the package in the previous
+                baseline, or `None` if the package must be rescanned.
+        """
+        record = self.prev_index.get(key)
+        if (record is None or 'stat_signature' not in record or
+                'link_of' in record):
+            return None
+        if (record.get('package_version') != package_version or
+                record.get('lock_integrity') != lock_integrity or
+                record['stat_signature'] != stat_signature):
+            return None
+        files = record.get('files')
+        return None if files is None else list(files)
@@ -0,0 +1,233 @@
+"""Looks up package sources in local bare git mirrors.
+
+A mirror directory holds bare repositories named after their GitHub project,
+e.g. `owner/project.git` as created by `git clone --mirror`. The files of a
+version are found by resolving its tag to a tree, and are identified by their
+git blob IDs, so that nothing needs to be downloaded or extracted.
+"""
+
+import os
+import threading
+import subprocess
+import urlparse
+
+class GitError(Exception):
+    """Raised when a repository cannot be read."""
+    pass
+
+class Repository(object):
+    """A bare repository, read through a single long-lived
+    `git cat-file --batch` process.
+
+    Trees are cached, so versions of a project that share directories only
+    read them once. Safe to use from several threads. After any error, the
+    process is stopped and a new one is started for the next request, as
+    its responses may no longer be in step with the requests.
+    """
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self._lock = threading.Lock()
+        self._process = None
+        self._trees = {} # tree id -> List[(mode, name, object id)]
+
+    def get_version_files(self, version):
+        """Get the files of a tagged version.
+
+        Args:
+            version (str): The package version, tagged as 'v<version>' or
+                '<version>'.
+
+        Returns:
+            tuple: (tag, files) where `files` maps the location of each file
+                relative to the top of the repository to its blob ID, or
+                `None` if the version is not tagged.
+
+        Raises:
+            GitError: If git could not read the repository.
+        """
+        with self._lock:
+            try:
+                for tag in get_possible_tags(version):
+                    tree_id = self._resolve('refs/tags/%s^{tree}' % tag)
+                    if tree_id is not None:
+                        return tag, self._list_files(tree_id)
+            except GitError:
+                self._discard()
+                raise
+            except ValueError as err: # a malformed header or tree
+                self._discard()
+                raise GitError("Could not read '%s': %s" % (self.git_dir,
+                                                            str(err)))
+        return None
+
+    def close(self):
+        """Stop the git process."""
+        with self._lock:
+            if self._process is not None:
+                self._process.stdin.close()
+                self._process.wait()
+                self._process = None
+
+    def _discard(self):
+        """Stop the git process without waiting for it to answer."""
+        if self._process is None:
+            return
+        try:
+            self._process.kill()
+        except OSError:
+            pass # already stopped
+        self._process.wait()
+        self._process.stdin.close()
+        self._process.stdout.close()
+        self._process = None
+
+    def _list_files(self, tree_id):
+        """Map the location of each blob below a tree to its ID."""
+        files = {}
+        stack = [('', tree_id)]
+        while stack:
+            prefix, current_id = stack.pop()
+            for mode, name, object_id in self._read_tree(current_id):
+                if mode == '40000':
+                    stack.append((prefix + name + '/', object_id))
+                elif mode != '160000': # submodules are not part of the tree
+                    files[prefix + name] = object_id
+        return files
+
+    def _read_tree(self, tree_id):
+        """Parse a tree object into (mode, name, object id) entries."""
+        if tree_id in self._trees:
+            return self._trees[tree_id]
+        object_type, data = self._read_object(tree_id)
+        if object_type != 'tree':
+            raise GitError("Object '%s' in '%s' is not a tree." %
+                           (tree_id, self.git_dir))
+        entries = []
+        pos = 0
+        while pos < len(data):
+            space = data.index(' ', pos)
+            nul = data.index('\0', space)
+            entries.append((data[pos:space], data[space + 1:nul],
+                            data[nul + 1:nul + 21].encode('hex')))
+            pos = nul + 21
+        self._trees[tree_id] = entries
+        return entries
+
+    def _resolve(self, revision):
+        """Get the object ID of a revision, or `None` if it does not exist."""
+        header = self._request(revision)
+        if header.endswith(' missing') or header.endswith(' ambiguous'):
+            return None
+        object_id, _, size = header.split(' ')
+        self._skip(int(size))
+        return object_id
+
+    def _read_object(self, object_id):
+        """Get the type and contents of an object."""
+        header = self._request(object_id)
+        if header.endswith(' missing'):
+            raise GitError("Object '%s' is missing from '%s'." %
+                           (object_id, self.git_dir))
+        found_id, object_type, size = header.split(' ')
+        if found_id != object_id:
+            raise GitError("Expected object '%s' from '%s', got '%s'." %
+                           (object_id, self.git_dir, found_id))
+        data = self._process.stdout.read(int(size))
+        self._process.stdout.read(1) # trailing newline
+        return object_type, data
+
+    def _skip(self, size):
+        """Discard the contents of an object that is not needed."""
+        self._process.stdout.read(size + 1)
+
+    def _request(self, revision):
+        """Ask the git process for an object and read its header line.
+
+        Raises:
+            GitError: If `revision` contains whitespace or control
+                characters, which would be read as more than one request.
+        """
+        if not is_safe_revision(revision):
+            raise GitError("Invalid revision %s for '%s'." %
+                           (repr(revision), self.git_dir))
+        if self._process is None:
+            try:
+                self._process = subprocess.Popen(
+                    ['git', '--git-dir', self.git_dir, 'cat-file', '--batch'],
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            except OSError as err:
+                raise GitError("Could not run git: %s" % str(err))
+        try:
+            self._process.stdin.write(revision + '\n')
+            self._process.stdin.flush()
+        except IOError as err:
+            raise GitError("Could not read '%s': %s" % (self.git_dir,
+                                                        str(err)))
+        header = self._process.stdout.readline()
+        if not header:
+            raise GitError("Could not read '%s'." % self.git_dir)
+        return header.rstrip('\n')
+
+class GitMirror(object):
+    """A directory of bare repositories, each opened once when first used."""
+
+    def __init__(self, mirror_dir):
+        self.mirror_dir = mirror_dir
+        self._lock = threading.Lock()
+        self._repositories = {} # git dir -> `Repository`
+
+    def get_repository(self, github_location):
+        """Get the mirror of a GitHub project.
+
+        Args:
+            github_location (str): The URL for the project on GitHub, as
+                returned by `npm.get_github_location`.
+
+        Returns:
+            `Repository`: The mirror, or `None` if it is not present.
+        """
+        for git_dir in get_possible_git_dirs(self.mirror_dir,
+                                             github_location):
+            if os.path.isdir(git_dir):
+                with self._lock:
+                    if git_dir not in self._repositories:
+                        self._repositories[git_dir] = Repository(git_dir)
+                    return self._repositories[git_dir]
+        return None
+
+    def close(self):
+        """Stop the git processes of all opened repositories."""
+        with self._lock:
+            for repository in self._repositories.itervalues():
+                repository.close()
+            self._repositories = {}
+
+def get_possible_git_dirs(mirror_dir, github_location):
+    """Get the locations at which a GitHub project may be mirrored.
+
+    Example: 'https://github.com/cryptocoinjs/bigi/' may be mirrored at
+    'cryptocoinjs/bigi.git', 'cryptocoinjs/bigi', 'bigi.git' or 'bigi'.
+    """
+    path = urlparse.urlparse(github_location).path.strip('/')
+    if path.endswith('.git'):
+        path = path[:-len('.git')]
+    parts = path.split('/')
+    if len(parts) != 2 or not all(parts) or '..' in parts:
+        return []
+    owner, project = parts
+    return [os.path.join(mirror_dir, owner, project + '.git'),
+            os.path.join(mirror_dir, owner, project),
+            os.path.join(mirror_dir, project + '.git'),
+            os.path.join(mirror_dir, project)]
+
+def is_safe_revision(revision):
+    """Returns whether a revision can be sent to `git cat-file --batch` as a
+    single request, i.e. it is not empty and has no whitespace or control
+    characters."""
+    return revision != '' and all(' ' < char < '\x7f' for char in revision)
+
+def get_possible_tags(version):
+    """Get the tags a version is likely to be released under, as for
+    `http.get_possible_zip_urls`."""
+    return ['v%s' % version, version]
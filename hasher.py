@@ -1,5 +1,6 @@
 """Creates message digests of files."""
 
+import os
 import hashlib
 
 def hash_file(filename):
@@ -18,8 +19,97 @@ def sha256_file(filename):
     From:
     http://stackoverflow.com/questions/3431825/generating-a-md5-checksum-of-a-file
     """
+    with open(filename, 'rb') as in_file:
+        return sha256_stream(in_file)
+
+def sha256_stream(in_file):
+    """Get SHA-256 hash of the remaining contents of a file-like object.
+
+    Args:
+        in_file (file): Any object with a `read` method, e.g. a member of a
+            tar archive being streamed.
+    """
     hash_sha256 = hashlib.sha256()
+    for chunk in iter(lambda: in_file.read(4096), b""):
+        hash_sha256.update(chunk)
+    return hash_sha256.hexdigest()
+
+def git_blob_id(filename):
+    """Get the ID git would give a file's contents as a blob object.
+
+    This matches the output of `git hash-object`, which is the SHA-1 of a
+    header giving the size of the file followed by its contents.
+
+    Args:
+        filename (str): The relative or absolute path of the target file.
+    """
     with open(filename, 'rb') as in_file:
-        for chunk in iter(lambda: in_file.read(4096), b""):
-            hash_sha256.update(chunk)
+        return sha256_and_git_blob_id(in_file, os.path.getsize(filename))[1]
+
+def sha256_and_git_blob_id(in_file, size):
+    """Get both the SHA-256 hash and the git blob ID of the remaining contents
+    of a file-like object, reading it once.
+
+    Args:
+        in_file (file): Any object with a `read` method.
+        size (int): The number of bytes that remain to be read, which git
+            includes in the blob ID.
+
+    Returns:
+        tuple: (sha256, blob_id) as hex strings.
+    """
+    hash_sha256 = hashlib.sha256()
+    hash_sha1 = hashlib.sha1("blob %d\0" % size)
+    for chunk in iter(lambda: in_file.read(4096), b""):
+        hash_sha256.update(chunk)
+        hash_sha1.update(chunk)
+    return hash_sha256.hexdigest(), hash_sha1.hexdigest()
+
+def sha256_string(data):
+    """Get SHA-256 hash of a string already read into memory."""
+    return hashlib.sha256(data).hexdigest()
+
+def stat_signature(files):
+    """Get a digest of the sizes and modification times of a set of files.
+
+    The signature changes whenever a file is added, removed, resized or
+    touched, without reading file contents. It is not a substitute for hashing
+    the contents, as modification times can be set at will.
+
+    Args:
+        files (List[tuple]): (name, filename) for each file, where `name` is
+            included in the signature and `filename` is the relative or
+            absolute path used to `stat` the file.
+    """
+    hash_sha256 = hashlib.sha256()
+    for name, filename in sorted(files):
+        stat = os.stat(filename)
+        hash_sha256.update("%s\0%d\0%d\n" % (name, stat.st_size,
+                                              int(stat.st_mtime)))
     return hash_sha256.hexdigest()
+
+def merkle_root(files_json):
+    """Get the root of a Merkle tree over the hashed files of a package.
+
+    Leaves are the SHA-256 of each file's location and hash, ordered by
+    location, and each level pairs up the nodes of the level below, carrying
+    an unpaired last node up unchanged. Two packages have the same root if and
+    only if they have the same files with the same hashes.
+
+    Args:
+        files_json (List[dict]): The 'files' of a package, each with a
+            'file_location' and 'file_hash' attribute.
+    """
+    level = [hashlib.sha256("%s\0%s" % (file_json['file_location'],
+                                        file_json['file_hash'])).digest()
+             for file_json in sorted(files_json,
+                                     key=lambda f: f['file_location'])]
+    if not level:
+        return hashlib.sha256("").hexdigest()
+    while len(level) > 1:
+        next_level = [hashlib.sha256(level[i] + level[i + 1]).digest()
+                      for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2 == 1:
+            next_level.append(level[-1])
+        level = next_level
+    return level[0].encode('hex')
@@ -20,7 +20,7 @@ def looks_like_version(version):
         * 1.0.0-rc4
         * 1.0.0
     """
-    pattern = re.compile(r'^([\w\-]+\.)?([\w\-]+\.)?([\w\-]+)$')
+    pattern = re.compile(r'^([\w\-]+\.)?([\w\-]+\.)?([\w\-]+)\Z')
     return bool(pattern.match(version))
 
 def get_possible_zip_urls(github_project_url, version):
@@ -50,7 +50,7 @@ def get_possible_zip_urls(github_project_url, version):
 
     return urls
 
-def fetch_url(url, fetch_tmp_file=False):
+def fetch_url(url, fetch_tmp_file=False, fetch_stream=False):
     """Fetch contents of remote page as string for specified url.
 
     Handles a variety of errors and retries with linearly increasing backoff.
@@ -61,9 +61,14 @@ def fetch_url(url, fetch_tmp_file=False):
             of returning the contents of the HTTP response body as a string,
             a file handle to a temporary file where the contents have been
             output will be returned.
+        fetch_stream (bool): Disabled by default. If set to true, the
+            response object is returned once the request succeeds so that the
+            caller can read the body incrementally. Errors while reading are
+            not retried.
 
     Returns:
-        str or filename, depending on setting of `fetch_tmp_file` arg.
+        str, filename or `urllib.addinfourl`, depending on setting of
+        `fetch_tmp_file` and `fetch_stream` args.
     """
 
     if NUM_SEC_SLEEP > 0:
@@ -79,7 +84,9 @@ def fetch_url(url, fetch_tmp_file=False):
             time.sleep(current_retry_time_in_sec)
         try:
             req = urllib2.urlopen(url=url, timeout=NUM_SEC_TIMEOUT)
-            if fetch_tmp_file:
+            if fetch_stream:
+                return req
+            elif fetch_tmp_file:
                 return download_to_tmp(url, req)
             else:
                 response = req.read()
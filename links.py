@@ -0,0 +1,201 @@
+"""Tracks physical files and directories by (device, inode).
+
+Content-addressed package stores such as pnpm's hardlink and symlink the same
+physical files and package directories into many `node_modules` locations.
+Keying on the (device, inode) pair of the link target lets a traversal hash
+each physical file once and notice when a symlinked directory leads back into
+one of its own ancestors.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import hasher   # hasher.py
+import throttle # throttle.py
+
+# the most file hashes a `HashCache` keeps by default; a few hundred bytes each
+MAX_CACHED_HASHES = 500000
+
+class InodeTracker(object):
+    """Remembers which physical files and package directories have been
+    visited.
+
+    Locations are reported relative to `root`, the top-level directory that
+    was specified to this script, so that they remain meaningful in a baseline
+    generated on another machine.
+    """
+
+    def __init__(self, root, hash_cache=None, limiter=None,
+                 git_blob_ids=False):
+        """
+        Args:
+            root (str): The top-level directory of the traversal.
+            hash_cache (`HashCache`): Hashes of files kept between
+                traversals, keyed by their device, inode, size, modification
+                time and inode change time. The inode change time cannot be
+                set at will, so a file cannot be modified without missing the
+                cache.
+            limiter (`throttle.Throttle`): Paces the files read, if
+                specified.
+            git_blob_ids (bool): Whether to also get the git blob ID of each
+                file hashed, in the same pass.
+        """
+        self.root = root
+        self.git_blob_ids = git_blob_ids
+        self._hash_cache = hash_cache
+        self._limiter = limiter
+        self._file_hashes = {} # (dev, ino) -> (location, hash, blob ID)
+        self._dirs = {}        # (dev, ino) -> location of first visit
+
+    def relative(self, location):
+        """Express `location` relative to the traversal root."""
+        rel = os.path.relpath(location, self.root)
+        return '' if rel == os.curdir else rel
+
+    def hash_file(self, location):
+        """Hash a file unless its physical copy has already been hashed.
+
+        Only files that can be reached through more than one path, because
+        they are hardlinked or `location` is a symlink, are remembered.
+
+        Args:
+            location (str): Location of the file relative to the current
+                working directory.
+
+        Returns:
+            tuple: (hash, first, blob_id) where `hash` is the file hash as a
+                `str`, `first` is the root-relative location at which this
+                physical file was first hashed, or `None` if this is the first
+                time, and `blob_id` is its git blob ID if `git_blob_ids` is
+                set, otherwise `None`.
+        """
+        stat = os.stat(location)
+        key = (stat.st_dev, stat.st_ino)
+        if key in self._file_hashes:
+            first, file_hash, blob_id = self._file_hashes[key]
+            return file_hash, first, blob_id
+        file_hash, blob_id = self._hash_file_cached(location, stat)
+        if stat.st_nlink > 1 or os.path.islink(location):
+            self._file_hashes[key] = (self.relative(location), file_hash,
+                                      blob_id)
+        return file_hash, None, blob_id
+
+    def _hash_file_cached(self, location, stat):
+        """Hash a file, or look up its hashes if it is unchanged since it was
+        hashed by an earlier traversal.
+
+        Returns:
+            tuple: (hash, blob_id)
+        """
+        if self._hash_cache is None:
+            return self._hash_file(location, stat.st_size)
+        cache_key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime,
+                     stat.st_ctime)
+        hashes = self._hash_cache.get(cache_key)
+        if hashes is None or (self.git_blob_ids and hashes[1] is None):
+            hashes = self._hash_file(location, stat.st_size)
+            self._hash_cache[cache_key] = hashes
+        return hashes
+
+    def _hash_file(self, location, size):
+        """Hash a file, at the pace set by the limiter if there is one.
+
+        Returns:
+            tuple: (hash, blob_id)
+        """
+        with open_file(location, self._limiter) as in_file:
+            if self.git_blob_ids:
+                return hasher.sha256_and_git_blob_id(in_file, size)
+            return hasher.sha256_stream(in_file), None
+
+    def first_visit(self, location):
+        """Get the root-relative location at which a directory was first
+        visited.
+
+        Returns `None`, and records `location`, if the physical directory has
+        not been visited before.
+        """
+        key = inode_key(location)
+        if key in self._dirs:
+            return self._dirs[key]
+        self._dirs[key] = self.relative(location)
+        return None
+
+class HashCache(object):
+    """File hashes kept between traversals by a long-lived process, as used
+    by `InodeTracker`.
+
+    Only the most recently used hashes are kept, so that a process checking
+    many installations over its lifetime does not grow without limit. Safe
+    to use from several threads at once.
+    """
+
+    def __init__(self, max_entries=MAX_CACHED_HASHES):
+        self.max_entries = max_entries
+        self._hashes = OrderedDict() # least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get the hash cached for `key`, or `None`."""
+        with self._lock:
+            file_hash = self._hashes.pop(key, None)
+            if file_hash is not None:
+                self._hashes[key] = file_hash
+            return file_hash
+
+    def __setitem__(self, key, file_hash):
+        with self._lock:
+            self._hashes.pop(key, None)
+            self._hashes[key] = file_hash
+            while len(self._hashes) > self.max_entries:
+                self._hashes.popitem(last=False)
+
+    def __len__(self):
+        return len(self._hashes)
+
+class Ancestry(object):
+    """A directory on a depth-first traversal, linked to its parent.
+
+    Siblings share the chain of their parents, so pending directories on an
+    explicit traversal stack cost one object each.
+    """
+
+    __slots__ = ('key', 'location', 'parent')
+
+    def __init__(self, location, parent=None):
+        self.key = inode_key(location)
+        self.location = location
+        self.parent = parent
+
+    def find(self, location):
+        """Get the location of the ancestor that is the same physical
+        directory as `location`, or `None` if there isn't one."""
+        key = inode_key(location)
+        node = self
+        while node is not None:
+            if node.key == key:
+                return node.location
+            node = node.parent
+        return None
+
+@contextmanager
+def open_file(location, limiter=None):
+    """Open a file for reading, at the pace set by `limiter` if specified.
+
+    Yields:
+        file: The open file, or a `throttle.ThrottledReader` of it.
+    """
+    if limiter is not None:
+        limiter.open_file()
+    with open(location, 'rb') as in_file:
+        if limiter is None:
+            yield in_file
+        else:
+            yield throttle.ThrottledReader(in_file, limiter)
+
+def inode_key(location):
+    """Get the (device, inode) pair identifying the target of `location`."""
+    stat = os.stat(location)
+    return (stat.st_dev, stat.st_ino)
@@ -0,0 +1,106 @@
+"""Reads npm lockfiles."""
+
+import os
+import json
+
+import util # util.py
+
+# in order of precedence, as used by npm
+LOCKFILE_NAMES = ['npm-shrinkwrap.json', 'package-lock.json',
+                  os.path.join('node_modules', '.package-lock.json')]
+
+def find_lockfile(package_location):
+    """Get the filename of the lockfile for a package, or `None`."""
+    for name in LOCKFILE_NAMES:
+        filename = os.path.join(package_location, name)
+        if os.path.isfile(filename):
+            return filename
+    return None
+
+def read_lockfile(package_location):
+    """Read the lockfile for a package, if there is one.
+
+    Args:
+        package_location (str): The top-level directory of an npm package.
+
+    Returns:
+        dict: See `get_lock_entries`. Empty if there is no readable lockfile.
+    """
+    filename = find_lockfile(package_location)
+    if filename is None:
+        return {}
+    with open(filename, 'r') as lock_file:
+        try:
+            return get_lock_entries(json.load(lock_file))
+        except ValueError:
+            return {}
+
+def get_lock_entries(lock_json_obj):
+    """Get the locked packages from a parsed lockfile.
+
+    Both the flat 'packages' format of lockfile versions 2 and 3 and the nested
+    'dependencies' format of version 1 are supported.
+
+    Args:
+        lock_json_obj (dict): The object returned by calling json.load() on
+            the lockfile.
+
+    Returns:
+        dict: Maps the location of each installed package relative to the
+            top-level package, e.g. 'node_modules/a/node_modules/b', to a
+            `dict` of its 'version', 'resolved' and 'integrity', as available.
+            The top-level package itself is not included.
+    """
+    entries = {}
+    if isinstance(lock_json_obj.get('packages'), dict):
+        for key, entry in lock_json_obj['packages'].iteritems():
+            if key != '' and isinstance(entry, dict):
+                entries[util.standardize_str(key)] = get_lock_entry(entry)
+    elif isinstance(lock_json_obj.get('dependencies'), dict):
+        stack = [('', lock_json_obj['dependencies'])]
+        while stack:
+            parent_key, dependencies = stack.pop()
+            for name, entry in dependencies.iteritems():
+                if not isinstance(entry, dict):
+                    continue
+                key = get_child_key(parent_key, util.standardize_str(name))
+                entries[key] = get_lock_entry(entry)
+                if isinstance(entry.get('dependencies'), dict):
+                    stack.append((key, entry['dependencies']))
+    return entries
+
+def get_changed_keys(prev_entries, new_entries):
+    """Get the locations of packages added, removed or changed between two
+    lockfiles.
+
+    Args:
+        prev_entries (dict): The entries of the earlier lockfile, as returned
+            by `get_lock_entries`.
+        new_entries (dict): The entries of the later lockfile.
+
+    Returns:
+        set: The locations whose version, resolved URL or integrity differ,
+            including those present in only one of the lockfiles.
+    """
+    return set(key for key in set(prev_entries) | set(new_entries)
+               if prev_entries.get(key) != new_entries.get(key))
+
+def get_lock_entry(entry):
+    """Keep the attributes of a lockfile entry that identify its contents."""
+    return dict((attr, util.standardize_str(entry[attr]))
+                for attr in ('version', 'resolved', 'integrity')
+                if attr in entry)
+
+def get_child_key(parent_key, name):
+    """Get the lockfile location of dependency `name` installed in the
+    `node_modules` directory of the package at `parent_key`."""
+    if parent_key == '':
+        return 'node_modules/' + name
+    return '%s/node_modules/%s' % (parent_key, name)
+
+def get_parent_key(key):
+    """Get the lockfile location of the package whose `node_modules` directory
+    holds the package at `key`, or `None` for the top-level package."""
+    if key == '':
+        return None
+    return key[:key.rfind('node_modules/')].rstrip('/')
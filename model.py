@@ -0,0 +1,181 @@
+"""Compact in-memory records of packages read from a baseline.
+
+A baseline parsed with `json.load` holds a `dict` for every file, with its
+own copy of the file's location and a 64-character hex digest. The records
+here keep each package's files in a table instead: file locations are
+interned, so that names such as 'package.json' or 'lib/index.js' are stored
+once across all packages, and SHA-256 digests are packed together as raw
+bytes.
+
+Records can be read like the `dict`s they replace, so code such as
+`compare_jsons` handles both alike, and `to_json` converts them back. Strings
+are kept as UTF-8 encoded `str`s, as read from the file system and from
+`package.json` files when scanning.
+"""
+
+import binascii
+
+import util # util.py
+
+# attributes of a package that are kept in slots; others are kept in a `dict`
+PACKAGE_ATTRS = ('package_location', 'package_name', 'package_version',
+                 'github_location', 'merkle_root', 'stat_signature',
+                 'lock_integrity', 'link_of', 'install_location')
+
+DIGEST_SIZE = 32 # SHA-256
+
+_MISSING = object()
+
+class FileTable(object):
+    """The hashed files of a package, read as a list of `dict`s in the format
+    of `get_file_data`.
+
+    The `dict` for each file is created when it is read.
+    """
+
+    __slots__ = ('_locations', '_digests', '_hashes', '_links')
+
+    def __init__(self, files_json):
+        """
+        Args:
+            files_json (List[dict]): The 'files' of a package.
+        """
+        self._locations = tuple(
+            intern(util.standardize_str(file_json['file_location']))
+            for file_json in files_json)
+        self._links = None
+        links = dict((i, util.standardize_str(file_json['link_of']))
+                     for i, file_json in enumerate(files_json)
+                     if 'link_of' in file_json)
+        if links:
+            self._links = links
+
+        hashes = [str(file_json['file_hash']) for file_json in files_json]
+        try:
+            digests = [binascii.unhexlify(file_hash) for file_hash in hashes]
+        except TypeError:
+            digests = None
+        if digests is not None and all(len(digest) == DIGEST_SIZE
+                                       for digest in digests):
+            self._digests = ''.join(digests)
+            self._hashes = None
+        else:
+            # not all SHA-256 digests, so keep them as they are
+            self._digests = None
+            self._hashes = tuple(hashes)
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self._locations)
+        if not 0 <= index < len(self._locations):
+            raise IndexError(index)
+        if self._digests is not None:
+            start = index * DIGEST_SIZE
+            file_hash = binascii.hexlify(
+                self._digests[start:start + DIGEST_SIZE])
+        else:
+            file_hash = self._hashes[index]
+        file_json = {'file_location': self._locations[index],
+                     'file_hash': file_hash}
+        if self._links is not None and index in self._links:
+            file_json['link_of'] = self._links[index]
+        return file_json
+
+    def __iter__(self):
+        for index in xrange(len(self._locations)):
+            yield self[index]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+class PackageRecord(object):
+    """The data for a single package, without submodules, read as a `dict`
+    in the format of `get_single_package_data`."""
+
+    __slots__ = PACKAGE_ATTRS + ('files', '_extra')
+
+    def __init__(self, package_json):
+        """
+        Args:
+            package_json (dict): The data for a package. 'submodules' is
+                ignored.
+        """
+        for attr in PACKAGE_ATTRS:
+            value = package_json.get(attr, _MISSING)
+            if isinstance(value, unicode):
+                value = util.standardize_str(value)
+            setattr(self, attr, value)
+        self.files = _MISSING
+        if 'files' in package_json:
+            self.files = FileTable(package_json['files'])
+        self._extra = None
+        extra = dict((attr, value) for attr, value in package_json.iteritems()
+                     if attr not in PACKAGE_ATTRS and
+                     attr not in ('files', 'submodules'))
+        if extra:
+            self._extra = extra
+
+    def __getitem__(self, attr):
+        value = self.get(attr, _MISSING)
+        if value is _MISSING:
+            raise KeyError(attr)
+        return value
+
+    def __contains__(self, attr):
+        return self.get(attr, _MISSING) is not _MISSING
+
+    def get(self, attr, default=None):
+        """Get an attribute, or `default` if the package does not have it."""
+        if attr in PACKAGE_ATTRS or attr == 'files':
+            value = getattr(self, attr)
+        elif self._extra is not None:
+            value = self._extra.get(attr, _MISSING)
+        else:
+            value = _MISSING
+        return default if value is _MISSING else value
+
+    def keys(self):
+        """Get the names of the attributes the package has."""
+        return [attr for attr in PACKAGE_ATTRS + ('files',)
+                if getattr(self, attr) is not _MISSING] + \
+            list(self._extra or [])
+
+    def to_json(self):
+        """Convert back to a `dict`, with 'files' as a list of `dict`s."""
+        package_json = dict((attr, self[attr]) for attr in self.keys())
+        if 'files' in package_json:
+            package_json['files'] = list(package_json['files'])
+        return package_json
+
+    def __eq__(self, other):
+        if isinstance(other, PackageRecord):
+            other = other.to_json()
+        return self.to_json() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self.to_json())
+
+def compact_index(index):
+    """Destructively replace the records of an indexed baseline, as returned
+    by `delta.index_packages`, with `PackageRecord`s, and its locations with
+    `str`s.
+
+    Returns:
+        dict: `index`
+    """
+    for key in index.keys():
+        record = PackageRecord(index.pop(key))
+        index[util.standardize_str(key)] = record
+    return index
@@ -52,7 +52,8 @@ def get_github_location(package_json_obj):
 
     If it cannot be determined from the `package.json` file, `None` is returned.
     """
-    if 'repository' in package_json_obj:
+    if ('repository' in package_json_obj and
+            isinstance(package_json_obj['repository'], dict)):
         if 'url' in package_json_obj['repository']:
             url = util.standardize_str(package_json_obj['repository']['url'])
             if url.endswith('.git'):
@@ -2,36 +2,81 @@
 
 import argparse
 import os
+import sys
 import json
 import warnings
-import tempfile
-from shutil import rmtree
+import time
+import threading
+from contextlib import contextmanager
 import zipfile
-from urllib2 import HTTPError
-from copy import deepcopy
+import tarfile
+from urllib2 import HTTPError, URLError
+from copy import copy, deepcopy
+from collections import deque
+from multiprocessing.pool import ThreadPool
 
 import hasher # hasher.py
 import npm    # npm.py
 import http   # http.py
 import util   # util.py
+import links  # links.py
+import delta  # delta.py
+import lockfile # lockfile.py
+import registry # registry.py
+import cacache  # cacache.py
+import store    # store.py
+import throttle # throttle.py
+import gitmirror # gitmirror.py
+import model    # model.py
 
 # pylint: disable=C0103
 glob_num_warnings = 0
 
+# per-thread list of warnings being collected, see `collected_warnings`
+glob_collector = threading.local()
+
 ENABLE_DEBUG_PRINT = False
 
 def warn(string):
-    """Write warning to stdout."""
+    """Write warning to stdout, or collect it if `collected_warnings` is in
+    effect for the current thread."""
     global glob_num_warnings
     glob_num_warnings += 1
-    warnings.warn(string)
+    collected = getattr(glob_collector, 'warnings', None)
+    if collected is not None:
+        collected.append(string)
+    else:
+        warnings.warn(string)
 
-def remove_package_location(package_data_json):
-    """Destructively removes 'package_location' from `dict`."""
+def info(string):
+    """Write a summary line to stdout, unless `collected_warnings` is in effect
+    for the current thread."""
+    if getattr(glob_collector, 'warnings', None) is None:
+        print string
+
+@contextmanager
+def collected_warnings():
+    """Collect the warnings emitted by the current thread instead of writing
+    them to stdout.
+
+    Yields:
+        List[str]: The warnings emitted so far.
+    """
+    glob_collector.warnings = []
     try:
-        package_data_json.pop('package_location')
-    except KeyError:
-        pass
+        yield glob_collector.warnings
+    finally:
+        glob_collector.warnings = None
+
+# attributes of a package that are only meaningful during the current run,
+# and are not written to baselines
+RUN_ONLY_ATTRS = ('package_location', 'git_blob_ids')
+
+def remove_package_location(package_data_json):
+    """Destructively removes 'package_location', and other attributes in
+    `RUN_ONLY_ATTRS`, from `dict`."""
+    for attr in RUN_ONLY_ATTRS:
+        package_data_json.pop(attr, None)
 
     for key, value in package_data_json.iteritems():
         if isinstance(value, list):
@@ -48,41 +93,173 @@ def write_json_file_safe(package_data_json, out_file):
     remove_package_location(package_data_copy)
     out_file.write(json.dumps(package_data_copy))
 
+class JsonStreamWriter(object):
+    """Writes a baseline to file as the data for each package is found.
+
+    Produces the same nested JSON as `write_json_file_safe` without holding
+    the whole tree in memory, and likewise leaves out the 'package_location'
+    attribute and others in `RUN_ONLY_ATTRS`.
+    """
+
+    def __init__(self, out_file):
+        self._out_file = out_file
+        # for each package whose JSON object is still open, whether its
+        # 'submodules' list has been started
+        self._open = []
+
+    def add(self, key, depth, package_json):
+        """Write the data for a package yielded by `iter_package_data`."""
+        self._close(depth)
+        if self._open:
+            self._out_file.write(', ' if self._open[-1] else
+                                 ', "submodules": [')
+            self._open[-1] = True
+
+        package_copy = dict(package_json)
+        for attr in RUN_ONLY_ATTRS:
+            package_copy.pop(attr, None)
+        # leave the object open for submodules
+        self._out_file.write(json.dumps(package_copy)[:-1])
+        self._open.append(False)
+
+    def finish(self):
+        """Close all JSON objects still open."""
+        self._close(0)
+
+    def _close(self, depth):
+        """Close open JSON objects until only `depth` are left open."""
+        while len(self._open) > depth:
+            self._out_file.write(']}' if self._open.pop() else '}')
+
+class TreeBuilder(object):
+    """Assembles the packages yielded by `iter_package_data` into a nested
+    tree, in which the data for each package has a 'submodules' list holding
+    the same data for each of its dependencies, if it has any."""
+
+    def __init__(self):
+        self.package_data_json = None
+        self._path = [] # the data for each package from the top-level down
+
+    def add(self, key, depth, package_json):
+        """Add a package below its parent."""
+        del self._path[depth:]
+        if self._path:
+            self._path[-1].setdefault('submodules', []).append(package_json)
+        else:
+            self.package_data_json = package_json
+        self._path.append(package_json)
+
+    def finish(self):
+        """Nothing left to do."""
+        pass
+
+class DeltaWriter(object):
+    """Writes the changes since a previous baseline to a delta file.
+
+    Only the data for packages that differ from the previous baseline is held
+    in memory until the delta is written, along with the location of every
+    package found so that removed packages can be told apart.
+    """
+
+    def __init__(self, prev_index, out_file):
+        """
+        Args:
+            prev_index (dict): The previous baseline, as returned by
+                `delta.index_packages`.
+            out_file (file): Where to write the delta.
+        """
+        self._prev_index = prev_index
+        self._out_file = out_file
+        self._changed = {}
+        self._seen = set()
+
+    def add(self, key, depth, package_json):
+        """Record a package yielded by `iter_package_data` if it changed."""
+        self._seen.add(key)
+        package_copy = dict(package_json)
+        for attr in RUN_ONLY_ATTRS:
+            package_copy.pop(attr, None)
+        if self._prev_index.get(key) != package_copy:
+            self._changed[key] = package_copy
+
+    def finish(self):
+        """Write the delta."""
+        removed = [key for key in self._prev_index if key not in self._seen]
+        self._out_file.write(json.dumps(
+            delta.make_delta_json(self._changed, removed)))
+
+def read_baseline(in_file, delta_files):
+    """Read a baseline and apply delta files to it, oldest first.
+
+    Returns:
+        dict: The resulting baseline, or `None` if any of the files could not
+            be parsed.
+    """
+    try:
+        # TODO: may want to validate input JSON file against schema
+        prev_data_json = json.load(in_file)
+        if delta_files:
+            prev_data_json = delta.apply_deltas(
+                prev_data_json, [json.load(f) for f in delta_files])
+        return prev_data_json
+    except ValueError:
+        return None
+
+def index_baseline(baseline_json):
+    """Index a parsed baseline as compact records, for comparison.
+
+    Returns:
+        dict: The baseline as returned by `delta.index_packages`, with
+            `model.PackageRecord`s, or `None` if `baseline_json` is not a
+            baseline.
+    """
+    if (not isinstance(baseline_json, dict) or
+            'package_name' not in baseline_json):
+        return None
+    return model.compact_index(delta.index_packages(baseline_json))
+
 def main():
     """Process arguments and do stuff."""
+    # commands are named like options so that they can never be mistaken for
+    # a target directory
+    commands = {'--compact': compact_main, '--query': query_main,
+                '--diff': diff_main}
+    if len(sys.argv) > 1 and sys.argv[1] in commands:
+        commands[sys.argv[1]](sys.argv[2:])
+        return
+
     args = get_args()
 
-    exts_to_hash = []
-    if args.file_hash:
-        exts_to_hash = args.extensions[0].split(',')
+    if args.low_priority:
+        throttle.lower_priority()
+
+    prev_index = None
+    if args.input is not None:
+        prev_index = index_baseline(read_baseline(args.input[0],
+                                                  args.apply_delta))
+
+    num_packages = check_target(args, prev_index)
 
-    package_data_json = get_package_data(args.target_dir, exts_to_hash, args)
-    if package_data_json is None:
+    if num_packages == 0:
         warn("No data discovered about specified npm package.")
         return
 
-    dprint(json.dumps(package_data_json))
-
-    if args.output:
-        write_json_file_safe(package_data_json, args.output[0])
-        if args.verbose:
-            print "Wrote results to output file."
+    if args.output and args.verbose:
+        print "Wrote results to output file."
 
     if args.input is None:
-        if args.verbose:
-            print "No input JSON file specified. Completed work."
-        return
-
-    prev_data_json = None
-    try:
-        # TODO: may want to validate input JSON file against schema
-        prev_data_json = json.load(args.input[0])
-    except ValueError:
+        if not (args.registry or args.npm_cache or args.git_mirror or
+                args.github_verify or args.known_good_store):
+            if args.verbose:
+                print "No input JSON file specified. Completed work."
+            return
+    elif prev_index is None:
         warn("Could not parse input file. Will not compare to current output "
              "for discrepancies.")
         return
 
-    compare_jsons(args.target_dir, prev_data_json, package_data_json, args)
+    if args.delta_output and args.verbose:
+        print "Wrote changes since input file to delta file."
 
     if glob_num_warnings > 0:
         print("ATTENTION: Execution produced %d warning%s." %
@@ -91,6 +268,422 @@ def main():
         print "No changes detected between npm installations."
     return
 
+def check_target(args, prev_index, hash_cache=None, npm_cache_index=None,
+                 pool=None, consumers=None, manifest_store=None,
+                 limiter=None):
+    """Scan the target directory and run the checks specified by the
+    command-line arguments, emitting warnings for discrepancies.
+
+    Args:
+        args (List): List of arguments acquired by `parse_args`.
+        prev_index (dict): The baseline specified by the `--input` argument,
+            as returned by `delta.index_packages`, or `None`.
+        hash_cache (`links.HashCache`): Passed on to `iter_package_data`.
+        npm_cache_index (dict): Passed on to `get_tarball_comparisons`.
+        pool (`ThreadPool`): Passed on to `get_tarball_comparisons`.
+        consumers (list): Objects with `add` and `finish` methods, such as a
+            `TreeBuilder`, to pass each package to in addition to those set up
+            for the command-line arguments.
+        manifest_store (`store.ManifestStore`): The store specified by the
+            `--known-good-store` argument, which is left open. Opened for this
+            call if not specified.
+        limiter (`throttle.Throttle`): Paces the files read, shared with any
+            other checks running at the same time. Set up for this call from
+            the command-line arguments if not specified.
+
+    Returns:
+        int: The number of packages found.
+    """
+    exts_to_hash = []
+    if args.file_hash:
+        exts_to_hash = args.extensions[0].split(',')
+
+    if limiter is None:
+        limiter = get_throttle(args)
+
+    changed_keys, full_scan_time = None, None
+    if args.previous_lockfile and prev_index is not None:
+        changed_keys, full_scan_time = get_lockfile_scope(args, prev_index)
+
+    prior = None
+    if (args.delta_output or changed_keys is not None) and \
+            prev_index is not None:
+        # file hashes are only reused when asked for, as an attacker can
+        # preserve the size and modification time of a file they tamper with
+        prior = delta.PriorState(
+            args.target_dir, prev_index if args.delta_output else None,
+            prev_index, changed_keys)
+
+    # each package is passed to these as soon as it has been processed, so
+    # that the whole tree never needs to be held in memory. memory still grows
+    # with the number of packages, as comparisons to a baseline keep the
+    # location of each package found
+    consumers = list(consumers or []) + get_tarball_comparisons(
+        exts_to_hash, args, npm_cache_index, pool, limiter)
+    if args.output:
+        consumers.append(JsonStreamWriter(args.output[0]))
+    own_store = manifest_store is None and args.known_good_store
+    if args.known_good_store:
+        if own_store:
+            manifest_store = store.ManifestStore(args.known_good_store[0])
+        consumers.append(KnownGoodComparison(manifest_store, exts_to_hash,
+                                             args))
+    if prev_index is not None:
+        consumers.append(BaselineComparison(prev_index, args))
+        if args.delta_output:
+            consumers.append(DeltaWriter(prev_index, args.delta_output[0]))
+
+    num_packages = 0
+    try:
+        for key, depth, json_obj in delta.iter_keyed(iter_package_data(
+                args.target_dir, exts_to_hash, args, prior=prior,
+                hash_cache=hash_cache, limiter=limiter)):
+            if key == '' and full_scan_time is not None:
+                json_obj['full_scan_time'] = full_scan_time
+            dprint(json.dumps(json_obj))
+            num_packages += 1
+            for consumer in consumers:
+                consumer.add(key, depth, json_obj)
+    finally:
+        try:
+            for consumer in consumers:
+                consumer.finish()
+        finally:
+            if own_store:
+                manifest_store.close()
+    return num_packages
+
+class Verifier(object):
+    """Verifies npm installations from other Python code.
+
+    A session holds its configuration, the npm cache index, the hashes of
+    files that have not changed since they were last read, parsed baselines,
+    the known-good store and worker threads across calls, so that each check
+    only pays for what has changed. Results are returned rather than printed.
+    Calls may be made from several threads at once.
+
+    Example:
+        verifier = Verifier(['--verify-against-npm-cache'])
+        try:
+            result = verifier.compare('/srv/app', '/srv/baseline.json')
+            for warning in result['warnings']:
+                ...
+        finally:
+            verifier.close()
+    """
+
+    # options naming files to read or write, which differ between calls
+    PER_CALL_OPTIONS = ['input', 'apply_delta', 'output', 'delta_output',
+                        'previous_lockfile']
+
+    def __init__(self, options=None):
+        """
+        Args:
+            options (List[str]): Command-line options of this script to apply
+                to every call, except those in `PER_CALL_OPTIONS`.
+
+        Raises:
+            ValueError: If the options are not valid.
+        """
+        try:
+            self._args = get_args(list(options or []) + ['--', os.curdir])
+        except (SystemExit, AssertionError) as err:
+            raise ValueError("Invalid options: %s" % str(err))
+        for option in self.PER_CALL_OPTIONS:
+            if getattr(self._args, option):
+                raise ValueError("--%s cannot be used with a Verifier." %
+                                 option.replace('_', '-'))
+        if self._args.low_priority:
+            throttle.lower_priority()
+        # the limits apply to the process as a whole, however many checks it
+        # runs at once
+        self.limiter = get_throttle(self._args)
+
+        self.hash_cache = links.HashCache()
+        self.npm_cache_index = None
+        if self._args.npm_cache:
+            self.npm_cache_index = cacache.build_index(self._args.npm_cache)
+        self.manifest_store = None
+        if self._args.known_good_store:
+            self.manifest_store = store.ManifestStore(
+                self._args.known_good_store[0])
+        # starting and stopping a pool of threads for each call would
+        # dominate the time taken to check a small tree
+        self._pool = ThreadPool(self._args.workers)
+        self._baselines = {} # filename -> ((mtime, size), index)
+        self._lock = threading.Lock()
+
+    def scan(self, target_dir, include_package_data=True):
+        """Scan an installation and run the configured checks.
+
+        Args:
+            target_dir (str): The npm package directory to scan.
+            include_package_data (bool): Whether to return the data for the
+                installation, which is held in memory until returned.
+
+        Returns:
+            dict: See `compare`, along with:
+                * package_data (dict): the data for the installation in the
+                    format written with `--output`, or `None` if nothing was
+                    found. Only present if `include_package_data` is set.
+
+        Raises:
+            ValueError: If `target_dir` cannot be read.
+        """
+        return self._check(target_dir, None, include_package_data)
+
+    def compare(self, target_dir, baseline):
+        """Compare an installation to a baseline and run the configured
+        checks.
+
+        Args:
+            target_dir (str): The npm package directory to check.
+            baseline: The filename of a baseline written with `--output`,
+                which is only parsed again if it changes, or a baseline
+                already read into a `dict`.
+
+        Returns:
+            dict: With attributes:
+                * num_packages (int)
+                * warnings (List[str]): the discrepancies found
+                * num_warnings (int)
+                * elapsed_ms (float)
+
+        Raises:
+            ValueError: If `target_dir` cannot be read or `baseline` cannot
+                be parsed.
+            IOError: If `baseline` cannot be read.
+        """
+        if isinstance(baseline, dict):
+            prev_index = index_baseline(baseline)
+            if prev_index is None:
+                raise ValueError("Not a baseline.")
+        else:
+            prev_index = self.get_baseline(baseline)
+            if prev_index is None:
+                raise ValueError("Could not parse baseline '%s'." % baseline)
+        return self._check(target_dir, prev_index, False)
+
+    def get_baseline(self, filename):
+        """Get a baseline as returned by `delta.index_packages`, parsing it
+        only if it has changed since it was last requested.
+
+        Returns:
+            dict: The indexed baseline, or `None` if it could not be parsed.
+        """
+        stat = os.stat(filename)
+        signature = (stat.st_mtime, stat.st_size)
+        with self._lock:
+            cached = self._baselines.get(filename)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with open(filename, 'r') as in_file:
+            index = index_baseline(read_baseline(in_file, []))
+        with self._lock:
+            self._baselines[filename] = (signature, index)
+        return index
+
+    def close(self):
+        """Stop the worker threads and close the known-good store."""
+        self._pool.close()
+        self._pool.join()
+        if self.manifest_store is not None:
+            self.manifest_store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _check(self, target_dir, prev_index, include_package_data):
+        """Run `check_target` with the session state, collecting warnings."""
+        if not is_readable_dir(target_dir):
+            raise ValueError("'%s' is not a readable directory." % target_dir)
+        args = copy(self._args)
+        args.target_dir = target_dir
+
+        start = time.time()
+        tree = TreeBuilder() if include_package_data else None
+        with collected_warnings() as collected:
+            num_packages = check_target(
+                args, prev_index, hash_cache=self.hash_cache,
+                npm_cache_index=self.npm_cache_index, pool=self._pool,
+                consumers=[tree] if tree is not None else None,
+                manifest_store=self.manifest_store, limiter=self.limiter)
+            if num_packages == 0:
+                warn("No data discovered about specified npm package.")
+
+        result = {'num_packages': num_packages,
+                  'warnings': collected,
+                  'num_warnings': len(collected),
+                  'elapsed_ms': round((time.time() - start) * 1000, 1)}
+        if tree is not None:
+            if tree.package_data_json is not None:
+                remove_package_location(tree.package_data_json)
+            result['package_data'] = tree.package_data_json
+        return result
+
+def get_lockfile_scope(args, prev_index):
+    """Decide which packages to scan, as specified by the `--previous-lockfile`
+    argument.
+
+    Every package is scanned if the last full scan recorded in the baseline
+    is older than the `--full-scan-interval`, or if the previous lockfile
+    cannot be read.
+
+    Args:
+        args (List): List of arguments acquired by `parse_args`.
+        prev_index (dict): The baseline specified by the `--input` argument,
+            as returned by `delta.index_packages`.
+
+    Returns:
+        tuple: (changed_keys, full_scan_time) where `changed_keys` is the
+            `set` of locations whose lockfile entries have changed, or `None`
+            to scan every package, and `full_scan_time` is the time of the
+            last full scan, to be recorded on the top-level package.
+    """
+    now = int(time.time())
+    last_full_scan_time = prev_index.get('', {}).get('full_scan_time')
+    if (not isinstance(last_full_scan_time, int) or
+            now - last_full_scan_time >= args.full_scan_interval * 86400):
+        if args.verbose:
+            print "Last full scan is too old or unknown; scanning everything."
+        return None, now
+
+    try:
+        prev_entries = lockfile.get_lock_entries(
+            json.load(args.previous_lockfile[0]))
+    except (ValueError, AttributeError):
+        warn("Could not parse previous lockfile. Scanning every package.")
+        return None, now
+    changed_keys = lockfile.get_changed_keys(
+        prev_entries, lockfile.read_lockfile(args.target_dir))
+    if args.verbose:
+        print "%d lockfile entries changed; scanning only those." % \
+            len(changed_keys)
+    return changed_keys, last_full_scan_time
+
+def get_throttle(args):
+    """Set up the limits on reading files specified by the command-line
+    arguments.
+
+    Returns:
+        `throttle.Throttle`: The limits, or `None` if reads are not limited.
+    """
+    if not (args.max_read_rate or args.max_file_rate):
+        return None
+    return throttle.Throttle(args.max_read_rate, args.max_file_rate,
+                             args.adapt_to_load)
+
+def compact_main(argv):
+    """Fold delta files into a baseline. Invoked as the `--compact`
+    command."""
+    parser = argparse.ArgumentParser(
+        prog='%s --compact' % os.path.basename(sys.argv[0]),
+        description=('Apply delta files written with --delta-output to a '
+                     'baseline, oldest first, and write the resulting '
+                     'baseline.'))
+    parser.add_argument('baseline', type=argparse.FileType('r'),
+                        metavar='baseline-json',
+                        help='baseline previously written with --output.')
+    parser.add_argument('deltas', type=argparse.FileType('r'), nargs='*',
+                        metavar='delta-json',
+                        help='delta files to apply, oldest first.')
+    parser.add_argument('--output', type=argparse.FileType('w'), nargs=1,
+                        metavar='output-json', required=True,
+                        help='where to write the resulting baseline.')
+    args = parser.parse_args(argv)
+
+    baseline_json = read_baseline(args.baseline, args.deltas)
+    if baseline_json is None:
+        warn("Could not parse baseline or delta files.")
+        return
+    write_json_file_safe(baseline_json, args.output[0])
+
+def query_main(argv):
+    """List the projects that install a package version, according to a
+    known-good store. Invoked as the `--query` command."""
+    parser = argparse.ArgumentParser(
+        prog='%s --query' % os.path.basename(sys.argv[0]),
+        description=('List the projects recorded in a known-good store with '
+                     '--record-known-good that install a package version.'))
+    parser.add_argument('store', type=str, metavar='store-db',
+                        help='known-good store written with '
+                             '--known-good-store.')
+    parser.add_argument('package', type=str, metavar='name@version',
+                        help='the package version to look for.')
+    args = parser.parse_args(argv)
+
+    try:
+        name, version = store.parse_package_spec(args.package)
+    except ValueError as err:
+        parser.error(str(err))
+
+    manifest_store = store.ManifestStore(args.store)
+    try:
+        installs = manifest_store.get_installs(name, version)
+        known_good = manifest_store.get(name, version) is not None
+    finally:
+        manifest_store.close()
+
+    print "%s@%s is %sin the known-good store." % (
+        name, version, '' if known_good else 'not ')
+    for project, location in installs:
+        print "%s\t%s" % (project, location or '.')
+
+def diff_main(argv):
+    """Compare two baselines without scanning an installation. Invoked as the
+    `--diff` command."""
+    parser = argparse.ArgumentParser(
+        prog='%s --diff' % os.path.basename(sys.argv[0]),
+        description=('Compare two baselines written with --output and report '
+                     'the same changes as comparing an installation to a '
+                     'baseline would.'))
+    parser.add_argument('old', type=argparse.FileType('r'),
+                        metavar='old-baseline-json',
+                        help='the earlier baseline.')
+    parser.add_argument('new', type=argparse.FileType('r'),
+                        metavar='new-baseline-json',
+                        help='the later baseline.')
+    parser.add_argument('--trust-merkle-roots', dest='trust_merkle',
+                        action='store_true',
+                        help=('do not compare the files of packages whose '
+                              'recorded Merkle roots match. the roots are not '
+                              'recomputed, so only use this with baselines '
+                              'from a trusted source.'))
+    add_report_arguments(parser)
+    parser.set_defaults(ver_mismatch=True, hash_mismatch=True,
+                        file_missing=True, github_changed=True,
+                        trust_merkle=False, verbose=False)
+    args = parser.parse_args(argv)
+
+    indexes = []
+    for in_file in (args.old, args.new):
+        # only the compact records are kept
+        index = index_baseline(read_baseline(in_file, []))
+        if index is None:
+            warn("Could not parse baseline '%s'." % in_file.name)
+            return
+        indexes.append(index)
+    prev_index, new_index = indexes
+
+    comparison = BaselineComparison(prev_index, args, args.trust_merkle)
+    try:
+        # parents sort before their submodules
+        for key in sorted(new_index):
+            package_json = dict(new_index[key], package_location=key or '.')
+            comparison.add(key, key.count('node_modules/'), package_json)
+    finally:
+        comparison.finish()
+
+    if glob_num_warnings > 0:
+        info("ATTENTION: Execution produced %d warning%s." %
+             (glob_num_warnings, 's' if glob_num_warnings != 1 else ''))
+    else:
+        info("No changes detected between baselines.")
+
 def compare_jsons(package_location, prev_data_json, new_data_json, args):
     """Iterates through the JSON files and emits warnings about changes.
 
@@ -99,6 +692,7 @@ def compare_jsons(package_location, prev_data_json, new_data_json, args):
     * Check commaonlity of package versions
     * Check commonality of filenames and file hashes
     * Check commonality of github project links
+    * Check commonality of links to already visited packages
 
     Args:
         package_location (str): The current package location relative to the
@@ -157,20 +751,21 @@ def compare_jsons(package_location, prev_data_json, new_data_json, args):
             num_warnings += 1
     else:
         if args.hash_mismatch or args.file_missing:
+            new_files = dict((new_file['file_location'], new_file)
+                             for new_file in new_data_json['files'])
             for old_file in prev_data_json['files']:
-                found_old_file = False
-                for new_file in new_data_json['files']:
-                    if old_file['file_location'] == new_file['file_location']:
-                        found_old_file = True
-                        if old_file['file_hash'] != new_file['file_hash']:
-                            if args.hash_mismatch:
-                                warn(("Hash mismatch for '%s' in '%s'. Was: "
-                                      "'%s' Now: '%s'") %
-                                     (old_file['file_location'],
-                                      os.path.basename(package_location),
-                                      old_file['file_hash'],
-                                      new_file['file_hash']))
-                                num_warnings += 1
+                new_file = new_files.get(old_file['file_location'])
+                found_old_file = new_file is not None
+                if found_old_file:
+                    if old_file['file_hash'] != new_file['file_hash']:
+                        if args.hash_mismatch:
+                            warn(("Hash mismatch for '%s' in '%s'. Was: "
+                                  "'%s' Now: '%s'") %
+                                 (old_file['file_location'],
+                                  os.path.basename(package_location),
+                                  old_file['file_hash'],
+                                  new_file['file_hash']))
+                            num_warnings += 1
                 if args.file_missing and not found_old_file:
                     warn("File '%s' no longer present in '%s'" %
                          (old_file['file_location'],
@@ -204,6 +799,19 @@ def compare_jsons(package_location, prev_data_json, new_data_json, args):
                   new_data_json['github_location']))
             num_warnings += 1
 
+    if prev_data_json.get('link_of') != new_data_json.get('link_of'):
+        if 'link_of' not in new_data_json:
+            warn("'%s' is no longer a link to already visited '%s'" %
+                 (package_location, prev_data_json['link_of']))
+        elif 'link_of' not in prev_data_json:
+            warn("'%s' has become a link to already visited '%s'" %
+                 (package_location, new_data_json['link_of']))
+        else:
+            warn("Link target of '%s' has been modified. Was: '%s' Now: '%s'" %
+                 (package_location, prev_data_json['link_of'],
+                  new_data_json['link_of']))
+        num_warnings += 1
+
     if 'submodules' in prev_data_json and 'submodules' not in new_data_json:
         warn("The following submodules have gone missing from '%s': %s" %
              (package_location, str(get_names_of_submodules(prev_data_json))))
@@ -269,11 +877,193 @@ def get_names_of_submodules(package_json):
             names.append(submodule['package_name'])
     return names
 
-def get_args():
-    """Parse command-line arguments."""
+def get_file_changes(prev_files_json, new_files_json):
+    """Compare the files of two versions of a package by name and hash.
+
+    Returns:
+        tuple: (added, changed, missing), each a sorted list of the locations
+            of the files in `new_files_json` but not `prev_files_json`, in
+            both with different hashes, and in `prev_files_json` only.
+    """
+    prev_hashes = dict((file_json['file_location'], file_json['file_hash'])
+                       for file_json in prev_files_json)
+    new_hashes = dict((file_json['file_location'], file_json['file_hash'])
+                      for file_json in new_files_json)
+    return (sorted(set(new_hashes) - set(prev_hashes)),
+            sorted(location for location in new_hashes
+                   if location in prev_hashes and
+                   prev_hashes[location] != new_hashes[location]),
+            sorted(set(prev_hashes) - set(new_hashes)))
+
+class BaselineComparison(object):
+    """Compares installed packages to a previous baseline as they are found.
+
+    Each package is compared with `compare_jsons` to the package at the same
+    location in the previous baseline. Packages that have appeared or gone
+    missing are reported once for the top-most such package, as
+    `compare_jsons` does for nested submodules. The location of every package
+    found is kept until the comparison finishes, to tell which are missing.
+    """
+
+    def __init__(self, prev_index, args, trust_merkle=False):
+        """
+        Args:
+            prev_index (dict): The previous baseline, as returned by
+                `delta.index_packages`.
+            args (List): List of arguments acquired by `parse_args`.
+            trust_merkle (bool): Whether to skip comparing the files of
+                packages whose 'merkle_root' attributes match, rather than
+                checking them file by file. Only sound if the roots of both
+                sides were computed from their files.
+        """
+        self._prev_index = prev_index
+        self._args = args
+        self._trust_merkle = trust_merkle
+        self._locations = {} # key -> package_location of packages found
+
+    def add(self, key, depth, package_json):
+        """Compare a package yielded by `iter_package_data`."""
+        self._locations[key] = package_json['package_location']
+        parent_key = lockfile.get_parent_key(key)
+
+        if key in self._prev_index:
+            prev_package_json = self._prev_index[key]
+            if (self._trust_merkle and
+                    prev_package_json.get('merkle_root') is not None and
+                    prev_package_json.get('merkle_root') ==
+                    package_json.get('merkle_root')):
+                # same files, so only the rest needs comparing
+                prev_package_json = dict(prev_package_json, files=[])
+                package_json = dict(package_json, files=[])
+            compare_jsons(package_json['package_location'],
+                          prev_package_json, package_json, self._args)
+        elif parent_key in self._prev_index:
+            warn("New sub-dependency '%s' has appeared in '%s'" %
+                 (get_package_name_or_location(package_json),
+                  self._locations[parent_key]))
+
+    def finish(self):
+        """Report packages in the previous baseline that were not found."""
+        for key in sorted(self._prev_index):
+            parent_key = lockfile.get_parent_key(key)
+            if key not in self._locations and parent_key in self._locations:
+                warn("Missing sub-dependency '%s' from '%s'" %
+                     (self._prev_index[key]['package_name'],
+                      self._locations[parent_key]))
+
+class KnownGoodComparison(object):
+    """Compares installed packages to a store of known-good manifests as they
+    are found.
+
+    Each dependency is looked up by name and version; the top-level package
+    is the project itself and is not. If its Merkle root matches the
+    known-good manifest nothing more is done, otherwise a warning names the
+    files that were added, changed or are missing. Optionally, packages
+    missing from the store are added to it, and the packages installed by
+    this project are recorded.
+
+    Manifests only vouch for the files they were recorded with, so a package
+    is not compared to a manifest whose 'hashed_extensions' do not include
+    all of those hashed now.
+    """
+
+    def __init__(self, manifest_store, extensions_hashed, args):
+        """
+        Args:
+            manifest_store (`store.ManifestStore`): The known-good store.
+            extensions_hashed (List[str]): A list of filename suffixes that
+                are hashed.
+            args (List): List of arguments acquired by `parse_args`.
+        """
+        self._store = manifest_store
+        self._extensions = sorted(set(extensions_hashed))
+        self._args = args
+        self._project = args.project or os.path.abspath(args.target_dir)
+        if args.record_known_good:
+            self._store.clear_installs(self._project)
+
+    def add(self, key, depth, package_json):
+        """Check a package yielded by `iter_package_data` against the store."""
+        if 'link_of' in package_json:
+            return
+        name = package_json['package_name']
+        version = package_json['package_version']
+        if self._args.record_known_good:
+            self._store.add_install(self._project, key, name, version)
+        if depth == 0:
+            # the top-level package is this project, not a published package
+            return
+
+        manifest = self._store.get(name, version)
+        if manifest is None:
+            if self._args.record_known_good:
+                self._store.add(package_json, self._extensions)
+                if self._args.verbose:
+                    print "Added '%s@%s' to known-good store." % (name,
+                                                                  version)
+            elif self._args.verbose:
+                print "'%s@%s' is not in known-good store." % (name, version)
+            return
+
+        recorded_extensions = manifest.get('hashed_extensions')
+        if recorded_extensions is None or \
+                not set(self._extensions) <= set(recorded_extensions):
+            warn(("Known-good copy of %s@%s was recorded hashing %s, which "
+                  "does not include all of %s. Skipping comparison to "
+                  "known-good copy.") %
+                 (name, version,
+                  ','.join(recorded_extensions or []) or 'unknown files',
+                  ','.join(self._extensions)))
+            return
+        manifest_files = manifest.get('files', [])
+        merkle_root = manifest['merkle_root']
+        if recorded_extensions != self._extensions:
+            # only compare the files that are hashed now
+            manifest_files = [
+                file_json for file_json in manifest_files
+                if any(file_json['file_location'].endswith(ext)
+                       for ext in self._extensions)]
+            merkle_root = hasher.merkle_root(manifest_files)
+
+        if merkle_root == package_json['merkle_root']:
+            if self._args.verbose:
+                print "'%s@%s' matches known-good store." % (name, version)
+            return
+
+        # every difference counts, including files that were added, which
+        # `compare_jsons` does not report
+        changes = get_file_changes(manifest_files,
+                                   package_json.get('files', []))
+        details = '; '.join(
+            "%s: %s" % (change, ', '.join("'%s'" % location
+                                          for location in locations))
+            for change, locations in zip(('added', 'changed', 'missing'),
+                                         changes)
+            if locations)
+        warn(("Files of '%s' do not match known-good copy of %s@%s (%s). "
+              "Merkle root was: '%s' Now: '%s'") %
+             (package_json['package_location'], name, version,
+              details or 'same names and hashes', merkle_root,
+              package_json['merkle_root']))
+
+    def finish(self):
+        """Save changes to the store."""
+        self._store.commit()
+
+def get_args(argv=None):
+    """Parse command-line arguments.
+
+    Args:
+        argv (List[str]): The arguments to parse. Default: `sys.argv[1:]`
+    """
 
     parser = argparse.ArgumentParser(
-        description='Generate and compare digests of npm packages.')
+        description='Generate and compare digests of npm packages.',
+        epilog=('other commands, given in place of the target directory: '
+                '--compact, to fold delta files into a baseline; --diff, to '
+                'compare two baselines; --query, to look up a package in a '
+                'known-good store. use --help after a command for its '
+                'options.'))
     parser.add_argument('target_dir', metavar='target-dir', type=str,
                         help=('the location of the npm package you want to '
                               'check. this should usually be a relative '
@@ -295,6 +1085,41 @@ def get_args():
                               'JSON format. This can be compared against '
                               'future checks using the --input argument.'))
 
+    parser.add_argument('--apply-delta', type=argparse.FileType('r'),
+                        action='append', metavar='delta-json',
+                        dest='apply_delta',
+                        help=('apply a delta file to the input JSON file '
+                              'before using it. may be given several times, '
+                              'oldest delta file first. use the '
+                              '--compact command to fold delta files into a '
+                              'new baseline.'))
+    parser.add_argument('--delta-output', type=argparse.FileType('w'),
+                        nargs=1, metavar='delta-json', dest='delta_output',
+                        help=('write the changes since the input JSON file to '
+                              'a delta file, rather than a whole new baseline '
+                              'with --output. packages whose version, '
+                              'lockfile entry and file sizes and modification '
+                              'times are unchanged since the input JSON file '
+                              'are not hashed again. only use this to update '
+                              'a baseline after an approved change, as file '
+                              'modification times can be forged.'))
+
+    parser.add_argument('--previous-lockfile', type=argparse.FileType('r'),
+                        nargs=1, metavar='lockfile-json',
+                        dest='previous_lockfile',
+                        help=('the lockfile the input JSON file was made '
+                              'from. only packages whose lockfile entries '
+                              'have changed since are scanned; the input JSON '
+                              'file is trusted for the others. for CI runs '
+                              'on commits that rarely change dependencies.'))
+    parser.add_argument('--full-scan-interval', type=int, metavar='days',
+                        dest='full_scan_interval',
+                        help=('with --previous-lockfile, scan every package '
+                              'anyway if the input JSON file does not record '
+                              'a full scan within this many days. the time '
+                              'of the last full scan is carried into the '
+                              'output and delta files. Default: 7'))
+
     parser.add_argument('--include-file-hash', dest='file_hash',
                         action='store_true',
                         help=('include a SHA-256 hash of all code files within '
@@ -310,49 +1135,7 @@ def get_args():
                         dest='extensions', type=str, nargs=1,
                         help=('specify the filename suffixes that will be '
                               'hashed. Default: .js,.json'))
-    parser.add_argument('--report-version-mismatch', dest='ver_mismatch',
-                        action='store_true',
-                        help=('when comparing to a previously generated JSON '
-                              'file, report when npm package versions have '
-                              'changed according to included package.json '
-                              'files. (Default)'))
-    parser.add_argument('--no-report-version-mismatch', dest='ver_mismatch',
-                        action='store_false',
-                        help=('when comparing to a previously generated JSON '
-                              'file, do not report changed npm package '
-                              'versions.'))
-    parser.add_argument('--report-hash-mismatch', dest='hash_mismatch',
-                        action='store_true',
-                        help=('when comparing to a previously generated JSON '
-                              'file, report when a file hash has changed. '
-                              '(Default) NOTE: not compatible with the '
-                              '--exclude-file-hash option.'))
-    parser.add_argument('--no-report-hash-mismatch', dest='hash_mismatch',
-                        action='store_false',
-                        help=('when comparing to a previously generated JSON '
-                              'file, do not report when a file hash has '
-                              'changed.'))
-    parser.add_argument('--report-missing-file', dest='file_missing',
-                        action='store_true',
-                        help=('when comparing to a previously generated JSON '
-                              'file, report when a file is no longer present. '
-                              '(Default)'))
-    parser.add_argument('--no-report-missing-file', dest='file_missing',
-                        action='store_false',
-                        help=('when comparing to a previously generated JSON '
-                              'file, do not report when a file is no longer '
-                              'present.'))
-
-    parser.add_argument('--report-github-changed', dest='github_changed',
-                        action='store_true',
-                        help=('when comparing to a previously generated JSON '
-                              'file, report when the apparent github project '
-                              'location has changed. (Default)'))
-    parser.add_argument('--no-report-github-changed', dest='github_changed',
-                        action='store_false',
-                        help=('when comparing to a previously generated JSON '
-                              'file, do not report when the apparent github '
-                              'project location has changed.'))
+    add_report_arguments(parser)
 
     parser.add_argument('--verify-against-github', dest='github_verify',
                         action='store_true',
@@ -370,6 +1153,79 @@ def get_args():
                               'against  the copy found on GitHub.com. '
                               '(Default)'))
 
+    parser.add_argument('--verify-against-registry', dest='registry', type=str,
+                        nargs=1, metavar='registry',
+                        help=('compare sensitive code files (as defined by '
+                              '--hashed-extensions) in every installed package '
+                              'against the tarball published for the same '
+                              'version. registry is either a local mirror '
+                              'directory holding name-version.tgz files, '
+                              'optionally in a name/-/ sub-directory, or the '
+                              'base URL of an npm registry. tarballs are '
+                              'hashed as they are read and never extracted.'))
+    parser.add_argument('--verify-against-npm-cache', dest='npm_cache',
+                        type=str, nargs='?', const=cacache.DEFAULT_CACHE_DIR,
+                        metavar='cache-dir',
+                        help=('compare sensitive code files (as defined by '
+                              '--hashed-extensions) in every installed package '
+                              'against the tarball for the same version held '
+                              'in the local npm cache, after checking the '
+                              'tarball against its recorded integrity. no '
+                              'network access is needed. Default cache-dir: '
+                              '%s' % cacache.DEFAULT_CACHE_DIR))
+    parser.add_argument('--verify-against-git-mirror', dest='git_mirror',
+                        type=str, nargs=1, metavar='mirror-dir',
+                        help=('compare sensitive code files (as defined by '
+                              '--hashed-extensions) in every installed package '
+                              'against the tagged release of its GitHub '
+                              'project in a directory of bare git mirrors, '
+                              'e.g. mirror-dir/owner/project.git. files are '
+                              'compared by git blob ID, and nothing is '
+                              'downloaded or extracted.'))
+    parser.add_argument('--workers', dest='workers', type=int,
+                        metavar='num-workers',
+                        help=('number of packages to fetch and hash in '
+                              'parallel when verifying against a registry or '
+                              'the npm cache. Default: 4'))
+
+    parser.add_argument('--max-read-rate', dest='max_read_rate', type=int,
+                        metavar='bytes-per-sec',
+                        help=('limit the rate at which installed files and '
+                              'tarballs are read, to reduce the impact of a '
+                              'scan on a busy host.'))
+    parser.add_argument('--max-file-rate', dest='max_file_rate', type=int,
+                        metavar='files-per-sec',
+                        help=('limit the number of installed files and '
+                              'tarballs opened per second.'))
+    parser.add_argument('--adapt-to-load', dest='adapt_to_load',
+                        action='store_true',
+                        help=('slow down reads further while the load '
+                              'average exceeds the number of CPUs. Requires '
+                              '--max-read-rate or --max-file-rate.'))
+    parser.add_argument('--low-priority', dest='low_priority',
+                        action='store_true',
+                        help=('run at the lowest CPU priority, which on Linux '
+                              'also lowers disk I/O priority.'))
+
+    parser.add_argument('--known-good-store', dest='known_good_store',
+                        type=str, nargs=1, metavar='store-db',
+                        help=('compare every installed package to the '
+                              'known-good manifest for the same name and '
+                              'version in this SQLite database, shared between '
+                              'projects. the database is created if it does '
+                              'not exist.'))
+    parser.add_argument('--record-known-good', dest='record_known_good',
+                        action='store_true',
+                        help=('add installed packages that are not yet in the '
+                              'known-good store to it, and record which '
+                              'packages this project installs. only use this '
+                              'on an installation you trust.'))
+    parser.add_argument('--project', dest='project', type=str,
+                        metavar='project-name',
+                        help=('the name under which --record-known-good '
+                              'records this project. Default: the absolute '
+                              'location of target-dir'))
+
     parser.add_argument('--verbose', dest='verbose', action='store_true',
                         help=('enable verbose output about status of execution '
                               '(Disabled by default)'))
@@ -380,13 +1236,24 @@ def get_args():
     parser.set_defaults(file_hash=True, extensions=['.js,.json'],
                         ver_mismatch=True, hash_mismatch=True,
                         file_missing=True, github_changed=True,
-                        github_verify=False, verbose=False)
+                        github_verify=False, registry=None, npm_cache=None,
+                        git_mirror=None,
+                        workers=4, max_read_rate=None, max_file_rate=None,
+                        adapt_to_load=False, low_priority=False,
+                        apply_delta=None, delta_output=None,
+                        previous_lockfile=None, full_scan_interval=7,
+                        known_good_store=None, record_known_good=False,
+                        project=None, verbose=False)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if args.verbose:
         print(("input: %s\n"
+               "apply_delta: %s\n"
                "output: %s\n"
+               "delta_output: %s\n"
+               "previous_lockfile: %s\n"
+               "full_scan_interval: %s\n"
                "file_hash: %s\n"
                "extensions: %s\n"
                "ver_mismatch: %s\n"
@@ -394,17 +1261,89 @@ def get_args():
                "file_missing: %s\n"
                "github_changed: %s\n"
                "github_verify: %s\n"
+               "registry: %s\n"
+               "npm_cache: %s\n"
+               "git_mirror: %s\n"
+               "workers: %s\n"
+               "max_read_rate: %s\n"
+               "max_file_rate: %s\n"
+               "adapt_to_load: %s\n"
+               "low_priority: %s\n"
+               "known_good_store: %s\n"
+               "record_known_good: %s\n"
+               "project: %s\n"
                "verbose: %s") %
-              tuple(str(x) for x in (args.input, args.output, args.file_hash,
-                                     args.extensions[0], args.ver_mismatch,
+              tuple(str(x) for x in (args.input, args.apply_delta,
+                                     args.output, args.delta_output,
+                                     args.previous_lockfile,
+                                     args.full_scan_interval,
+                                     args.file_hash, args.extensions[0],
+                                     args.ver_mismatch,
                                      args.hash_mismatch, args.file_missing,
                                      args.github_changed, args.github_verify,
+                                     args.registry, args.npm_cache,
+                                     args.git_mirror,
+                                     args.workers, args.max_read_rate,
+                                     args.max_file_rate, args.adapt_to_load,
+                                     args.low_priority, args.known_good_store,
+                                     args.record_known_good, args.project,
                                      args.verbose)))
 
     check_args(args)
 
     return args
 
+def add_report_arguments(parser):
+    """Add the arguments that select which changes `compare_jsons` reports.
+
+    Args:
+        parser (`argparse.ArgumentParser`): The parser to add them to. Their
+            defaults are left to the caller.
+    """
+    parser.add_argument('--report-version-mismatch', dest='ver_mismatch',
+                        action='store_true',
+                        help=('when comparing to a previously generated JSON '
+                              'file, report when npm package versions have '
+                              'changed according to included package.json '
+                              'files. (Default)'))
+    parser.add_argument('--no-report-version-mismatch', dest='ver_mismatch',
+                        action='store_false',
+                        help=('when comparing to a previously generated JSON '
+                              'file, do not report changed npm package '
+                              'versions.'))
+    parser.add_argument('--report-hash-mismatch', dest='hash_mismatch',
+                        action='store_true',
+                        help=('when comparing to a previously generated JSON '
+                              'file, report when a file hash has changed. '
+                              '(Default) NOTE: not compatible with the '
+                              '--exclude-file-hash option.'))
+    parser.add_argument('--no-report-hash-mismatch', dest='hash_mismatch',
+                        action='store_false',
+                        help=('when comparing to a previously generated JSON '
+                              'file, do not report when a file hash has '
+                              'changed.'))
+    parser.add_argument('--report-missing-file', dest='file_missing',
+                        action='store_true',
+                        help=('when comparing to a previously generated JSON '
+                              'file, report when a file is no longer present. '
+                              '(Default)'))
+    parser.add_argument('--no-report-missing-file', dest='file_missing',
+                        action='store_false',
+                        help=('when comparing to a previously generated JSON '
+                              'file, do not report when a file is no longer '
+                              'present.'))
+
+    parser.add_argument('--report-github-changed', dest='github_changed',
+                        action='store_true',
+                        help=('when comparing to a previously generated JSON '
+                              'file, report when the apparent github project '
+                              'location has changed. (Default)'))
+    parser.add_argument('--no-report-github-changed', dest='github_changed',
+                        action='store_false',
+                        help=('when comparing to a previously generated JSON '
+                              'file, do not report when the apparent github '
+                              'project location has changed.'))
+
 def check_args(args):
     """Verify that user's command-line args are proeprly formatted."""
     assert os.path.isdir(args.target_dir), ("'%s' is not a directory." %
@@ -418,21 +1357,55 @@ def check_args(args):
         assert ext != '', ("'%s contains an empty file extension" %
                            str(args.extensions[0]))
 
-    if args.github_verify:
-        raise NotImplementedError("Comparison of local copy to files on "
-                                  "GitHub is not yet supported.")
-
-def get_package_data(package_location, extensions_hashed, args,
-                     github_comparison=True):
-    """Process this package along with sub-dirs. Recurse on node_modules.
+    if args.registry and not registry.is_registry_url(args.registry[0]):
+        assert is_readable_dir(args.registry[0]), \
+            "'%s' is neither a registry URL nor a readable directory." % \
+            args.registry[0]
+    if args.npm_cache:
+        assert is_readable_dir(args.npm_cache), \
+            "'%s' is not a readable npm cache directory." % args.npm_cache
+    if args.git_mirror:
+        assert is_readable_dir(args.git_mirror[0]), \
+            "'%s' is not a readable directory." % args.git_mirror[0]
+    assert args.workers > 0, "Number of workers must be at least 1."
+    for rate in (args.max_read_rate, args.max_file_rate):
+        assert rate is None or rate > 0, "Rate limits must be positive."
+    if args.adapt_to_load:
+        assert args.max_read_rate or args.max_file_rate, \
+            "--adapt-to-load requires --max-read-rate or --max-file-rate."
+
+    if args.record_known_good:
+        assert args.known_good_store, \
+            "--record-known-good requires --known-good-store."
+    if args.known_good_store:
+        assert args.file_hash, ("--known-good-store compares file hashes, so "
+                                "it cannot be used with --exclude-file-hash.")
+
+    if args.delta_output or args.apply_delta:
+        assert args.input is not None, \
+            "Delta files can only be used along with an input JSON file."
+    if args.previous_lockfile:
+        assert args.input is not None, \
+            "--previous-lockfile requires an input JSON file."
+    assert args.full_scan_interval > 0, "Full scan interval must be positive."
+
+def iter_package_data(package_location, extensions_hashed, args, prior=None,
+                      hash_cache=None, limiter=None):
+    """Process this package along with sub-dirs, then each of its dependencies.
+
+    Packages are visited depth-first using an explicit stack rather than
+    recursion, so there is no limit on how deeply `node_modules` directories
+    may be nested. The data for each package is yielded as soon as its own
+    files have been processed, and before any of its dependencies, so that
+    callers need not hold the whole tree in memory.
 
     Args:
         package_location (str): A directory containing an npm package, as
             indicated by the presense of a `package.json` file. If a
             `package.json` file cannot be found, a warning will be emitted.
-            If the directory contains a `node_modules` directory, this will
-            recurse on any subdirectories of that `node_modules` directory
-            with the expectation that they are npm packages. The full
+            If the directory contains a `node_modules` directory, any
+            subdirectories of that `node_modules` directory will be visited
+            next with the expectation that they are npm packages. The full
             `package_location` should be relative to the current working
             directory, with the right-most directory being the package
             being targeted by this invocation of the function, e.g.:
@@ -441,14 +1414,20 @@ def get_package_data(package_location, extensions_hashed, args,
         extensions_hashed (List[str]): A list of filename suffixes that should
             be SHA-256 hashed. If this list is empty, no files will be hashed.
         args (List): List of arguments acquired by `parse_args`.
-        github_comparison (bool): Flag determines whether this function will
-            attempt to download a copy of the current package from GitHub
-            for verification. The caller should set this to `False` in order
-            to avoid cycles.
-
-    Returns:
-        dict: Data about this package, including:
-            * package_location (str) -- the `package_location` argument. Used
+        prior (`delta.PriorState`): The lockfile of the top-level directory
+            and, when updating a baseline incrementally, the previous baseline
+            whose file hashes are reused for packages that appear unchanged.
+            Created for `package_location` if not specified.
+        hash_cache (`links.HashCache`): File hashes kept between traversals
+            by a long-lived process, see `links.InodeTracker`. Not used if not
+            specified.
+        limiter (`throttle.Throttle`): Paces the files hashed, if specified.
+
+    Yields:
+        tuple: (depth, json_obj) where `depth` is 0 for the top-level package,
+            1 for its direct dependencies and so on, and `json_obj` is a
+            `dict` of data about the package, including:
+            * package_location (str) -- the location of the package. Used
                 for navigating directory structures when parsed in the future.
             * package_name (str)
             * package_version (str)
@@ -457,26 +1436,172 @@ def get_package_data(package_location, extensions_hashed, args,
                 * file_location (str): file path and filename
                 * file_hash (str): hash of file contents, unless disabled by
                     command line argument
-            * submodules (List[dict]): a list of the `dict`s returned by
-                recurisve calls to this function for npm (sub-)dependencies.
+            * merkle_root (str): digest of `files`, see `hasher.merkle_root`.
+            * stat_signature (str): digest of the sizes and modification times
+                of `files`, see `hasher.stat_signature`.
+            * lock_integrity (str): the integrity of the package according to
+                the lockfile of the top-level directory, if it has one.
+            * git_blob_ids (dict): the git blob ID of each file by its
+                'file_location', only present if comparing to git mirrors and
+                the files were read. Like 'package_location', it is not
+                written to baselines.
+            * install_location (str): only present if the package is not
+                installed in a directory named after it, e.g. an npm alias.
+                Its location relative to the top-level directory, as used in
+                lockfiles; see `delta`.
+            * link_of (str): only present if this package directory is the same
+                physical directory as one already visited, e.g. a symlink into
+                a pnpm store. The location where it was first visited,
+                relative to the top-level directory. Files are then omitted,
+                and the dependencies of the package are not visited again.
+
+            Packages for which no information is available are skipped along
+            with their dependencies.
+    """
+    dprint("Entered iter_package_data()")
+
+    tracker = links.InodeTracker(package_location, hash_cache, limiter,
+                                 git_blob_ids=bool(args.git_mirror))
+    if prior is None:
+        prior = delta.PriorState(package_location)
+
+    stack = [(package_location, 0)]
+    while stack:
+        location, depth = stack.pop()
+        json_obj = get_single_package_data(location, extensions_hashed, args,
+                                           tracker, prior)
+        if json_obj is None:
+            continue
+        install_location = delta.get_install_location(
+            tracker.relative(location).replace(os.sep, '/'),
+            json_obj['package_name'])
+        if install_location is not None:
+            json_obj['install_location'] = install_location
+        yield depth, json_obj
+
+        if 'link_of' not in json_obj:
+            dependencies = get_dependency_locations(location, args,
+                                                    tracker.root)
+            stack.extend((module_location, depth + 1)
+                         for module_location in reversed(dependencies))
+
+def get_dependency_locations(package_location, args, root=None):
+    """Get the possible npm packages in the `node_modules` directory.
+
+    Scoped packages, e.g. 'node_modules/@babel/core', are included. If
+    `package_location` is a symlink, as into a pnpm store, the packages
+    installed alongside its target are included too, e.g.
+    'node_modules/.pnpm/foo@1.0.0/node_modules/bar' for the symlink
+    'node_modules/foo', unless one of the same name is in its own
+    `node_modules` directory.
 
-            OR `None`, if there is no information available for the package.
+    Args:
+        root (str): The top-level directory of the traversal, which the
+            locations of packages found alongside a symlink's target are
+            expressed in when they are below it. Those packages are not
+            included if not specified.
+
+    Returns:
+        List[str]: The sub-directories that may hold npm packages, sorted so
+            that which of several links to a directory is visited first does
+            not depend on the file system.
+    """
+    node_modules_location = os.path.join(package_location, 'node_modules')
+    module_locations = list_node_modules(node_modules_location,
+                                         package_location, args)
+    if root is None or not os.path.islink(package_location):
+        return module_locations
+
+    store_location = get_store_node_modules(package_location, root)
+    if store_location is None:
+        return module_locations
+    names = set(os.path.relpath(location, node_modules_location)
+                for location in module_locations)
+    real_location = os.path.realpath(package_location)
+    module_locations.extend(
+        location
+        for location in list_node_modules(store_location, package_location,
+                                          args)
+        if os.path.relpath(location, store_location) not in names and
+        os.path.realpath(location) != real_location)
+    return module_locations
+
+def get_store_node_modules(package_location, root):
+    """Get the `node_modules` directory that holds the target of the symlink
+    `package_location`, or `None` if it is not in one.
+
+    The location is relative to `root` as the traversal sees it if the
+    target is below `root`, otherwise it is the absolute location.
     """
-    dprint("Entered get_package_data()")
+    parent = os.path.dirname(os.path.realpath(package_location))
+    if os.path.basename(parent).startswith('@'):
+        parent = os.path.dirname(parent)
+    if os.path.basename(parent) != 'node_modules':
+        return None
+    rel = os.path.relpath(parent, os.path.realpath(root))
+    if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        return parent
+    return os.path.join(root, rel)
+
+def list_node_modules(node_modules_location, package_location, args):
+    """Get the sub-directories of a `node_modules` directory that may hold
+    npm packages, as for `get_dependency_locations`."""
+    if not is_readable_dir(node_modules_location):
+        return []
+    if args.verbose:
+        print "Found 'node_modules' directory in %s." % package_location
+
+    module_locations = []
+    for node_module in sorted(os.listdir(node_modules_location)):
+        module_location = os.path.join(node_modules_location, node_module)
+
+        # TODO: It may be possible to hide malicious code in a dot-directory
+        # TODO: Investigate whether hidden files/directories are shown
+        if not is_readable_non_dot_dir(module_location):
+            continue
+        if (node_module.startswith('@') and
+                not os.path.exists(os.path.join(module_location,
+                                                'package.json'))):
+            module_locations.extend(
+                os.path.join(module_location, scoped_module)
+                for scoped_module in sorted(os.listdir(module_location))
+                if is_readable_non_dot_dir(os.path.join(module_location,
+                                                        scoped_module)))
+            continue
+
+        if args.verbose:
+            print("Found possible sub-dependency '%s' in '%s'" %
+                  (node_module, package_location))
+        module_locations.append(module_location)
+    return module_locations
+
+def get_single_package_data(package_location, extensions_hashed, args,
+                            tracker, prior):
+    """Gather data for a package directory, without its dependencies.
+
+    Args:
+        tracker (`links.InodeTracker`): Records the physical files and
+            directories visited so far.
+
+        See `iter_package_data` for a description of other arguments.
 
+    Returns:
+        dict: The data for this package as yielded by `iter_package_data`, or
+            `None` if there is no information available for the package.
+    """
     if not is_readable_dir(package_location):
         warn("Could not read directory '%s'. Skipping." % package_location)
         return None
 
-    files = os.listdir(package_location)
-    if 'package.json' not in files:
-        warn(("Could not find expected package.json in directory '%s'. "
-              "Skipping." % package_location))
-        return None
+    link_of = tracker.first_visit(package_location)
+    if link_of is not None:
+        # pnpm symlinks packages, including circular dependencies, into many
+        # places; record the link instead of visiting the directory again
+        return get_link_data(package_location, link_of, args)
 
-    package_json_obj = None
-    with open(os.path.join(package_location, 'package.json'), 'r') as p_json_f:
-        package_json_obj = json.load(p_json_f)
+    package_json_obj = read_package_json(package_location)
+    if package_json_obj is None:
+        return None
 
     package_name = npm.get_package_name(package_json_obj)
     if package_name is None:
@@ -495,79 +1620,169 @@ def get_package_data(package_location, extensions_hashed, args,
         # TODO: implement guessing with HTTP calls to github search
         github_location = ''
 
+    package_key = tracker.relative(package_location).replace(os.sep, '/')
+    lock_integrity = prior.lock_integrity(package_key)
 
-    files_json = get_file_data(package_location, "", files, extensions_hashed,
-                               args)
-
-    node_modules = []
-    if 'node_modules' in files:
+    record = prior.trusted_record(package_key, package_version, lock_integrity)
+    if record is not None:
         if args.verbose:
-            print "Found 'node_modules' directory in %s." % package_location
-        node_modules_files = os.listdir(
-            os.path.join(package_location, 'node_modules'))
-        for node_module in node_modules_files:
-            module_location = os.path.join(package_location, 'node_modules',
-                                           node_module)
-
-            # TODO: It may be possible to hide malicious code in a dot-directory
-            # TODO: Investigate whether hidden files/directories are shown
-            if is_readable_non_dot_dir(module_location):
-                if args.verbose:
-                    print("Found possible sub-dependency '%s' in '%s'" %
-                          (node_module, package_location))
-
-                dependency = get_package_data(
-                    module_location, extensions_hashed, args)
-                if dependency is not None:
-                    node_modules.append(dependency)
+            print "Trusting baseline for '%s', unchanged in lockfile" % \
+                package_key
+        json_obj = dict(record, package_location=package_location,
+                        package_name=package_name,
+                        github_location=github_location)
+        if 'files' in json_obj:
+            json_obj['files'] = list(json_obj['files'])
+        return json_obj
+
+    package_files = list(iter_package_files(
+        package_location, extensions_hashed, args,
+        links.Ancestry(package_location)))
+    stat_signature = hasher.stat_signature(package_files)
+
+    files_json = prior.reusable_files(package_key, package_version,
+                                      lock_integrity, stat_signature)
+    blob_ids = None
+    if files_json is None:
+        blob_ids = {} if tracker.git_blob_ids else None
+        files_json = get_file_data(package_files, args, tracker, blob_ids)
+    elif args.verbose:
+        print "Reusing previous file hashes for unchanged '%s'" % package_key
 
     json_obj = {'package_location': package_location,
                 'package_name': package_name,
                 'package_version': package_version,
                 'github_location': github_location}
     json_obj['files'] = files_json
-    if len(node_modules) > 0:
-        json_obj['submodules'] = node_modules
+    json_obj['merkle_root'] = hasher.merkle_root(files_json)
+    json_obj['stat_signature'] = stat_signature
+    if lock_integrity is not None:
+        json_obj['lock_integrity'] = lock_integrity
+    if blob_ids is not None:
+        json_obj['git_blob_ids'] = blob_ids
 
-    # every time we fetch data about a given module, we will compare it to the
-    # version on GitHub if it's available and warnings emitted if it doesn't
-    # match.
+    return json_obj
 
-    if not args.github_verify and args.verbose:
-        print(("Comparison to GitHub copy disabled; skipping comparison for "
-               "'%s'") % package_name)
+def get_link_data(package_location, link_of, args):
+    """Describe a package directory that was already visited elsewhere.
 
-    if (github_location is not None and github_location != '' and
-            github_comparison and args.github_verify):
-        compare_package_to_github(json_obj, github_location, package_version,
-                                  extensions_hashed, args)
+    Args:
+        package_location (str): The location of the linked package directory.
+        link_of (str): The location at which the same physical directory was
+            first visited, relative to the top-level directory. This may be a
+            parent of `package_location`.
+        args (List): List of arguments acquired by `parse_args`.
 
-    return json_obj
+    Returns:
+        dict: The name and version of the package along with the `link_of`
+            attribute; see `iter_package_data`. `None` if the package.json
+            file cannot be parsed.
+    """
+    if args.verbose:
+        print("'%s' is a link to already visited package '%s'" %
+              (package_location, link_of))
+
+    package_json_obj = read_package_json(package_location)
+    if package_json_obj is None:
+        return None
+    package_name = npm.get_package_name(package_json_obj)
+    package_version = npm.get_package_version(package_json_obj)
+    if package_name is None or package_version is None:
+        warn("Malformed package.json file for '%s'. Skipping." %
+             package_location)
+        return None
+
+    return {'package_location': package_location,
+            'package_name': package_name,
+            'package_version': package_version,
+            'github_location': '',
+            'files': [],
+            'link_of': link_of}
+
+def read_package_json(package_location):
+    """Load the package.json file in `package_location`, or warn and return
+    `None` if there isn't one."""
+    package_json_filename = os.path.join(package_location, 'package.json')
+    if not os.path.isfile(package_json_filename):
+        warn(("Could not find expected package.json in directory '%s'. "
+              "Skipping." % package_location))
+        return None
+
+    with open(package_json_filename, 'r') as p_json_f:
+        return json.load(p_json_f)
+
+def iter_package_files(package_location, extensions_hashed, args, ancestry):
+    """Finds files to be hashed in a package, except under /node_modules.
 
-def get_file_data(location_cwd, location_in_package, files, extensions_hashed,
-                  args):
-    """Gets data about files and sub-directories, except for /node_modules.
+    Sub-directories are walked using an explicit stack rather than recursion.
 
     Args:
-        location_cwd (str): The location of the files relative to the current
-            working directory.
-        location_in_package (str): The location of the files relative to the
-            current package. If this is the top-level directory of the package,
-            `location_in_package` is empty (""). If the files are in a
-            sub-directory after a recursive call to this function, they will be
-            relative to the package root dir.
-        files (List[str]): A list of files the directory being iterated; either
-            in the top-level directory of a package, or one of its
-            sub-directories.
+        package_location (str): The location of the package relative to the
+            current working directory.
         extensions_hashed (List[str]): A list of filename suffixes that should
-            be SHA-256 hashed. If this list is empty, no files will be hashed.
+            be SHA-256 hashed. If this list is empty, no files will be found.
+        args (List): List of arguments acquired by `parse_args`.
+        ancestry (`links.Ancestry`): The package directory, used to detect
+            symlinked sub-directories that would cause a loop.
+
+    Yields:
+        tuple: (file_in_package, file_cwd) for each file, its location
+            relative to the package and relative to the current working
+            directory. Files in a directory are yielded before those in its
+            sub-directories.
+    """
+    stack = [(package_location, "", ancestry)]
+    while stack:
+        location_cwd, location_in_package, dir_ancestry = stack.pop()
+        subdirs = []
+        for filename in sorted(os.listdir(location_cwd)):
+            path_cwd = os.path.join(location_cwd, filename)
+            if os.path.isdir(path_cwd):
+                if not is_readable_dir(path_cwd):
+                    warn("Could not read directory '%s' Skipping it for "
+                         "checks." % path_cwd)
+                elif (is_readable_non_dot_dir(path_cwd) and
+                      filename != 'node_modules'):
+                    subdir_in_package = os.path.join(location_in_package,
+                                                     filename)
+                    if args.verbose:
+                        print("Found package sub-directory '%s'" %
+                              subdir_in_package)
+                    if dir_ancestry.find(path_cwd) is not None:
+                        warn(("Directory '%s' links back to one of its "
+                              "parents. Skipping it for checks.") % path_cwd)
+                        continue
+                    subdirs.append((path_cwd, subdir_in_package,
+                                    links.Ancestry(path_cwd, dir_ancestry)))
+            else:
+                for ext in extensions_hashed:
+                    if filename.endswith(ext):
+                        yield (os.path.join(location_in_package, filename),
+                               path_cwd)
+                        break
+        stack.extend(reversed(subdirs))
+
+def get_file_data(package_files, args, tracker, blob_ids=None):
+    """Gets data about the files of a package.
+
+    Args:
+        package_files (List[tuple]): The (file_in_package, file_cwd) pairs
+            yielded by `iter_package_files`.
         args (List): List of arguments acquired by `parse_args`.
+        tracker (`links.InodeTracker`): Records the physical files hashed so
+            far, so that each physical file is hashed only once.
+        blob_ids (dict): Filled with the git blob ID of each file, by its
+            location relative to the package, if specified and the tracker
+            gets blob IDs.
     Returns:
         List[dict]: A list of hashed files, each expressed as a `dict`. Each
-            `dict` contains two attributes:
+            `dict` contains these attributes:
             * 'file_location' (str): Location of the file relative to the
                 package it belongs to.
             * 'file_hash' (str): hash of the file
+            * 'link_of' (str): only present if the same physical file was
+                already hashed at another location, e.g. because it is
+                hardlinked. That location, relative to the top-level directory.
 
             If there are no files that are hashed, an empty list is returned.
     """
@@ -575,38 +1790,17 @@ def get_file_data(location_cwd, location_in_package, files, extensions_hashed,
     dprint("Entered get_file_data()")
 
     files_json = []
-    for filename in files:
-        path_cwd = os.path.join(location_cwd, filename)
-        if os.path.isdir(path_cwd):
-            if is_readable_dir(path_cwd):
-                if (is_readable_non_dot_dir(path_cwd) and
-                        filename != 'node_modules'):
-                    subdir_in_package = os.path.join(location_in_package,
-                                                     filename)
-                    if args.verbose:
-                        print("Found package sub-directory '%s'" %
-                              subdir_in_package)
-                    subdir_files = os.listdir(path_cwd)
-
-                    #this will produce a depth-first list of files
-                    files_json = files_json + get_file_data(
-                        path_cwd, subdir_in_package, subdir_files,
-                        extensions_hashed, args)
-            else:
-                warn("Could not read directory '%s' Skipping it for checks." %
-                     path_cwd)
-        else:
-            for ext in extensions_hashed:
-                if filename.endswith(ext):
-                    file_in_package = os.path.join(location_in_package,
-                                                   filename)
-                    file_cwd = os.path.join(location_cwd, filename)
-                    file_hash = hasher.hash_file(file_cwd)
-                    file_json = {'file_location': file_in_package,
-                                 'file_hash': file_hash}
-                    files_json.append(file_json)
-                    if args.verbose:
-                        print "hash(%s) = %s" % (filename, file_hash)
+    for file_in_package, file_cwd in package_files:
+        file_hash, link_of, blob_id = tracker.hash_file(file_cwd)
+        if blob_ids is not None and blob_id is not None:
+            blob_ids[file_in_package] = blob_id
+        file_json = {'file_location': file_in_package,
+                     'file_hash': file_hash}
+        if link_of is not None:
+            file_json['link_of'] = link_of
+        files_json.append(file_json)
+        if args.verbose:
+            print "hash(%s) = %s" % (file_in_package, file_hash)
 
     return files_json
 
@@ -619,20 +1813,15 @@ def is_readable_dir(dir_location):
     """Returns whether string argument is a readable directory."""
     return os.path.isdir(dir_location) and os.access(dir_location, os.R_OK)
 
-def compare_package_to_github(local_data_json, github_location, package_version,
-                              extensions_hashed, args):
-    """Downloads the npm package from GitHub and warns about discrepancies.
+def compare_package_to_github(local_data_json, github_data_json, args):
+    """Warns about discrepancies between an installed package and the copy
+    downloaded from GitHub.
 
     Args:
         local_data_json (dict): The JSON generated by the current invocation of
-            this script for the target directory. This should be at the
-            JSON level of the npm package being targeted by this function call.
-            The JSON contains previous hashes to compare the GitHub download to.
-        github_location (str): The URL for the project on GitHub, as returned
-            by `npm.get_github_location`.
-        package_version (str): The version of the package being targeted.
-        extensions_hashed (List[str]): A list of filename suffixes that should
-            be SHA-256 hashed. If this list is empty, no files will be hashed.
+            this script for the installed package. Submodules are ignored.
+        github_data_json (dict): The data returned by `get_github_data` for
+            the tagged release, or a `dict` with an 'error' attribute.
         args (List): List of arguments acquired by `parse_args`.
     """
     dprint("Entered compare_package_to_github()")
@@ -641,76 +1830,543 @@ def compare_package_to_github(local_data_json, github_location, package_version,
     #installed copy and GitHub copy. For example, in package.json file,
     #_args, _from, etc.
 
-    assert isinstance(github_location, str)
-    assert isinstance(package_version, str)
+    if 'error' in github_data_json:
+        warn(github_data_json['error'])
+        return
 
-    urls = http.get_possible_zip_urls(github_location, package_version)
-    zip_filename = None
-    for url in urls:
+    local_package_json = dict(local_data_json)
+    local_package_json.pop('submodules', None)
+    num_warnings = compare_jsons(local_data_json['package_location'],
+                                 local_package_json, github_data_json, args)
+
+    if num_warnings == 0:
         if args.verbose:
-            print "Trying to download zip file from '%s'..." % url
+            print("No discrepancies found compared to GitHub copy of %s." %
+                  get_package_name_or_location(local_data_json))
+    else:
+        info(("Encountered %d discrepancies comparing %s to copy downloaded "
+               "from GitHub.") %
+              (num_warnings, get_package_name_or_location(local_data_json)))
 
+def get_tarball_comparisons(extensions_hashed, args, npm_cache_index=None,
+                            pool=None, limiter=None):
+    """Set up comparisons of installed packages to their published tarballs.
+
+    Registry and npm cache comparisons are made if specified by the
+    command-line arguments. The npm cache index is read once, after which each
+    installed package is looked up by name and version.
+
+    Args:
+        extensions_hashed (List[str]): A list of filename suffixes that should
+            be SHA-256 hashed. If this list is empty, no files will be hashed.
+        args (List): List of arguments acquired by `parse_args`.
+        npm_cache_index (dict): The index of the npm cache specified by the
+            `--verify-against-npm-cache` argument, as returned by
+            `cacache.build_index`. Read from the cache if not specified.
+        pool (`ThreadPool`): Worker threads shared with other comparisons, see
+            `TarballComparison`.
+        limiter (`throttle.Throttle`): Paces the tarballs read, if specified.
+
+    Returns:
+        List[`TarballComparison`]
+    """
+    comparisons = []
+
+    if args.registry:
+        mirror = args.registry[0]
+
+        def fetch_from_registry(local_data_json):
+            """Get data about the published tarball for a package."""
+            return get_registry_data(mirror, local_data_json,
+                                     extensions_hashed, args, limiter)
+
+        comparisons.append(TarballComparison(fetch_from_registry, args, pool))
+
+    if args.npm_cache:
+        cache_dir = args.npm_cache
+        index = npm_cache_index
+        if index is None:
+            index = cacache.build_index(cache_dir)
+        if args.verbose:
+            print "Found %d package tarballs in npm cache '%s'." % (len(index),
+                                                                    cache_dir)
+
+        def fetch_from_npm_cache(local_data_json):
+            """Get data about the cached tarball for a package."""
+            return get_npm_cache_data(cache_dir, index, local_data_json,
+                                      extensions_hashed, args, limiter)
+
+        comparisons.append(TarballComparison(fetch_from_npm_cache, args,
+                                             pool))
+
+    if args.git_mirror:
+        comparisons.append(GitMirrorComparison(
+            gitmirror.GitMirror(args.git_mirror[0]), extensions_hashed, args,
+            pool, limiter))
+
+    if args.github_verify:
+        comparisons.append(GithubComparison(extensions_hashed, args, pool))
+
+    return comparisons
+
+class TarballComparison(object):
+    """Compares installed packages to their published tarballs as they are
+    found.
+
+    Tarballs are fetched and hashed by a pool of worker threads, as many as
+    specified by the `--workers` argument, while the traversal continues.
+    Comparisons are made in traversal order. At most twice as many packages as
+    there are workers are waiting to be compared at any time.
+
+    The top-level package is the project being checked rather than a published
+    package, so it is not compared unless `compares_root` is set.
+    """
+
+    compares_root = False
+
+    def __init__(self, fetch, args, pool=None):
+        """
+        Args:
+            fetch (function): Called from worker threads with the data for
+                each installed package. Returns data about its tarball as
+                described for the `tarball_data_json` argument of
+                `compare_package_to_tarball`.
+            args (List): List of arguments acquired by `parse_args`.
+            pool (`ThreadPool`): Worker threads to use, which are left running
+                when the comparison finishes. A pool of its own is started
+                if not specified.
+        """
+        self._fetch = fetch
+        self._args = args
+        self._own_pool = pool is None
+        self._pool = ThreadPool(args.workers) if pool is None else pool
+        self._pending = deque()
+        self._max_pending = 2 * args.workers
+
+    def add(self, key, depth, package_json):
+        """Start fetching the tarball for a package yielded by
+        `iter_package_data`."""
+        if 'link_of' in package_json or (depth == 0 and
+                                         not self.compares_root):
+            return
+        self._pending.append(
+            (package_json, self._pool.apply_async(self._fetch,
+                                                  (package_json,))))
+        while len(self._pending) > self._max_pending:
+            self._compare_next()
+
+    def finish(self):
+        """Compare the remaining packages and stop the worker threads."""
+        try:
+            while self._pending:
+                self._compare_next()
+        finally:
+            if self._own_pool:
+                self._pool.close()
+                self._pool.join()
+
+    def _compare_next(self):
+        """Wait for the oldest pending tarball and compare it."""
+        local_data_json, result = self._pending.popleft()
+        self._compare(local_data_json, result.get())
+
+    def _compare(self, local_data_json, fetched_data_json):
+        """Compare a package to the data fetched for it."""
+        compare_package_to_tarball(local_data_json, fetched_data_json,
+                                   self._args)
+
+class GitMirrorComparison(TarballComparison):
+    """Compares installed packages to the tagged releases of their GitHub
+    projects in local git mirrors, as they are found.
+
+    Each mirrored repository is opened once and shared by all of the packages
+    and versions that come from it.
+    """
+
+    compares_root = True
+
+    def __init__(self, mirror, extensions_hashed, args, pool=None,
+                 limiter=None):
+        """
+        Args:
+            mirror (`gitmirror.GitMirror`): The mirrors to compare to.
+            extensions_hashed (List[str]): A list of filename suffixes that
+                should be compared.
+            args (List): List of arguments acquired by `parse_args`.
+            pool (`ThreadPool`): See `TarballComparison`.
+            limiter (`throttle.Throttle`): Paces the installed files read
+                again, if specified; see `get_git_mirror_data`.
+        """
+        def fetch_from_git_mirror(local_data_json):
+            """Get the blob IDs of a package, installed and mirrored."""
+            return get_git_mirror_data(mirror, local_data_json,
+                                       extensions_hashed, args, limiter)
+
+        super(GitMirrorComparison, self).__init__(fetch_from_git_mirror, args,
+                                                  pool)
+        self._mirror = mirror
+
+    def finish(self):
+        """Compare the remaining packages and close the mirrors."""
         try:
-            zip_filename = http.fetch_url(url, fetch_tmp_file=True)
+            super(GitMirrorComparison, self).finish()
+        finally:
+            self._mirror.close()
+
+    def _compare(self, local_data_json, fetched_data_json):
+        """Compare the blob IDs of a package to those of its tagged
+        release."""
+        if 'error' in fetched_data_json:
+            warn(fetched_data_json['error'])
+            return
+        num_warnings = compare_jsons(local_data_json['package_location'],
+                                     fetched_data_json['local'],
+                                     fetched_data_json['mirror'], self._args)
+        if num_warnings == 0:
+            if self._args.verbose:
+                print("No discrepancies found compared to git mirror of %s." %
+                      get_package_name_or_location(local_data_json))
+        else:
+            info(("Encountered %d discrepancies comparing %s to git mirror "
+                   "at '%s'.") %
+                  (num_warnings, get_package_name_or_location(local_data_json),
+                   fetched_data_json['mirror']['package_location']))
+
+class GithubComparison(TarballComparison):
+    """Compares installed packages to the tagged releases of their GitHub
+    projects, downloading them as they are found.
+
+    Downloading and hashing a release takes far longer than hashing the
+    installed copy, so the downloads run on the worker threads while the
+    traversal continues, as tarballs are fetched for `TarballComparison`.
+    Packages without a known GitHub project are skipped.
+    """
+
+    compares_root = True
+
+    def __init__(self, extensions_hashed, args, pool=None):
+        """
+        Args:
+            extensions_hashed (List[str]): A list of filename suffixes that
+                should be compared.
+            args (List): List of arguments acquired by `parse_args`.
+            pool (`ThreadPool`): See `TarballComparison`.
+        """
+        def fetch_from_github(local_data_json):
+            """Get data about the tagged release of a package."""
+            return get_github_data(local_data_json, extensions_hashed, args)
+
+        super(GithubComparison, self).__init__(fetch_from_github, args, pool)
+
+    def add(self, key, depth, package_json):
+        """Start downloading the release of a package yielded by
+        `iter_package_data`, if its GitHub project is known."""
+        if not package_json.get('github_location'):
+            if self._args.verbose:
+                print("No GitHub project is known for '%s'; skipping "
+                      "comparison to GitHub copy." %
+                      get_package_name_or_location(package_json))
+            return
+        super(GithubComparison, self).add(key, depth, package_json)
+
+    def _compare(self, local_data_json, fetched_data_json):
+        """Compare a package to its release downloaded from GitHub."""
+        compare_package_to_github(local_data_json, fetched_data_json,
+                                  self._args)
+
+def get_github_data(local_data_json, extensions_hashed, args):
+    """Download and hash the tagged release of an installed package from
+    GitHub.
+
+    Runs in a worker thread, so problems are reported back to the caller
+    rather than emitted as warnings. The downloaded zip file is hashed without
+    being extracted, and removed afterwards.
+
+    Args:
+        local_data_json (dict): The data for the installed package.
+        extensions_hashed (List[str]): A list of filename suffixes that should
+            be SHA-256 hashed. If this list is empty, no files will be hashed.
+        args (List): List of arguments acquired by `parse_args`.
+
+    Returns:
+        dict: Data about the release as returned by `registry.get_zip_data`,
+            or a `dict` with only an 'error' attribute describing why it
+            could not be retrieved.
+    """
+    package_name = get_package_name_or_location(local_data_json)
+    package_version = str(local_data_json['package_version'])
+    github_location = str(local_data_json['github_location'])
+    if not http.looks_like_version(package_version):
+        return {'error': ("Version '%s' of '%s' does not look like a tagged "
+                          "release. Skipping comparison to GitHub project.") %
+                         (package_version, package_name)}
+
+    zip_location = None
+    zip_filename = None
+    try:
+        for url in http.get_possible_zip_urls(github_location,
+                                              package_version):
+            if args.verbose:
+                print "Trying to download zip file from '%s'..." % url
+            try:
+                zip_filename = http.fetch_url(url, fetch_tmp_file=True)
+            except HTTPError as err:
+                if err.code == 404:
+                    continue #try next url
+                raise
+            zip_location = url
             if args.verbose:
                 print "Successfully downloaded data from '%s'." % url
             break #found a good url
-        except HTTPError, err:
-            if hasattr(err, 'code') and err.code == 404:
-                continue #try next url
-            else:
-                raise
+    except (HTTPError, URLError, IOError, ValueError) as err:
+        return {'error': ("Could not download '%s' for '%s' from GitHub: %s")
+                         % (github_location, package_name, str(err))}
 
     if zip_filename is None:
-        warn(("Could not resolve GitHub link for '%s'; maybe this project does "
-              "not have a tagged release for version '%s'? Skipping comparison "
-              "to GitHub project.") %
-              (get_package_name_or_location(local_data_json), package_version))
-        return
+        return {'error': ("Could not resolve GitHub link for '%s'; maybe this "
+                          "project does not have a tagged release for version "
+                          "'%s'? Skipping comparison to GitHub project.") %
+                         (package_name, package_version)}
 
-    tmp_dir = tempfile.mkdtemp()
-    with zipfile.ZipFile(zip_filename, 'r') as downloaded_zip:
-        downloaded_zip.extractall(tmp_dir)
-
-    # if the extraction worked correctly, there should be a single
-    # sub-directory in the temp directory
-    extracted_files = os.listdir(tmp_dir)
-    if len(extracted_files) != 1:
-        warn(("Failed to extract zip file for '%s'; expected 1 sub-directory "
-              "but found these: '%s'") %
-             (get_package_name_or_location(local_data_json),
-              str(extracted_files)))
-        cleanup(zip_filename, tmp_dir)
-        return
+    try:
+        return registry.get_zip_data(zip_filename, zip_location,
+                                     extensions_hashed)
+    except (IOError, zipfile.BadZipfile) as err:
+        return {'error': ("Could not read zip file downloaded from '%s' for "
+                          "'%s': %s") % (zip_location, package_name, str(err))}
+    finally:
+        try:
+            os.remove(zip_filename)
+        except OSError:
+            pass
 
-    package_location = os.path.join(tmp_dir, extracted_files[0])
-    github_package_json = get_package_data(
-        package_location, extensions_hashed, args, github_comparison=False)
-    num_warnings = compare_jsons(package_location, local_data_json,
-                                 github_package_json, args)
+def get_registry_data(mirror, local_data_json, extensions_hashed, args,
+                      limiter=None):
+    """Fetch and hash the tarball of an installed package from a registry.
 
+    Runs in a worker thread, so problems are reported back to the caller
+    rather than emitted as warnings.
 
-    if num_warnings == 0:
-        if args.verbose:
-            print("No discrepancies found compared to GitHub copy of %s." %
-                  get_package_name_or_location(local_data_json))
-    else:
-        print(("Encountered %d discrepancies comparing %s to copy downloaded "
-               "from GitHub.") %
-              (num_warnings, get_package_name_or_location(local_data_json)))
+    Args:
+        limiter (`throttle.Throttle`): Paces reading the tarball, if
+            specified.
+
+    Returns:
+        dict: Data about the published package as returned by
+            `registry.get_tarball_data`, or a `dict` with only an 'error'
+            attribute describing why it could not be retrieved.
+    """
+    package_name = local_data_json['package_name']
+    package_version = local_data_json['package_version']
+    if args.verbose:
+        print "Looking up '%s@%s' in registry..." % (package_name,
+                                                     package_version)
+    try:
+        opened = registry.open_tarball(mirror, package_name, package_version)
+        if opened is None:
+            return {'error': ("Could not find '%s@%s' in registry '%s'. "
+                              "Skipping comparison to registry copy.") %
+                             (package_name, package_version, mirror)}
+        tarball_location, tarball_file = opened
+        if limiter is not None:
+            limiter.open_file()
+            tarball_file = throttle.ThrottledReader(tarball_file, limiter)
+        try:
+            return registry.get_tarball_data(tarball_file, tarball_location,
+                                             extensions_hashed)
+        finally:
+            tarball_file.close()
+    except (HTTPError, URLError, IOError, tarfile.TarError) as err:
+        return {'error': ("Could not read tarball for '%s@%s' from registry "
+                          "'%s': %s") %
+                         (package_name, package_version, mirror, str(err))}
+
+def get_npm_cache_data(cache_dir, index, local_data_json, extensions_hashed,
+                       args, limiter=None):
+    """Check and hash the tarball of an installed package from the npm cache.
+
+    Runs in a worker thread, so problems are reported back to the caller
+    rather than emitted as warnings. The integrity of the cached tarball is
+    verified in the same pass in which its members are hashed.
 
-    cleanup(zip_filename, tmp_dir)
+    Args:
+        cache_dir (str): The location of the npm cache.
+        index (dict): The cache index returned by `cacache.build_index`.
+        limiter (`throttle.Throttle`): Paces reading the tarball, if
+            specified.
 
-def cleanup(zip_filename, tmp_dir):
-    """Remove temporay files."""
+    Returns:
+        dict: Data about the cached package as returned by
+            `registry.get_tarball_data`, or a `dict` with only an 'error'
+            attribute describing why it could not be used.
+    """
+    package_key = '%s@%s' % (local_data_json['package_name'],
+                             local_data_json['package_version'])
+    if package_key not in index:
+        return {'error': ("Could not find '%s' in npm cache '%s'. Skipping "
+                          "comparison to cached copy.") %
+                         (package_key, cache_dir)}
+
+    digest_info = cacache.get_strongest_digest(index[package_key])
+    if digest_info is None:
+        return {'error': ("Unsupported integrity '%s' for '%s' in npm cache. "
+                          "Skipping comparison to cached copy.") %
+                         (index[package_key], package_key)}
+    algorithm, digest = digest_info
+
+    tarball_location = cacache.get_content_path(cache_dir, algorithm, digest)
+    if args.verbose:
+        print "Reading '%s' from npm cache..." % package_key
     try:
-        os.remove(zip_filename)
-    except OSError:
-        pass
+        tarball_file = open(tarball_location, 'rb')
+        if limiter is not None:
+            limiter.open_file()
+            tarball_file = throttle.ThrottledReader(tarball_file, limiter)
+        reader = cacache.IntegrityReader(tarball_file, algorithm)
+        try:
+            tarball_data_json = registry.get_tarball_data(
+                reader, tarball_location, extensions_hashed)
+            integrity_ok = reader.digest() == digest
+        finally:
+            reader.close()
+    except (IOError, tarfile.TarError) as err:
+        return {'error': ("Could not read tarball for '%s' from npm cache: %s")
+                         % (package_key, str(err))}
+
+    if not integrity_ok:
+        return {'error': ("Cached tarball '%s' for '%s' does not match its "
+                          "integrity '%s'. The npm cache may have been "
+                          "tampered with.") %
+                         (tarball_location, package_key, index[package_key])}
+    return tarball_data_json
+
+def get_git_mirror_data(mirror, local_data_json, extensions_hashed, args,
+                        limiter=None):
+    """Get the git blob IDs of an installed package and of the tagged release
+    of its GitHub project in a local mirror.
+
+    Runs in a worker thread, so problems are reported back to the caller
+    rather than emitted as warnings. Files are located in the repository as
+    they are in the package, so packages published from a sub-directory of
+    their project will show differences.
+
+    The blob IDs of installed files are normally got by the traversal in the
+    same pass as their hashes. Files whose hashes were reused from a baseline
+    instead are read here.
+
+    Args:
+        mirror (`gitmirror.GitMirror`): The mirrors to look in.
+        local_data_json (dict): The data for the installed package.
+        extensions_hashed (List[str]): A list of filename suffixes that should
+            be compared.
+        args (List): List of arguments acquired by `parse_args`.
+        limiter (`throttle.Throttle`): Paces the files read, if specified.
+
+    Returns:
+        dict: With attributes 'local' and 'mirror', each holding package data
+            in the format of `get_single_package_data` without submodules,
+            whose 'files' have git blob IDs as their 'file_hash'. A `dict`
+            with only an 'error' attribute if the package could not be
+            compared.
+    """
+    package_name = get_package_name_or_location(local_data_json)
+    package_version = local_data_json['package_version']
+    github_location = local_data_json.get('github_location')
+    if package_version is None:
+        return {'error': ("No version is known for '%s'. Skipping comparison "
+                          "to git mirror.") % package_name}
+    if not github_location:
+        return {'error': ("No GitHub project is known for '%s'. Skipping "
+                          "comparison to git mirror.") % package_name}
+    repository = mirror.get_repository(github_location)
+    if repository is None:
+        return {'error': ("Could not find a mirror of '%s' for '%s' in '%s'. "
+                          "Skipping comparison to git mirror.") %
+                         (github_location, package_name, mirror.mirror_dir)}
+
+    if args.verbose:
+        print "Looking up '%s@%s' in git mirror '%s'..." % (
+            package_name, package_version, repository.git_dir)
     try:
-        rmtree(tmp_dir)
-    except OSError:
-        pass
+        found = repository.get_version_files(package_version)
+    except gitmirror.GitError as err:
+        return {'error': ("Could not read git mirror for '%s': %s") %
+                         (package_name, str(err))}
+    if found is None:
+        return {'error': ("Could not find a tag for version '%s' of '%s' in "
+                          "'%s'. Skipping comparison to git mirror.") %
+                         (package_version, package_name, repository.git_dir)}
+    tag, mirror_files = found
+
+    mirror_files_json = []
+    for file_location, blob_id in sorted(mirror_files.iteritems()):
+        dirs = file_location.split('/')[:-1]
+        if any(d.startswith('.') or d == 'node_modules' for d in dirs):
+            continue # not scanned in installed packages either
+        if any(file_location.endswith(ext) for ext in extensions_hashed):
+            mirror_files_json.append({'file_location': file_location,
+                                      'file_hash': blob_id})
+
+    blob_ids = local_data_json.get('git_blob_ids', {})
+    local_files_json = []
+    try:
+        for file_json in local_data_json.get('files', []):
+            blob_id = blob_ids.get(file_json['file_location'])
+            if blob_id is None:
+                filename = os.path.join(local_data_json['package_location'],
+                                        file_json['file_location'])
+                with links.open_file(filename, limiter) as in_file:
+                    blob_id = hasher.sha256_and_git_blob_id(
+                        in_file, os.path.getsize(filename))[1]
+            local_files_json.append(
+                {'file_location': file_json['file_location'].replace(
+                    os.sep, '/'),
+                 'file_hash': blob_id})
+    except (IOError, OSError) as err:
+        return {'error': "Could not read '%s': %s" % (package_name, str(err))}
+
+    def package_json_with_files(package_location, files_json):
+        """Copy the identity of the installed package."""
+        return {'package_location': package_location,
+                'package_name': local_data_json['package_name'],
+                'package_version': package_version,
+                'github_location': github_location,
+                'files': files_json}
+
+    return {'local': package_json_with_files(
+                local_data_json['package_location'], local_files_json),
+            'mirror': package_json_with_files(
+                '%s@%s' % (repository.git_dir, tag), mirror_files_json)}
+
+def compare_package_to_tarball(local_data_json, tarball_data_json, args):
+    """Warns about discrepancies between an installed package and its tarball.
+
+    Args:
+        local_data_json (dict): The JSON generated by the current invocation of
+            this script for the installed package. Submodules are ignored.
+        tarball_data_json (dict): The data returned by
+            `registry.get_tarball_data` for the published tarball, or a `dict`
+            with an 'error' attribute.
+        args (List): List of arguments acquired by `parse_args`.
+    """
+    if 'error' in tarball_data_json:
+        warn(tarball_data_json['error'])
+        return
+
+    local_package_json = dict(local_data_json)
+    local_package_json.pop('submodules', None)
+    num_warnings = compare_jsons(local_data_json['package_location'],
+                                 local_package_json, tarball_data_json, args)
+
+    if num_warnings == 0:
+        if args.verbose:
+            print("No discrepancies found compared to published copy of %s." %
+                  get_package_name_or_location(local_data_json))
+    else:
+        info(("Encountered %d discrepancies comparing %s to copy published "
+               "at '%s'.") %
+              (num_warnings, get_package_name_or_location(local_data_json),
+               tarball_data_json['package_location']))
 
 def dprint(msg):
     """Debug print statements."""
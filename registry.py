@@ -0,0 +1,202 @@
+"""Inspects published npm package tarballs from a registry or local mirror,
+and source archives downloaded from GitHub.
+
+Archive members are hashed in memory, so archives are never extracted to
+disk. Tarballs are read as a stream.
+"""
+
+import os
+import json
+import tarfile
+import zipfile
+from urllib2 import HTTPError
+
+import hasher # hasher.py
+import http   # http.py
+import npm    # npm.py
+
+def is_registry_url(mirror):
+    """Returns whether the mirror location is an HTTP(S) registry URL."""
+    return mirror.startswith('http://') or mirror.startswith('https://')
+
+def get_tarball_filename(package_name, version):
+    """Get the filename npm publishes a package version under, below
+    '<name>/-/' in the registry.
+
+    Scoped packages drop their scope, e.g. '@babel/core' version '7.0.0' is
+    published as '@babel/core/-/core-7.0.0.tgz'.
+    """
+    return "%s-%s.tgz" % (package_name.split('/')[-1], version)
+
+def get_packed_filename(package_name, version):
+    """Get the filename `npm pack` gives the tarball of a package version.
+
+    Scoped packages keep their scope, e.g. '@babel/core' version '7.0.0' is
+    packed as 'babel-core-7.0.0.tgz', which cannot be mistaken for the
+    unscoped package 'core'.
+    """
+    return "%s-%s.tgz" % (package_name.lstrip('@').replace('/', '-'), version)
+
+def get_possible_tarball_locations(mirror, package_name, version):
+    """Get the locations where the tarball for a package version may be.
+
+    A mirror directory may either hold all tarballs side-by-side, named as by
+    `npm pack`, or mimic the registry layout of '<name>/-/<filename>'.
+    Registry URLs always use the latter.
+
+    Args:
+        mirror (str): A local directory or the base URL of a registry.
+        package_name (str): The name of the npm package.
+        version (str): The version of the npm package.
+
+    Returns:
+        List[str]: Filenames or URLs, most likely first.
+    """
+    tarball = get_tarball_filename(package_name, version)
+    if is_registry_url(mirror):
+        return ["%s/%s/-/%s" % (mirror.rstrip('/'), package_name, tarball)]
+    return [os.path.join(mirror, get_packed_filename(package_name, version)),
+            os.path.join(mirror, package_name, '-', tarball)]
+
+def open_tarball(mirror, package_name, version):
+    """Open the tarball for a package version for reading.
+
+    Returns:
+        tuple: (location, file-like object) for the first tarball found, or
+            `None` if the mirror does not have this package version.
+    """
+    for location in get_possible_tarball_locations(mirror, package_name,
+                                                   version):
+        if is_registry_url(mirror):
+            try:
+                return location, http.fetch_url(location, fetch_stream=True)
+            except HTTPError, err:
+                if hasattr(err, 'code') and err.code == 404:
+                    continue
+                raise
+        elif os.path.isfile(location):
+            return location, open(location, 'rb')
+    return None
+
+def get_tarball_data(tarball_file, tarball_location, extensions_hashed):
+    """Stream a package tarball and describe its contents.
+
+    Args:
+        tarball_file (file): A readable gzipped tar archive, as published to
+            the npm registry.
+        tarball_location (str): Where `tarball_file` was read from.
+        extensions_hashed (List[str]): A list of filename suffixes that should
+            be SHA-256 hashed. If this list is empty, no files will be hashed.
+
+    Returns:
+        dict: Data about the published package, in the same format yielded
+            by `iter_package_data`, with only the package location, name,
+            version, GitHub location and files. The name, version and GitHub
+            location are taken from the package.json file in the tarball, if
+            there is one.
+    """
+    files_json = []
+    package_json_obj = {}
+
+    # npm packs everything under a single top-level directory, usually
+    # 'package/', which is replaced by the install location
+    with tarfile.open(fileobj=tarball_file, mode='r|gz') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            parts = member.name.split('/', 1)
+            if len(parts) != 2:
+                continue
+            file_in_package = parts[1]
+
+            if file_in_package == 'package.json':
+                contents = tar.extractfile(member).read()
+                try:
+                    package_json_obj = json.loads(contents)
+                except ValueError:
+                    package_json_obj = {}
+                if any(file_in_package.endswith(ext)
+                       for ext in extensions_hashed):
+                    files_json.append(
+                        {'file_location': file_in_package,
+                         'file_hash': hasher.sha256_string(contents)})
+                continue
+
+            for ext in extensions_hashed:
+                if file_in_package.endswith(ext):
+                    file_hash = hasher.sha256_stream(tar.extractfile(member))
+                    files_json.append({'file_location': file_in_package,
+                                       'file_hash': file_hash})
+                    break
+
+    return get_archive_data(tarball_location, package_json_obj, files_json)
+
+def get_zip_data(zip_filename, zip_location, extensions_hashed):
+    """Describe the contents of a source archive downloaded from GitHub.
+
+    Files under `node_modules` or dot directories are left out, as they are
+    when scanning an installed package.
+
+    Args:
+        zip_filename (str): The downloaded zip file.
+        zip_location (str): Where `zip_filename` was downloaded from.
+        extensions_hashed (List[str]): A list of filename suffixes that should
+            be SHA-256 hashed. If this list is empty, no files will be hashed.
+
+    Returns:
+        dict: See `get_tarball_data`.
+
+    Raises:
+        zipfile.BadZipfile: If `zip_filename` is not a zip file.
+    """
+    files_json = []
+    package_json_obj = {}
+
+    # GitHub archives everything under a single top-level directory named
+    # after the project and tag
+    with zipfile.ZipFile(zip_filename, 'r') as archive:
+        for member in archive.infolist():
+            parts = member.filename.split('/', 1)
+            if len(parts) != 2 or parts[1] == '' or parts[1].endswith('/'):
+                continue
+            file_in_package = parts[1]
+            dirs = file_in_package.split('/')[:-1]
+            if any(d.startswith('.') or d == 'node_modules' for d in dirs):
+                continue
+
+            if file_in_package == 'package.json':
+                contents = archive.read(member)
+                try:
+                    package_json_obj = json.loads(contents)
+                except ValueError:
+                    package_json_obj = {}
+                if any(file_in_package.endswith(ext)
+                       for ext in extensions_hashed):
+                    files_json.append(
+                        {'file_location': file_in_package,
+                         'file_hash': hasher.sha256_string(contents)})
+                continue
+
+            for ext in extensions_hashed:
+                if file_in_package.endswith(ext):
+                    member_file = archive.open(member)
+                    try:
+                        file_hash = hasher.sha256_stream(member_file)
+                    finally:
+                        member_file.close()
+                    files_json.append({'file_location': file_in_package,
+                                       'file_hash': file_hash})
+                    break
+
+    return get_archive_data(zip_location, package_json_obj, files_json)
+
+def get_archive_data(archive_location, package_json_obj, files_json):
+    """Assemble the data about an archived package from its package.json file
+    and hashed files."""
+    if not isinstance(package_json_obj, dict):
+        package_json_obj = {}
+    return {'package_location': archive_location,
+            'package_name': npm.get_package_name(package_json_obj),
+            'package_version': npm.get_package_version(package_json_obj),
+            'github_location': npm.get_github_location(package_json_obj) or '',
+            'files': files_json}
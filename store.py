@@ -0,0 +1,140 @@
+"""Shared store of known-good package manifests.
+
+Manifests are keyed by package name and version, so a package that has been
+verified once need not be verified again in every project that installs it.
+The store also records which projects install which packages.
+"""
+
+import json
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifests (
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    merkle_root TEXT NOT NULL,
+    manifest TEXT NOT NULL,
+    PRIMARY KEY (name, version)
+);
+CREATE TABLE IF NOT EXISTS installs (
+    project TEXT NOT NULL,
+    location TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    PRIMARY KEY (project, location)
+);
+CREATE INDEX IF NOT EXISTS installs_by_package ON installs (name, version);
+"""
+
+# attributes of a package kept in its manifest, along with the
+# 'hashed_extensions' it was recorded with
+MANIFEST_ATTRS = ['package_name', 'package_version', 'github_location',
+                  'files', 'merkle_root']
+
+# how long to wait for another process writing to the same store, in seconds
+LOCK_TIMEOUT = 30
+
+class ManifestStore(object):
+    """A SQLite database of known-good package manifests.
+
+    Safe to use from several threads at once, which share a single connection
+    in turn. Changes are saved by `commit` or `close`.
+    """
+
+    def __init__(self, filename):
+        self._conn = sqlite3.connect(filename, timeout=LOCK_TIMEOUT,
+                                     check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    def get(self, name, version):
+        """Get the known-good manifest of a package version.
+
+        Returns:
+            dict: The package data recorded by `add`, or `None` if this
+                package version is not in the store.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT manifest FROM manifests "
+                "WHERE name = ? AND version = ?", (name, version)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def add(self, package_json, hashed_extensions):
+        """Record the data for a package as its known-good manifest.
+
+        An existing manifest for the same package version is never replaced.
+
+        Args:
+            package_json (dict): Data about the package as yielded by
+                `iter_package_data`, including its 'merkle_root'.
+            hashed_extensions (List[str]): The filename suffixes of the files
+                that were hashed, recorded as the manifest's
+                'hashed_extensions'. Only files with these suffixes can be
+                compared to the manifest.
+
+        Returns:
+            bool: Whether the manifest was added.
+        """
+        manifest = dict((attr, package_json[attr]) for attr in MANIFEST_ATTRS
+                        if attr in package_json)
+        manifest['hashed_extensions'] = sorted(set(hashed_extensions))
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO manifests VALUES (?, ?, ?, ?)",
+                (package_json['package_name'], package_json['package_version'],
+                 package_json['merkle_root'], json.dumps(manifest)))
+            return cursor.rowcount == 1
+
+    def clear_installs(self, project):
+        """Forget which packages a project installs."""
+        with self._lock:
+            self._conn.execute("DELETE FROM installs WHERE project = ?",
+                               (project,))
+
+    def add_install(self, project, location, name, version):
+        """Record that a project installs a package version at `location`."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO installs VALUES (?, ?, ?, ?)",
+                (project, location, name, version))
+
+    def get_installs(self, name, version):
+        """Get the projects that install a package version.
+
+        Returns:
+            List[tuple]: (project, location) for each install, sorted.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT project, location FROM installs "
+                "WHERE name = ? AND version = ? ORDER BY project, location",
+                (name, version)).fetchall()
+
+    def commit(self):
+        """Save changes, so that other processes using the store see them."""
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        """Commit changes and close the database."""
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+def parse_package_spec(spec):
+    """Split 'name@version' into (name, version).
+
+    Scoped names start with '@', e.g. '@babel/core@7.0.0'.
+
+    Raises:
+        ValueError: If `spec` does not contain a version.
+    """
+    name, sep, version = spec.rpartition('@')
+    if not sep or not name or not version:
+        raise ValueError("'%s' is not of the form name@version." % spec)
+    return name, version
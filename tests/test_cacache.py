@@ -0,0 +1,162 @@
+"""Tests for cacache.py"""
+
+import os
+import io
+import json
+import base64
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import unittest
+from argparse import Namespace
+
+import cacache # cacache.py
+import hasher  # hasher.py
+import npm_dependency_check # npm_dependency_check.py
+
+TARBALL_URL = 'https://registry.npmjs.org/%s/-/%s-%s.tgz'
+
+class TestIndex(unittest.TestCase):
+    """Reading the index of the npm cache."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_build_index(self):
+        """Entries are keyed by name@version, later lines superseding earlier
+        ones, and deleted or partially written entries are skipped."""
+        write_bucket(self.cache_dir, 'a', [
+            make_entry(tarball_key('bigi', '1.4.1'), 'sha512-old'),
+            make_entry(tarball_key('bigi', '1.4.1'), 'sha512-new'),
+            make_entry(tarball_key('gone', '1.0.0'), 'sha512-x'),
+            make_entry(tarball_key('gone', '1.0.0'), None),
+            make_entry('make-fetch-happen:request-cache:'
+                       'https://registry.npmjs.org/bigi', 'sha512-meta'),
+            make_entry(tarball_key('torn', '1.0.0'), 'sha512-y')[:-5]])
+        write_bucket(self.cache_dir, 'b', [
+            make_entry(TARBALL_URL.replace('/%s/-/', '/@%s/-/') %
+                       ('babel/core', 'core', '7.0.0'), 'sha1-z')])
+        self.assertEqual(cacache.build_index(self.cache_dir),
+                         {'bigi@1.4.1': 'sha512-new',
+                          '@babel/core@7.0.0': 'sha1-z'})
+
+    def test_parse_tarball_key(self):
+        """Names and versions are found below a registry path prefix."""
+        self.assertEqual(
+            cacache.parse_tarball_key(
+                'make-fetch-happen:request-cache:https://example.com/npm/'
+                '%40s%2fb/-/b-1.0.0-rc.1.tgz'),
+            ('@s/b', '1.0.0-rc.1'))
+        self.assertIsNone(cacache.parse_tarball_key('no-url'))
+
+    def test_strongest_digest(self):
+        """The strongest supported algorithm listed is used."""
+        sha1 = base64.b64encode(hashlib.sha1('x').digest())
+        sha512 = base64.b64encode(hashlib.sha512('x').digest())
+        self.assertEqual(
+            cacache.get_strongest_digest('sha1-%s md5-abc sha512-%s?opt' %
+                                         (sha1, sha512)),
+            ('sha512', hashlib.sha512('x').digest()))
+        self.assertIsNone(cacache.get_strongest_digest('md5-abc'))
+
+class TestCachedTarball(unittest.TestCase):
+    """Checking cached tarballs against their integrity."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.tarball = make_tarball({
+            'package.json': '{"name": "bigi", "version": "1.4.1"}',
+            'lib/bigi.js': 'module.exports = 1;'})
+        self.integrity = 'sha512-' + base64.b64encode(
+            hashlib.sha512(self.tarball).digest())
+        self.content_path = cacache.get_content_path(
+            self.cache_dir, 'sha512', hashlib.sha512(self.tarball).digest())
+        os.makedirs(os.path.dirname(self.content_path))
+        write_bucket(self.cache_dir, 'a', [
+            make_entry(tarball_key('bigi', '1.4.1'), self.integrity)])
+        self.local_data_json = {'package_name': 'bigi',
+                                'package_version': '1.4.1'}
+        self.args = Namespace(verbose=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def get_npm_cache_data(self):
+        """Look up the installed package in the cache."""
+        return npm_dependency_check.get_npm_cache_data(
+            self.cache_dir, cacache.build_index(self.cache_dir),
+            self.local_data_json, ['.js', '.json'], self.args)
+
+    def test_intact(self):
+        """An intact tarball is hashed."""
+        write_file(self.content_path, self.tarball)
+        tarball_data_json = self.get_npm_cache_data()
+        self.assertNotIn('error', tarball_data_json)
+        self.assertEqual(tarball_data_json['package_name'], 'bigi')
+        self.assertEqual(
+            sorted(tarball_data_json['files']),
+            sorted([{'file_location': 'lib/bigi.js',
+                     'file_hash': hasher.sha256_string('module.exports = 1;')},
+                    {'file_location': 'package.json',
+                     'file_hash': hasher.sha256_string(
+                         '{"name": "bigi", "version": "1.4.1"}')}]))
+
+    def test_integrity_mismatch(self):
+        """A tarball that does not match its integrity is reported, even if
+        it is a valid tarball."""
+        write_file(self.content_path, make_tarball({
+            'package.json': '{"name": "bigi", "version": "1.4.1"}',
+            'lib/bigi.js': 'require("evil");'}))
+        tarball_data_json = self.get_npm_cache_data()
+        self.assertEqual(tarball_data_json.keys(), ['error'])
+        self.assertIn('does not match its integrity',
+                      tarball_data_json['error'])
+
+    def test_missing(self):
+        """A package that is not in the cache is reported."""
+        self.local_data_json['package_version'] = '2.0.0'
+        tarball_data_json = self.get_npm_cache_data()
+        self.assertIn('Could not find', tarball_data_json['error'])
+
+def tarball_key(name, version):
+    """Get the cache key npm uses for a tarball."""
+    return ('make-fetch-happen:request-cache:' +
+            TARBALL_URL % (name, name, version))
+
+def make_entry(key, integrity):
+    """Make a line of an index bucket file."""
+    entry_str = json.dumps({'key': key, 'integrity': integrity})
+    return '%s\t%s' % (hashlib.sha1(entry_str).hexdigest(), entry_str)
+
+def write_bucket(cache_dir, name, lines):
+    """Write an index bucket file."""
+    bucket_dir = os.path.join(cache_dir, cacache.INDEX_DIR, name[:2])
+    if not os.path.isdir(bucket_dir):
+        os.makedirs(bucket_dir)
+    write_file(os.path.join(bucket_dir, name), '\n'.join(lines) + '\n')
+
+def make_tarball(files):
+    """Pack files under 'package/' as npm does.
+
+    Args:
+        files (dict): Maps the location of each file to its contents.
+    """
+    out_file = io.BytesIO()
+    with tarfile.open(fileobj=out_file, mode='w:gz') as tar:
+        for location, contents in sorted(files.iteritems()):
+            info = tarfile.TarInfo('package/' + location)
+            info.size = len(contents)
+            tar.addfile(info, io.BytesIO(contents))
+    return out_file.getvalue()
+
+def write_file(filename, contents):
+    """Create a file with the specified contents."""
+    with open(filename, 'wb') as out_file:
+        out_file.write(contents)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+"""Tests for daemon.py"""
+
+import os
+import json
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+import daemon # daemon.py
+import npm_dependency_check # npm_dependency_check.py
+
+class TestVerify(unittest.TestCase):
+    """Serving single requests."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.target_dir = os.path.join(self.tmp_dir, 'app')
+        os.mkdir(self.target_dir)
+        write_file(os.path.join(self.target_dir, 'package.json'),
+                   '{"name": "app", "version": "1.0.0"}')
+        self.verifier = npm_dependency_check.Verifier()
+
+    def tearDown(self):
+        self.verifier.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_scan(self):
+        """Without a baseline, the installation is scanned."""
+        response_json = daemon.verify(self.verifier,
+                                      {'target_dir': self.target_dir})
+        self.assertEqual(response_json['num_packages'], 1)
+        self.assertEqual(response_json['warnings'], [])
+        self.assertNotIn('package_data', response_json)
+
+    def test_compare(self):
+        """With a baseline, the installation is compared to it."""
+        baseline = os.path.join(self.tmp_dir, 'baseline.json')
+        with open(baseline, 'w') as out_file:
+            json.dump(self.verifier.scan(self.target_dir)['package_data'],
+                      out_file)
+        write_file(os.path.join(self.target_dir, 'package.json'),
+                   '{"name": "app", "version": "1.0.0", "x": 1}')
+        response_json = daemon.verify(self.verifier,
+                                      {'target_dir': self.target_dir,
+                                       'baseline': baseline})
+        self.assertEqual(response_json['num_warnings'], 1)
+        self.assertIn('Hash mismatch', response_json['warnings'][0])
+
+    def test_relative_locations(self):
+        """Locations relative to the daemon's directory are refused."""
+        for request_json in [{'target_dir': 'app'},
+                             {'target_dir': self.target_dir,
+                              'baseline': 'baseline.json'}]:
+            self.assertEqual(daemon.verify(self.verifier, request_json),
+                             {'error': "Request locations must be absolute."})
+
+    def test_missing_target(self):
+        """A request must name a directory."""
+        for request_json in [{}, {'target_dir': None}, {'target_dir': 1}]:
+            self.assertIn('target_dir',
+                          daemon.verify(self.verifier, request_json)['error'])
+
+    def test_errors(self):
+        """Directories and baselines that cannot be used are reported."""
+        self.assertIn('error', daemon.verify(
+            self.verifier, {'target_dir': os.path.join(self.tmp_dir, 'no')}))
+        self.assertIn('error', daemon.verify(
+            self.verifier, {'target_dir': self.target_dir,
+                            'baseline': os.path.join(self.tmp_dir, 'no')}))
+
+class TestServer(unittest.TestCase):
+    """Serving requests over a socket."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmp_dir, 'check.sock')
+        self.verifier = npm_dependency_check.Verifier()
+        self.server = daemon.VerifierServer(self.socket_path, self.verifier)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.verifier.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_requests(self):
+        """Each line is answered in turn, invalid ones with an error."""
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            client.connect(self.socket_path)
+            client.sendall('not json\n[1]\n{"target_dir": "%s"}\n' %
+                           self.tmp_dir)
+            responses = client.makefile('r')
+            self.assertEqual(json.loads(responses.readline()),
+                             {'error': "Request is not valid JSON."})
+            self.assertEqual(json.loads(responses.readline()),
+                             {'error': "Request is not an object."})
+            self.assertIn('warnings', json.loads(responses.readline()))
+        finally:
+            client.close()
+
+    def test_socket_path(self):
+        """A live daemon's socket is not replaced, a stale one is."""
+        self.assertIn('already serving',
+                      daemon.check_socket_path(self.socket_path))
+        stale_path = os.path.join(self.tmp_dir, 'stale.sock')
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(stale_path)
+        stale.close()
+        self.assertIsNone(daemon.check_socket_path(stale_path))
+        other_path = os.path.join(self.tmp_dir, 'other')
+        write_file(other_path, '')
+        self.assertIn('not a socket', daemon.check_socket_path(other_path))
+
+def write_file(filename, contents):
+    """Create a file with the specified contents."""
+    with open(filename, 'w') as out_file:
+        out_file.write(contents)
+
+if __name__ == '__main__':
+    unittest.main()
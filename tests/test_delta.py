@@ -0,0 +1,264 @@
+"""Tests for delta.py"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from copy import deepcopy
+
+import delta # delta.py
+import npm_dependency_check # npm_dependency_check.py
+
+def make_package(name, version, files, submodules=None):
+    """Make the data for a package as written to a baseline."""
+    package_json = {'package_name': name, 'package_version': version,
+                    'github_location': '',
+                    'files': [{'file_location': location,
+                               'file_hash': file_hash}
+                              for location, file_hash in files]}
+    if submodules:
+        package_json['submodules'] = submodules
+    return package_json
+
+# submodules in the order they are visited
+OLD_BASELINE = make_package('app', '1.0.0', [('index.js', '11')], [
+    make_package('@s/c', '1.0.0', [('c.js', '44')]),
+    make_package('a', '1.0.0', [('a.js', '22')], [
+        make_package('b', '1.0.0', [('b.js', '33')])]),
+    make_package('d', '1.0.0', [('d.js', '55')])])
+
+NEW_BASELINE = make_package('app', '1.0.0', [('index.js', '11')], [
+    make_package('@s/c', '1.0.0', [('c.js', '44')]),
+    make_package('a', '1.1.0', [('a.js', '66')], [
+        make_package('b', '1.0.0', [('b.js', '33')])]),
+    make_package('e', '1.0.0', [('e.js', '77')])])
+
+class TestIndex(unittest.TestCase):
+    """Flattening baselines by package location."""
+
+    def test_locations(self):
+        """Packages are keyed by their location as in npm lockfiles."""
+        self.assertEqual(
+            sorted(delta.index_packages(OLD_BASELINE)),
+            ['', 'node_modules/@s/c', 'node_modules/a',
+             'node_modules/a/node_modules/b', 'node_modules/d'])
+
+    def test_build_tree(self):
+        """An index rebuilds into the baseline it was made from."""
+        self.assertEqual(delta.build_tree(delta.index_packages(OLD_BASELINE)),
+                         OLD_BASELINE)
+
+class TestDelta(unittest.TestCase):
+    """Making and applying deltas."""
+
+    def test_make_delta(self):
+        """Only changed, added and removed packages are recorded."""
+        delta_json = delta.make_delta(delta.index_packages(OLD_BASELINE),
+                                      delta.index_packages(NEW_BASELINE))
+        self.assertEqual(sorted(delta_json['changed']),
+                         ['node_modules/a', 'node_modules/e'])
+        self.assertEqual(delta_json['removed'], ['node_modules/d'])
+
+    def test_round_trip(self):
+        """Applying a delta to the old baseline gives the new baseline,
+        including after being written to file."""
+        delta_json = delta.make_delta(delta.index_packages(OLD_BASELINE),
+                                      delta.index_packages(NEW_BASELINE))
+        delta_json = json.loads(json.dumps(delta_json))
+        self.assertEqual(delta.apply_deltas(deepcopy(OLD_BASELINE),
+                                            [delta_json]),
+                         json.loads(json.dumps(NEW_BASELINE)))
+
+    def test_deltas_in_order(self):
+        """Deltas are applied oldest first."""
+        newest = deepcopy(NEW_BASELINE)
+        newest['submodules'][1]['package_version'] = '1.2.0'
+        deltas = [delta.make_delta(delta.index_packages(OLD_BASELINE),
+                                   delta.index_packages(NEW_BASELINE)),
+                  delta.make_delta(delta.index_packages(NEW_BASELINE),
+                                   delta.index_packages(newest))]
+        self.assertEqual(delta.apply_deltas(OLD_BASELINE, deltas), newest)
+        self.assertNotEqual(delta.apply_deltas(OLD_BASELINE, deltas[::-1]),
+                            newest)
+
+    def test_unsupported_format(self):
+        """Deltas in an unknown format are refused."""
+        self.assertRaises(ValueError, delta.apply_delta, {},
+                          {'delta_format': delta.DELTA_FORMAT + 1})
+
+class TestInstallLocation(unittest.TestCase):
+    """Packages installed under another name, e.g. with
+    'npm install foo@npm:bar', are keyed by where they are installed."""
+
+    def setUp(self):
+        self.target_dir = tempfile.mkdtemp()
+        write_file(os.path.join(self.target_dir, 'package.json'),
+                   '{"name": "app", "version": "1.0.0"}')
+        for alias, version in [('foo', '1.0.0'), ('foo2', '2.0.0')]:
+            package_dir = os.path.join(self.target_dir, 'node_modules', alias)
+            os.makedirs(package_dir)
+            write_file(os.path.join(package_dir, 'package.json'),
+                       '{"name": "bar", "version": "%s"}' % version)
+            write_file(os.path.join(package_dir, 'bar.js'), version)
+        self.verifier = npm_dependency_check.Verifier()
+
+    def tearDown(self):
+        self.verifier.close()
+        shutil.rmtree(self.target_dir)
+
+    def test_keys(self):
+        """Aliases are recorded and do not collide with each other."""
+        baseline_json = self.verifier.scan(self.target_dir)['package_data']
+        index = delta.index_packages(baseline_json)
+        self.assertEqual(sorted(index),
+                         ['', 'node_modules/foo', 'node_modules/foo2'])
+        self.assertEqual(index['node_modules/foo2']['package_version'],
+                         '2.0.0')
+        self.assertEqual(delta.build_tree(index), baseline_json)
+
+    def test_get_install_location(self):
+        """Locations are only recorded where they differ from the name."""
+        self.assertIsNone(delta.get_install_location('', 'app'))
+        self.assertIsNone(delta.get_install_location(
+            'node_modules/a/node_modules/@s/b', '@s/b'))
+        self.assertEqual(delta.get_install_location('node_modules/foo', 'bar'),
+                         'node_modules/foo')
+
+    def test_compare_to_own_baseline(self):
+        """Each alias is compared to its own entry in the baseline."""
+        baseline_json = json.loads(json.dumps(
+            self.verifier.scan(self.target_dir)['package_data']))
+        result = self.verifier.compare(self.target_dir, baseline_json)
+        self.assertEqual(result['warnings'], [])
+
+class TestCompact(unittest.TestCase):
+    """The --compact command."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_json(self, name, json_obj):
+        """Write a JSON file to the temporary directory."""
+        filename = os.path.join(self.tmp_dir, name)
+        with open(filename, 'w') as out_file:
+            json.dump(json_obj, out_file)
+        return filename
+
+    def test_compact(self):
+        """Folding deltas into a baseline writes the latest baseline."""
+        baseline = self.write_json('baseline.json', OLD_BASELINE)
+        delta_file = self.write_json('delta.json', delta.make_delta(
+            delta.index_packages(OLD_BASELINE),
+            delta.index_packages(NEW_BASELINE)))
+        output = os.path.join(self.tmp_dir, 'out.json')
+        npm_dependency_check.compact_main([baseline, delta_file,
+                                           '--output', output])
+        with open(output, 'r') as in_file:
+            self.assertEqual(json.load(in_file),
+                             json.loads(json.dumps(NEW_BASELINE)))
+
+class TestDiff(unittest.TestCase):
+    """The --diff command."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.target_dir = os.path.join(self.tmp_dir, 'app')
+        write_package(self.target_dir, 'app', '1.0.0')
+        for name in ['a', 'b', 'c']:
+            write_package(os.path.join(self.target_dir, 'node_modules', name),
+                          name, '1.0.0')
+        write_package(os.path.join(self.target_dir, 'node_modules', 'a',
+                                   'node_modules', 'd'), 'd', '1.0.0')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_baseline(self, name, baseline_json):
+        """Write a baseline to the temporary directory."""
+        filename = os.path.join(self.tmp_dir, name)
+        with open(filename, 'w') as out_file:
+            json.dump(baseline_json, out_file)
+        return filename
+
+    def diff(self, *argv):
+        """Run the --diff command.
+
+        Returns:
+            List[str]: The warnings it emitted.
+        """
+        with npm_dependency_check.collected_warnings() as warnings:
+            npm_dependency_check.diff_main(list(argv))
+        return list(warnings)
+
+    def test_same_as_live(self):
+        """Comparing two baselines reports the same changes as comparing the
+        later installation to the earlier baseline."""
+        with npm_dependency_check.Verifier() as verifier:
+            old_json = verifier.scan(self.target_dir)['package_data']
+            write_file(os.path.join(self.target_dir, 'node_modules', 'a',
+                                    'a.js'), 'changed')
+            write_package(os.path.join(self.target_dir, 'node_modules', 'b'),
+                          'b', '2.0.0')
+            shutil.rmtree(os.path.join(self.target_dir, 'node_modules', 'c'))
+            write_package(os.path.join(self.target_dir, 'node_modules', 'a',
+                                       'node_modules', 'e'), 'e', '1.0.0')
+            old_baseline = self.write_baseline('old.json', old_json)
+            new_baseline = self.write_baseline(
+                'new.json', verifier.scan(self.target_dir)['package_data'])
+            live_warnings = verifier.compare(self.target_dir,
+                                             old_json)['warnings']
+        # a live comparison names packages by where they are installed
+        live_warnings = [
+            warning.replace("'%s'" % self.target_dir, "'.'")
+            .replace(self.target_dir + os.sep, '')
+            for warning in live_warnings]
+        self.assertEqual(len(live_warnings), 5)
+        self.assertEqual(self.diff(old_baseline, new_baseline), live_warnings)
+
+    def test_unchanged(self):
+        """Identical baselines have no differences."""
+        with npm_dependency_check.Verifier() as verifier:
+            baseline = self.write_baseline(
+                'old.json', verifier.scan(self.target_dir)['package_data'])
+        self.assertEqual(self.diff(baseline, baseline), [])
+
+    def test_trust_merkle_roots(self):
+        """With --trust-merkle-roots, the files of packages whose recorded
+        roots match are not compared; other packages still are."""
+        old_json = make_package('app', '1.0.0', [('index.js', '11')], [
+            make_package('a', '1.0.0', [('a.js', '22')]),
+            make_package('b', '1.0.0', [('b.js', '33')])])
+        new_json = deepcopy(old_json)
+        for package_json in old_json['submodules']:
+            package_json['merkle_root'] = 'root'
+        new_json['submodules'][0]['merkle_root'] = 'root'
+        new_json['submodules'][0]['files'][0]['file_hash'] = '44'
+        new_json['submodules'][1]['merkle_root'] = 'other root'
+        new_json['submodules'][1]['files'][0]['file_hash'] = '55'
+        old_baseline = self.write_baseline('old.json', old_json)
+        new_baseline = self.write_baseline('new.json', new_json)
+        self.assertEqual(len(self.diff(old_baseline, new_baseline)), 2)
+        warnings = self.diff(old_baseline, new_baseline,
+                             '--trust-merkle-roots')
+        self.assertEqual(len(warnings), 1)
+        self.assertIn('b.js', warnings[0])
+
+def write_package(package_dir, name, version):
+    """Create a package with one file, named after the package."""
+    if not os.path.isdir(package_dir):
+        os.makedirs(package_dir)
+    write_file(os.path.join(package_dir, 'package.json'),
+               '{"name": "%s", "version": "%s"}' % (name, version))
+    write_file(os.path.join(package_dir, name + '.js'), name)
+
+def write_file(filename, contents):
+    """Create a file with the specified contents."""
+    with open(filename, 'w') as out_file:
+        out_file.write(contents)
+
+if __name__ == '__main__':
+    unittest.main()
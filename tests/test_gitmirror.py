@@ -0,0 +1,143 @@
+"""Tests for gitmirror.py"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+import subprocess
+
+import gitmirror # gitmirror.py
+
+GIT_ENV = dict(os.environ, GIT_AUTHOR_NAME='test',
+               GIT_AUTHOR_EMAIL='test@example.com', GIT_COMMITTER_NAME='test',
+               GIT_COMMITTER_EMAIL='test@example.com')
+
+FILES = {'index.js': 'module.exports = 1;\n',
+         'lib/a.js': 'a\n',
+         'lib/deep/b.js': 'b\0binary\n'}
+
+class TestRepository(unittest.TestCase):
+    """Reading tagged versions from a bare mirror."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        work_dir = os.path.join(self.tmp_dir, 'work')
+        for location, contents in FILES.iteritems():
+            filename = os.path.join(work_dir, location)
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            write_file(filename, contents)
+        git(work_dir, 'init', '-q')
+        git(work_dir, 'add', '.')
+        git(work_dir, 'commit', '-q', '-m', '1.0.0')
+        git(work_dir, 'tag', 'v1.0.0')
+        write_file(os.path.join(work_dir, 'lib', 'a.js'), 'changed\n')
+        git(work_dir, 'commit', '-q', '-a', '-m', '1.1.0')
+        git(work_dir, 'tag', '-a', '-m', '1.1.0', '1.1.0')
+        self.git_dir = os.path.join(self.tmp_dir, 'mirror', 'acme', 'a.git')
+        git(self.tmp_dir, 'clone', '-q', '--mirror', work_dir, self.git_dir)
+        self.mirror = gitmirror.GitMirror(os.path.join(self.tmp_dir,
+                                                       'mirror'))
+
+    def tearDown(self):
+        self.mirror.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def get_version_files(self, version):
+        """Look up a version of the mirrored project."""
+        repository = self.mirror.get_repository('https://github.com/acme/a')
+        return repository.get_version_files(version)
+
+    def test_version_files(self):
+        """Every file below the tagged tree is listed by its blob ID."""
+        tag, files = self.get_version_files('1.0.0')
+        self.assertEqual(tag, 'v1.0.0')
+        self.assertEqual(
+            files, dict((location, git_blob_id(contents))
+                        for location, contents in FILES.iteritems()))
+
+    def test_annotated_tag(self):
+        """Annotated tags without a 'v' prefix are resolved."""
+        tag, files = self.get_version_files('1.1.0')
+        self.assertEqual(tag, '1.1.0')
+        self.assertEqual(files['lib/a.js'], git_blob_id('changed\n'))
+        self.assertEqual(files['index.js'], git_blob_id(FILES['index.js']))
+
+    def test_missing_version(self):
+        """Versions that are not tagged are not found, and do not disturb
+        later lookups."""
+        self.assertIsNone(self.get_version_files('2.0.0'))
+        self.assertEqual(self.get_version_files('1.0.0')[0], 'v1.0.0')
+
+    def test_invalid_version(self):
+        """Versions that git would read as several requests are refused, and
+        do not disturb later lookups."""
+        for version in ['1.0.0\nv1.1.0', '1.0.0 x', '1.0.0\0', '1.0.0\x7f']:
+            self.assertRaises(gitmirror.GitError, self.get_version_files,
+                              version)
+        self.assertEqual(self.get_version_files('1.1.0')[0], '1.1.0')
+
+    def test_restart_after_error(self):
+        """The git process is replaced after an error, so its responses stay
+        in step with the requests."""
+        repository = self.mirror.get_repository('https://github.com/acme/a')
+        repository._resolve('refs/tags/v1.0.0')
+        process = repository._process
+        repository._trees.clear()
+        repository._process.stdin.write('refs/tags/1.1.0\n')
+        self.assertRaises(gitmirror.GitError, repository.get_version_files,
+                          '1.0.0')
+        self.assertIsNone(repository._process)
+        self.assertIsNotNone(process.poll())
+        tag, files = repository.get_version_files('1.0.0')
+        self.assertEqual(tag, 'v1.0.0')
+        self.assertEqual(files['lib/a.js'], git_blob_id(FILES['lib/a.js']))
+
+    def test_missing_repository(self):
+        """Projects that are not mirrored are not found."""
+        self.assertIsNone(self.mirror.get_repository(
+            'https://github.com/acme/b'))
+
+class TestGitDirs(unittest.TestCase):
+    """Locating mirrors of GitHub projects."""
+
+    def test_possible_git_dirs(self):
+        """Mirrors are looked for with and without owner and '.git'."""
+        self.assertEqual(
+            gitmirror.get_possible_git_dirs('m', 'https://github.com/o/p.git'),
+            [os.path.join('m', 'o', 'p.git'), os.path.join('m', 'o', 'p'),
+             os.path.join('m', 'p.git'), os.path.join('m', 'p')])
+
+    def test_unsafe_locations(self):
+        """Locations that are not of an owner and project are ignored."""
+        for github_location in ['https://github.com/o',
+                                'https://github.com/o/p/tree/master',
+                                'https://github.com/../p']:
+            self.assertEqual(gitmirror.get_possible_git_dirs(
+                'm', github_location), [])
+
+class TestSafeRevision(unittest.TestCase):
+    """Checking revisions before they are sent to git."""
+
+    def test_safe_revision(self):
+        """Only non-empty revisions of printable characters are sent."""
+        self.assertTrue(gitmirror.is_safe_revision('refs/tags/v1.0.0^{tree}'))
+        for revision in ['', 'a b', 'a\tb', 'a\n', 'a\rb', 'a\0', 'a\x7f']:
+            self.assertFalse(gitmirror.is_safe_revision(revision))
+
+def git_blob_id(contents):
+    """Get the blob ID git gives a file with these contents."""
+    return hashlib.sha1('blob %d\0%s' % (len(contents), contents)).hexdigest()
+
+def git(cwd, *args):
+    """Run a git command."""
+    subprocess.check_call(('git',) + args, cwd=cwd, env=GIT_ENV)
+
+def write_file(filename, contents):
+    """Create a file with the specified contents."""
+    with open(filename, 'wb') as out_file:
+        out_file.write(contents)
+
+if __name__ == '__main__':
+    unittest.main()
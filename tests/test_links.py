@@ -0,0 +1,219 @@
+"""Tests for links.py"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import links  # links.py
+import hasher # hasher.py
+import npm_dependency_check # npm_dependency_check.py
+
+class CountingLimiter(object):
+    """Stands in for a `throttle.Throttle`, counting the files opened."""
+
+    def __init__(self):
+        self.files_opened = 0
+
+    def open_file(self):
+        """Count a file being opened."""
+        self.files_opened += 1
+
+    def read(self, num_bytes):
+        """Reads are not paced."""
+        pass
+
+class TestInodeTracker(unittest.TestCase):
+    """Hashing each physical file once."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.limiter = CountingLimiter()
+        self.tracker = links.InodeTracker(self.root, limiter=self.limiter)
+        write_file(os.path.join(self.root, 'a.js'), 'a')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_hardlink(self):
+        """A hardlinked file is hashed once and reported as a link of where
+        it was first hashed."""
+        os.link(os.path.join(self.root, 'a.js'),
+                os.path.join(self.root, 'b.js'))
+        self.assertEqual(
+            self.tracker.hash_file(os.path.join(self.root, 'a.js')),
+            (hasher.sha256_string('a'), None, None))
+        self.assertEqual(
+            self.tracker.hash_file(os.path.join(self.root, 'b.js')),
+            (hasher.sha256_string('a'), 'a.js', None))
+        self.assertEqual(self.limiter.files_opened, 1)
+
+    def test_separate_files(self):
+        """Files that are not linked are each hashed."""
+        write_file(os.path.join(self.root, 'b.js'), 'a')
+        for name in ['a.js', 'b.js']:
+            self.assertIsNone(self.tracker.hash_file(
+                os.path.join(self.root, name))[1])
+        self.assertEqual(self.limiter.files_opened, 2)
+
+    def test_hash_cache(self):
+        """Unchanged files are not read again by a later traversal."""
+        hash_cache = links.HashCache()
+        location = os.path.join(self.root, 'a.js')
+        for _ in range(2):
+            tracker = links.InodeTracker(self.root, hash_cache, self.limiter)
+            self.assertEqual(tracker.hash_file(location)[0],
+                             hasher.sha256_string('a'))
+        self.assertEqual(self.limiter.files_opened, 1)
+
+    def test_first_visit(self):
+        """A directory reached through a symlink is recognized."""
+        os.mkdir(os.path.join(self.root, 'real'))
+        os.symlink('real', os.path.join(self.root, 'link'))
+        self.assertIsNone(self.tracker.first_visit(
+            os.path.join(self.root, 'real')))
+        self.assertEqual(self.tracker.first_visit(
+            os.path.join(self.root, 'link')), 'real')
+
+class TestHashCache(unittest.TestCase):
+    """Bounding the hashes kept between traversals."""
+
+    def test_least_recently_used(self):
+        """The least recently used hash is forgotten first."""
+        hash_cache = links.HashCache(max_entries=2)
+        hash_cache['a'] = ('1', None)
+        hash_cache['b'] = ('2', None)
+        hash_cache.get('a')
+        hash_cache['c'] = ('3', None)
+        self.assertEqual(len(hash_cache), 2)
+        self.assertIsNone(hash_cache.get('b'))
+        self.assertEqual(hash_cache.get('a'), ('1', None))
+
+class TestLinkedTree(unittest.TestCase):
+    """Scanning installations with linked packages and directories."""
+
+    def setUp(self):
+        self.target_dir = tempfile.mkdtemp()
+        write_file(os.path.join(self.target_dir, 'package.json'),
+                   '{"name": "app", "version": "1.0.0"}')
+        os.mkdir(os.path.join(self.target_dir, 'node_modules'))
+        self.verifier = npm_dependency_check.Verifier()
+
+    def tearDown(self):
+        self.verifier.close()
+        shutil.rmtree(self.target_dir)
+
+    def scan(self):
+        """Scan the installation.
+
+        Returns:
+            tuple: (packages, warnings) where `packages` maps the location of
+                each package to its data.
+        """
+        result = self.verifier.scan(self.target_dir)
+        packages = {}
+        stack = [('', result['package_data'])]
+        while stack:
+            key, package_json = stack.pop()
+            packages[key] = package_json
+            stack.extend((npm_dependency_check.delta.get_key(key, submodule),
+                          submodule)
+                         for submodule in package_json.get('submodules', []))
+        return packages, result['warnings']
+
+    def test_symlinked_package(self):
+        """A package directory reached again through a symlink is recorded
+        as a link of its first location, without its files."""
+        make_package(self.target_dir, 'node_modules/a')
+        os.symlink('a', os.path.join(self.target_dir, 'node_modules', 'b'))
+        packages, warnings = self.scan()
+        self.assertEqual(warnings, [])
+        self.assertNotIn('link_of', packages['node_modules/a'])
+        self.assertEqual(packages['node_modules/b']['link_of'],
+                         os.path.join('node_modules', 'a'))
+        self.assertEqual(packages['node_modules/b']['files'], [])
+
+    def test_directory_cycle(self):
+        """A directory that links back to one of its parents is skipped."""
+        package_dir = make_package(self.target_dir, 'node_modules/a')
+        os.mkdir(os.path.join(package_dir, 'lib'))
+        write_file(os.path.join(package_dir, 'lib', 'a.js'), 'a')
+        os.symlink(os.pardir, os.path.join(package_dir, 'lib', 'loop'))
+        packages, warnings = self.scan()
+        self.assertEqual(len(warnings), 1)
+        self.assertIn('links back to one of its parents', warnings[0])
+        self.assertEqual(
+            sorted(file_json['file_location']
+                   for file_json in packages['node_modules/a']['files']),
+            ['index.js', os.path.join('lib', 'a.js'), 'package.json'])
+
+    def test_pnpm_layout(self):
+        """The dependencies of a package symlinked into a pnpm store, which
+        are installed alongside its target, are scanned."""
+        store = os.path.join('node_modules', '.pnpm')
+        make_package(self.target_dir, store + '/a@1.0.0/node_modules/a')
+        make_package(self.target_dir, store + '/b@1.0.0/node_modules/b')
+        make_package(self.target_dir, store + '/@s+c@1.0.0/node_modules/@s/c')
+        os.symlink(os.path.join(os.pardir, os.pardir, 'b@1.0.0',
+                                'node_modules', 'b'),
+                   os.path.join(self.target_dir, store, 'a@1.0.0',
+                                'node_modules', 'b'))
+        os.mkdir(os.path.join(self.target_dir, store, 'a@1.0.0',
+                              'node_modules', '@s'))
+        os.symlink(os.path.join(os.pardir, os.pardir, os.pardir, '@s+c@1.0.0',
+                                'node_modules', '@s', 'c'),
+                   os.path.join(self.target_dir, store, 'a@1.0.0',
+                                'node_modules', '@s', 'c'))
+        os.symlink(os.path.join('.pnpm', 'a@1.0.0', 'node_modules', 'a'),
+                   os.path.join(self.target_dir, 'node_modules', 'a'))
+        packages, warnings = self.scan()
+        self.assertEqual(warnings, [])
+        self.assertEqual(sorted(packages),
+                         ['', 'node_modules/a',
+                          'node_modules/a/node_modules/@s/c',
+                          'node_modules/a/node_modules/b'])
+        self.assertEqual(
+            packages['node_modules/a/node_modules/b']['files'][0]
+            ['file_hash'], hasher.sha256_string('b'))
+
+    def test_own_dependency_preferred(self):
+        """A package's own `node_modules` takes precedence over packages
+        alongside its target."""
+        make_package(self.target_dir, 'store/node_modules/a')
+        shadowed_dir = make_package(self.target_dir, 'store/node_modules/b')
+        write_file(os.path.join(shadowed_dir, 'index.js'), 'shadowed')
+        make_package(self.target_dir, 'store/node_modules/a/node_modules/b')
+        os.symlink(os.path.join(os.pardir, 'store', 'node_modules', 'a'),
+                   os.path.join(self.target_dir, 'node_modules', 'a'))
+        packages, _ = self.scan()
+        self.assertEqual(sorted(packages),
+                         ['', 'node_modules/a',
+                          'node_modules/a/node_modules/b'])
+        self.assertIn({'file_location': 'index.js',
+                       'file_hash': hasher.sha256_string('b')},
+                      packages['node_modules/a/node_modules/b']['files'])
+
+def make_package(root, location):
+    """Create a package with one file, named after the last part of its
+    location.
+
+    Returns:
+        str: The package directory.
+    """
+    package_dir = os.path.join(root, *location.split('/'))
+    name = '/'.join(location.split('/')[-2:])
+    if not name.startswith('@'):
+        name = name.split('/')[-1]
+    os.makedirs(package_dir)
+    write_file(os.path.join(package_dir, 'package.json'),
+               '{"name": "%s", "version": "1.0.0"}' % name)
+    write_file(os.path.join(package_dir, 'index.js'), name.split('/')[-1])
+    return package_dir
+
+def write_file(filename, contents):
+    """Create a file with the specified contents."""
+    with open(filename, 'w') as out_file:
+        out_file.write(contents)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""Tests for lockfile.py"""
+
+import unittest
+
+import lockfile # lockfile.py
+
+class TestLockEntries(unittest.TestCase):
+    """Reading the locked packages of both lockfile formats."""
+
+    def test_packages_format(self):
+        """Entries of versions 2 and 3 are keyed by their location."""
+        self.assertEqual(lockfile.get_lock_entries({'packages': {
+            '': {'name': 'app', 'version': '1.0.0'},
+            'node_modules/a': {'version': '1.0.0', 'integrity': 'sha512-a',
+                               'dev': True},
+            'node_modules/a/node_modules/@s/b': {'version': '2.0.0'}}}),
+                         {'node_modules/a': {'version': '1.0.0',
+                                             'integrity': 'sha512-a'},
+                          'node_modules/a/node_modules/@s/b': {
+                              'version': '2.0.0'}})
+
+    def test_dependencies_format(self):
+        """Nested entries of version 1 are keyed as in later versions."""
+        self.assertEqual(lockfile.get_lock_entries({'dependencies': {
+            'a': {'version': '1.0.0', 'resolved': 'https://r/a-1.0.0.tgz',
+                  'dependencies': {'@s/b': {'version': '2.0.0'}}}}}),
+                         {'node_modules/a': {
+                             'version': '1.0.0',
+                             'resolved': 'https://r/a-1.0.0.tgz'},
+                          'node_modules/a/node_modules/@s/b': {
+                              'version': '2.0.0'}})
+
+class TestChangedKeys(unittest.TestCase):
+    """Finding the packages changed between two lockfiles."""
+
+    def test_changed_keys(self):
+        """Added, removed and changed entries are found."""
+        prev_entries = {'node_modules/a': {'version': '1.0.0'},
+                        'node_modules/b': {'version': '1.0.0'},
+                        'node_modules/c': {'version': '1.0.0',
+                                           'integrity': 'sha512-c'}}
+        new_entries = {'node_modules/a': {'version': '1.0.0'},
+                       'node_modules/c': {'version': '1.0.0',
+                                          'integrity': 'sha512-x'},
+                       'node_modules/d': {'version': '1.0.0'}}
+        self.assertEqual(lockfile.get_changed_keys(prev_entries, new_entries),
+                         set(['node_modules/b', 'node_modules/c',
+                              'node_modules/d']))
+
+    def test_keys(self):
+        """Child and parent locations are the inverse of each other."""
+        for parent_key in ['', 'node_modules/a',
+                           'node_modules/@s/b/node_modules/c']:
+            key = lockfile.get_child_key(parent_key, '@s/d')
+            self.assertEqual(lockfile.get_parent_key(key), parent_key)
+        self.assertIsNone(lockfile.get_parent_key(''))
+
+if __name__ == '__main__':
+    unittest.main()
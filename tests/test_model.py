@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Tests for model.py"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import model # model.py
+import delta # delta.py
+import npm_dependency_check # npm_dependency_check.py
+
+SHA256_A = 'a' * 64
+SHA256_B = '0123456789abcdef' * 4
+
+BASELINE = {
+    'package_name': 'app', 'package_version': '1.0.0',
+    'github_location': '', 'merkle_root': SHA256_A,
+    'files': [{'file_location': 'index.js', 'file_hash': SHA256_A}],
+    'submodules': [
+        {'package_name': 'a', 'package_version': '2.0.0',
+         'github_location': 'https://github.com/acme/a',
+         'lock_integrity': 'sha512-xyz', 'full_scan_time': 1500000000,
+         'files': [{'file_location': 'lib/a.js', 'file_hash': SHA256_B},
+                   {'file_location': 'b.js', 'file_hash': SHA256_B,
+                    'link_of': 'node_modules/c/b.js'}]},
+        {'package_name': 'c', 'package_version': '3.0.0',
+         'github_location': '', 'link_of': 'node_modules/a', 'files': []}]}
+
+class TestCompactIndex(unittest.TestCase):
+    """Compact records must read back exactly as the baseline they replace."""
+
+    def test_round_trip(self):
+        """Every record converts back to the data it was made from."""
+        baseline_json = json.loads(json.dumps(BASELINE))
+        index = delta.index_packages(baseline_json)
+        compacted = model.compact_index(delta.index_packages(baseline_json))
+        self.assertEqual(sorted(compacted), sorted(index))
+        for key in index:
+            self.assertEqual(compacted[key].to_json(), index[key])
+            self.assertEqual(compacted[key], index[key])
+
+    def test_rebuilds_baseline(self):
+        """A compacted index rebuilds into the original baseline."""
+        index = model.compact_index(delta.index_packages(
+            json.loads(json.dumps(BASELINE))))
+        plain = dict((key, record.to_json())
+                     for key, record in index.iteritems())
+        self.assertEqual(delta.build_tree(plain), BASELINE)
+
+    def test_digests_packed(self):
+        """SHA-256 digests are packed as bytes and read back as hex."""
+        table = model.FileTable(BASELINE['files'] * 3)
+        self.assertEqual(len(table._digests), 3 * model.DIGEST_SIZE)
+        self.assertEqual(table[-1]['file_hash'], SHA256_A)
+
+    def test_other_hashes_kept(self):
+        """Hashes other than SHA-256 digests are kept as they are."""
+        files_json = [{'file_location': 'x.js', 'file_hash': 'not-a-digest'}]
+        table = model.FileTable(files_json)
+        self.assertIsNone(table._digests)
+        self.assertEqual(list(table), files_json)
+
+    def test_missing_attributes(self):
+        """Attributes a package does not have are not made up."""
+        record = model.PackageRecord({'package_name': 'x'})
+        self.assertNotIn('files', record)
+        self.assertIsNone(record.get('package_version'))
+        self.assertRaises(KeyError, lambda: record['link_of'])
+        self.assertEqual(record.keys(), ['package_name'])
+
+    def test_non_ascii_locations(self):
+        """Non-ASCII file names are kept as UTF-8, as read from disk."""
+        baseline_json = json.loads(json.dumps({
+            'package_name': u'caf\xe9', 'package_version': '1.0.0',
+            'files': [{'file_location': u'caf\xe9.js',
+                       'file_hash': SHA256_A}]}))
+        record = model.compact_index(delta.index_packages(baseline_json))['']
+        self.assertEqual(record['files'][0]['file_location'],
+                         'caf\xc3\xa9.js')
+        self.assertEqual(record['package_name'], 'caf\xc3\xa9')
+
+class TestNonAsciiBaseline(unittest.TestCase):
+    """A baseline with non-ASCII file names compares cleanly to the
+    installation it was made from."""
+
+    def setUp(self):
+        self.target_dir = tempfile.mkdtemp()
+        package_dir = os.path.join(self.target_dir, 'node_modules', '@s', 'b')
+        os.makedirs(package_dir)
+        write_file(os.path.join(self.target_dir, 'package.json'),
+                   '{"name": "app", "version": "1.0.0"}')
+        write_file(os.path.join(package_dir, 'package.json'),
+                   '{"name": "@s/b", "version": "1.0.0"}')
+        write_file(os.path.join(package_dir, 'caf\xc3\xa9.js'), 'x')
+        self.verifier = npm_dependency_check.Verifier()
+
+    def tearDown(self):
+        self.verifier.close()
+        shutil.rmtree(self.target_dir)
+
+    def test_compare_to_own_baseline(self):
+        """The baseline is written and read back without errors or
+        discrepancies."""
+        result = self.verifier.scan(self.target_dir)
+        baseline_json = json.loads(json.dumps(result['package_data']))
+        result = self.verifier.compare(self.target_dir, baseline_json)
+        self.assertEqual(result['num_packages'], 2)
+        self.assertEqual(result['warnings'], [])
+
+    def test_detects_change(self):
+        """A change to a file with a non-ASCII name is reported."""
+        result = self.verifier.scan(self.target_dir)
+        baseline_json = json.loads(json.dumps(result['package_data']))
+        write_file(os.path.join(self.target_dir, 'node_modules', '@s', 'b',
+                                'caf\xc3\xa9.js'), 'y')
+        result = self.verifier.compare(self.target_dir, baseline_json)
+        self.assertEqual(result['num_warnings'], 1)
+        self.assertIn('Hash mismatch', result['warnings'][0])
+
+def write_file(filename, contents):
+    """Create a file with the specified contents."""
+    with open(filename, 'w') as out_file:
+        out_file.write(contents)
+
+if __name__ == '__main__':
+    unittest.main()
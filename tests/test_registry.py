@@ -0,0 +1,260 @@
+"""Tests for registry.py"""
+
+import io
+import os
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import unittest
+from argparse import Namespace
+from urllib2 import HTTPError
+
+import http     # http.py
+import hasher   # hasher.py
+import registry # registry.py
+import npm_dependency_check # npm_dependency_check.py
+
+PACKAGE_JSON = ('{"name": "a", "version": "1.0.0", "repository": '
+                '{"url": "git+https://github.com/acme/a.git"}}')
+
+class TestTarballData(unittest.TestCase):
+    """Describing the contents of published tarballs."""
+
+    def test_tarball_data(self):
+        """Files with the hashed extensions are hashed, below whichever
+        top-level directory they were packed in."""
+        tarball = make_tarball({
+            'package.json': '{"name": "a", "version": "1.0.0", '
+                            '"repository": {"url": '
+                            '"git+https://github.com/acme/a.git"}}',
+            'lib/a.js': 'a',
+            'README.md': 'readme'}, prefix='a/')
+        tarball_data_json = registry.get_tarball_data(
+            io.BytesIO(tarball), 'a-1.0.0.tgz', ['.js', '.json'])
+        self.assertEqual(tarball_data_json['package_location'], 'a-1.0.0.tgz')
+        self.assertEqual(tarball_data_json['package_name'], 'a')
+        self.assertEqual(tarball_data_json['package_version'], '1.0.0')
+        self.assertEqual(tarball_data_json['github_location'],
+                         'https://github.com/acme/a/')
+        self.assertEqual(
+            sorted(file_json['file_location']
+                   for file_json in tarball_data_json['files']),
+            ['lib/a.js', 'package.json'])
+        self.assertIn({'file_location': 'lib/a.js',
+                       'file_hash': hasher.sha256_string('a')},
+                      tarball_data_json['files'])
+
+    def test_no_package_json(self):
+        """A tarball without a readable package.json is still hashed."""
+        tarball = make_tarball({'package.json': '{', 'a.js': 'a'})
+        tarball_data_json = registry.get_tarball_data(
+            io.BytesIO(tarball), 'a.tgz', ['.js'])
+        self.assertEqual(tarball_data_json['files'],
+                         [{'file_location': 'a.js',
+                           'file_hash': hasher.sha256_string('a')}])
+
+class TestZipData(unittest.TestCase):
+    """Describing the contents of source archives downloaded from GitHub."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_zip_data(self):
+        """Files below the top-level directory are hashed, except those in
+        dot directories and `node_modules`."""
+        zip_filename = os.path.join(self.tmp_dir, 'a.zip')
+        write_file(zip_filename, make_zip({
+            'package.json': PACKAGE_JSON,
+            'lib/a.js': 'a',
+            '.github/workflow.js': 'ci',
+            'lib/.cache/b.js': 'b',
+            'node_modules/c/c.js': 'c',
+            '.eslintrc.js': 'lint',
+            'README.md': 'readme'}))
+        zip_data_json = registry.get_zip_data(
+            zip_filename, 'https://github.com/acme/a/archive/v1.0.0.zip',
+            ['.js', '.json'])
+        self.assertEqual(zip_data_json['package_location'],
+                         'https://github.com/acme/a/archive/v1.0.0.zip')
+        self.assertEqual(zip_data_json['package_name'], 'a')
+        self.assertEqual(zip_data_json['github_location'],
+                         'https://github.com/acme/a/')
+        self.assertEqual(
+            sorted(file_json['file_location']
+                   for file_json in zip_data_json['files']),
+            ['.eslintrc.js', 'lib/a.js', 'package.json'])
+        self.assertIn({'file_location': 'package.json',
+                       'file_hash': hasher.sha256_string(PACKAGE_JSON)},
+                      zip_data_json['files'])
+
+    def test_not_a_zip(self):
+        """Downloads that are not zip files are refused."""
+        zip_filename = os.path.join(self.tmp_dir, 'a.zip')
+        write_file(zip_filename, 'not a zip')
+        self.assertRaises(zipfile.BadZipfile, registry.get_zip_data,
+                          zip_filename, 'a.zip', ['.js'])
+
+class TestGithubComparison(unittest.TestCase):
+    """Comparing installed packages to their releases on GitHub, with
+    downloads served from memory."""
+
+    def setUp(self):
+        self.target_dir = tempfile.mkdtemp()
+        self.package_dir = os.path.join(self.target_dir, 'node_modules', 'a')
+        os.makedirs(self.package_dir)
+        write_file(os.path.join(self.target_dir, 'package.json'),
+                   '{"name": "app", "version": "1.0.0"}')
+        write_file(os.path.join(self.package_dir, 'package.json'),
+                   PACKAGE_JSON)
+        write_file(os.path.join(self.package_dir, 'index.js'), 'a')
+        self.releases = {'https://github.com/acme/a/archive/1.0.0.zip':
+                         make_zip({'package.json': PACKAGE_JSON,
+                                   'index.js': 'a',
+                                   'test/.fixtures/x.js': 'x'})}
+        self.urls_fetched = []
+        self.fetch_url = http.fetch_url
+        http.fetch_url = self.fetch_release
+
+    def tearDown(self):
+        http.fetch_url = self.fetch_url
+        shutil.rmtree(self.target_dir)
+
+    def fetch_release(self, url, fetch_tmp_file=False):
+        """Stands in for `http.fetch_url`, serving `self.releases`."""
+        self.urls_fetched.append(url)
+        if url not in self.releases:
+            raise HTTPError(url, 404, 'Not Found', None, None)
+        handle, filename = tempfile.mkstemp()
+        os.close(handle)
+        write_file(filename, self.releases[url])
+        return filename
+
+    def check(self):
+        """Scan the installation, comparing it to GitHub."""
+        with npm_dependency_check.Verifier(
+                ['--verify-against-github']) as verifier:
+            return verifier.scan(self.target_dir)['warnings']
+
+    def test_match(self):
+        """A package installed as released matches, and the tags are tried
+        in turn."""
+        self.assertEqual(self.check(), [])
+        self.assertEqual(self.urls_fetched,
+                         ['https://github.com/acme/a/archive/v1.0.0.zip',
+                          'https://github.com/acme/a/archive/1.0.0.zip'])
+
+    def test_mismatch(self):
+        """A file that differs from the release is reported."""
+        write_file(os.path.join(self.package_dir, 'index.js'), 'changed')
+        warnings = self.check()
+        self.assertEqual(len(warnings), 1)
+        self.assertIn("Hash mismatch for 'index.js'", warnings[0])
+
+    def test_missing_release(self):
+        """A version without a release on GitHub is reported."""
+        self.releases.clear()
+        warnings = self.check()
+        self.assertEqual(len(warnings), 1)
+        self.assertIn('tagged release', warnings[0])
+
+class TestMirror(unittest.TestCase):
+    """Finding tarballs in a mirror."""
+
+    def setUp(self):
+        self.mirror = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.mirror)
+
+    def test_possible_locations(self):
+        """Flat mirrors name tarballs as `npm pack` does; the registry layout
+        drops the scope from the file name."""
+        self.assertEqual(
+            registry.get_possible_tarball_locations('m', '@babel/core',
+                                                    '7.0.0'),
+            [os.path.join('m', 'babel-core-7.0.0.tgz'),
+             os.path.join('m', '@babel/core', '-', 'core-7.0.0.tgz')])
+        self.assertEqual(
+            registry.get_possible_tarball_locations('m', 'core', '7.0.0'),
+            [os.path.join('m', 'core-7.0.0.tgz'),
+             os.path.join('m', 'core', '-', 'core-7.0.0.tgz')])
+        self.assertEqual(
+            registry.get_possible_tarball_locations(
+                'http://localhost:4873/', '@babel/core', '7.0.0'),
+            ['http://localhost:4873/@babel/core/-/core-7.0.0.tgz'])
+
+    def test_scoped_not_confused(self):
+        """The tarball of an unscoped package is not used for a scoped package
+        of the same base name."""
+        write_file(os.path.join(self.mirror, 'core-7.0.0.tgz'),
+                   make_tarball({'package.json': '{"name": "core"}'}))
+        self.assertIsNone(registry.open_tarball(self.mirror, '@babel/core',
+                                                '7.0.0'))
+        write_file(os.path.join(self.mirror, 'babel-core-7.0.0.tgz'),
+                   make_tarball({'package.json': '{"name": "@babel/core"}'}))
+        location, tarball_file = registry.open_tarball(self.mirror,
+                                                       '@babel/core', '7.0.0')
+        tarball_file.close()
+        self.assertEqual(location,
+                         os.path.join(self.mirror, 'babel-core-7.0.0.tgz'))
+
+    def test_registry_layout(self):
+        """Tarballs are found in a mirror laid out like the registry."""
+        os.makedirs(os.path.join(self.mirror, '@babel', 'core', '-'))
+        write_file(os.path.join(self.mirror, '@babel', 'core', '-',
+                                'core-7.0.0.tgz'),
+                   make_tarball({'index.js': 'core'}))
+        tarball_data_json = npm_dependency_check.get_registry_data(
+            self.mirror, {'package_name': '@babel/core',
+                          'package_version': '7.0.0'},
+            ['.js'], Namespace(verbose=False))
+        self.assertEqual(tarball_data_json['files'],
+                         [{'file_location': 'index.js',
+                           'file_hash': hasher.sha256_string('core')}])
+
+    def test_missing(self):
+        """A package version the mirror does not have is reported."""
+        tarball_data_json = npm_dependency_check.get_registry_data(
+            self.mirror, {'package_name': 'a', 'package_version': '1.0.0'},
+            ['.js'], Namespace(verbose=False))
+        self.assertIn('Could not find', tarball_data_json['error'])
+
+def make_tarball(files, prefix='package/'):
+    """Pack files under a top-level directory as npm does.
+
+    Args:
+        files (dict): Maps the location of each file to its contents.
+    """
+    out_file = io.BytesIO()
+    with tarfile.open(fileobj=out_file, mode='w:gz') as tar:
+        tar.addfile(tarfile.TarInfo(prefix.rstrip('/')))
+        for location, contents in sorted(files.iteritems()):
+            info = tarfile.TarInfo(prefix + location)
+            info.size = len(contents)
+            tar.addfile(info, io.BytesIO(contents))
+    return out_file.getvalue()
+
+def make_zip(files, prefix='a-1.0.0/'):
+    """Archive files under a top-level directory as GitHub does.
+
+    Args:
+        files (dict): Maps the location of each file to its contents.
+    """
+    out_file = io.BytesIO()
+    with zipfile.ZipFile(out_file, 'w') as archive:
+        archive.writestr(prefix, '')
+        for location, contents in sorted(files.iteritems()):
+            archive.writestr(prefix + location, contents)
+    return out_file.getvalue()
+
+def write_file(filename, contents):
+    """Create a file with the specified contents."""
+    with open(filename, 'wb') as out_file:
+        out_file.write(contents)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,231 @@
+"""Tests for store.py"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import store  # store.py
+import hasher # hasher.py
+import npm_dependency_check # npm_dependency_check.py
+
+def make_package(name, version, files):
+    """Make the data for a package as yielded by `iter_package_data`."""
+    files_json = [{'file_location': location, 'file_hash': file_hash}
+                  for location, file_hash in files]
+    return {'package_name': name, 'package_version': version,
+            'github_location': '', 'files': files_json,
+            'merkle_root': hasher.merkle_root(files_json),
+            'package_location': 'node_modules/' + name}
+
+class TestManifestStore(unittest.TestCase):
+    """Recording and looking up manifests and installs."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = store.ManifestStore(os.path.join(self.tmp_dir, 'kg.db'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_add_and_get(self):
+        """Only the manifest attributes of a package are kept."""
+        package_json = make_package('a', '1.0.0', [('a.js', '11')])
+        self.assertTrue(self.store.add(package_json, ['.json', '.js']))
+        manifest = self.store.get('a', '1.0.0')
+        self.assertNotIn('package_location', manifest)
+        del package_json['package_location']
+        package_json['hashed_extensions'] = ['.js', '.json']
+        self.assertEqual(manifest, package_json)
+        self.assertIsNone(self.store.get('a', '2.0.0'))
+
+    def test_not_replaced(self):
+        """An existing manifest is never replaced."""
+        self.store.add(make_package('a', '1.0.0', [('a.js', '11')]), ['.js'])
+        self.assertFalse(self.store.add(
+            make_package('a', '1.0.0', [('a.js', '22')]), ['.js']))
+        self.assertEqual(self.store.get('a', '1.0.0')['files'][0]['file_hash'],
+                         '11')
+
+    def test_installs(self):
+        """Installs are listed by package version and cleared by project."""
+        self.store.add_install('p2', 'node_modules/a', 'a', '1.0.0')
+        self.store.add_install('p1', 'node_modules/b/node_modules/a', 'a',
+                               '1.0.0')
+        self.store.add_install('p1', 'node_modules/c', 'c', '1.0.0')
+        self.assertEqual(self.store.get_installs('a', '1.0.0'),
+                         [('p1', 'node_modules/b/node_modules/a'),
+                          ('p2', 'node_modules/a')])
+        self.store.clear_installs('p1')
+        self.assertEqual(self.store.get_installs('a', '1.0.0'),
+                         [('p2', 'node_modules/a')])
+        self.assertEqual(self.store.get_installs('c', '1.0.0'), [])
+
+    def test_parse_package_spec(self):
+        """Versions are split from plain and scoped names."""
+        self.assertEqual(store.parse_package_spec('lodash@4.17.21'),
+                         ('lodash', '4.17.21'))
+        self.assertEqual(store.parse_package_spec('@babel/core@7.0.0'),
+                         ('@babel/core', '7.0.0'))
+        for spec in ['lodash', '@babel/core', 'lodash@', '@7.0.0']:
+            self.assertRaises(ValueError, store.parse_package_spec, spec)
+
+class TestFileChanges(unittest.TestCase):
+    """Naming the files that differ between two copies of a package."""
+
+    def test_file_changes(self):
+        """Files are matched by location and compared by hash."""
+        prev_files = make_package(
+            'a', '1.0.0', [('a.js', '11'), ('b.js', '22'), ('c.js', '33')])
+        new_files = make_package(
+            'a', '1.0.0', [('a.js', '11'), ('b.js', '44'), ('d.js', '55')])
+        self.assertEqual(
+            npm_dependency_check.get_file_changes(prev_files['files'],
+                                                  new_files['files']),
+            (['d.js'], ['b.js'], ['c.js']))
+
+class TestMerkleRoot(unittest.TestCase):
+    """Merkle roots over the files of a package."""
+
+    def test_order_independent(self):
+        """The root does not depend on the order files were found in."""
+        files = [{'file_location': str(i), 'file_hash': 'h%d' % i}
+                 for i in range(5)]
+        self.assertEqual(hasher.merkle_root(files),
+                         hasher.merkle_root(files[::-1]))
+
+    def test_changes(self):
+        """Changing, adding or renaming a file changes the root."""
+        files = [{'file_location': 'a.js', 'file_hash': '11'},
+                 {'file_location': 'b.js', 'file_hash': '22'}]
+        root = hasher.merkle_root(files)
+        self.assertNotEqual(root, hasher.merkle_root(
+            [files[0], {'file_location': 'b.js', 'file_hash': '33'}]))
+        self.assertNotEqual(root, hasher.merkle_root(
+            files + [{'file_location': 'c.js', 'file_hash': '33'}]))
+        self.assertNotEqual(root, hasher.merkle_root(
+            [files[0], {'file_location': 'c.js', 'file_hash': '22'}]))
+
+class TestKnownGoodComparison(unittest.TestCase):
+    """Checking installations against the store."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store_file = os.path.join(self.tmp_dir, 'kg.db')
+        self.target_dir = os.path.join(self.tmp_dir, 'app')
+        self.package_dir = os.path.join(self.target_dir, 'node_modules', 'a')
+        os.makedirs(self.package_dir)
+        write_file(os.path.join(self.target_dir, 'package.json'),
+                   '{"name": "app", "version": "1.0.0"}')
+        write_file(os.path.join(self.package_dir, 'package.json'),
+                   '{"name": "a", "version": "1.0.0"}')
+        write_file(os.path.join(self.package_dir, 'a.js'), 'x')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def check(self, *options):
+        """Scan the installation with the store and the given options."""
+        with npm_dependency_check.Verifier(
+                ['--known-good-store', self.store_file] +
+                list(options)) as verifier:
+            return verifier.scan(self.target_dir)
+
+    def test_record_and_query(self):
+        """Recorded packages and installs can be looked up."""
+        self.check('--record-known-good', '--project', 'app')
+        manifest_store = store.ManifestStore(self.store_file)
+        try:
+            self.assertEqual(manifest_store.get('a', '1.0.0')['package_name'],
+                             'a')
+            self.assertEqual(manifest_store.get_installs('a', '1.0.0'),
+                             [('app', 'node_modules/a')])
+            self.assertEqual(manifest_store.get_installs('app', '1.0.0'),
+                             [('app', '')])
+            self.assertIsNone(manifest_store.get('app', '1.0.0'))
+        finally:
+            manifest_store.close()
+
+    def test_match(self):
+        """An unchanged installation matches the store."""
+        self.check('--record-known-good')
+        self.assertEqual(self.check()['warnings'], [])
+
+    def test_mismatch(self):
+        """A package that differs from its known-good manifest is
+        reported."""
+        self.check('--record-known-good')
+        write_file(os.path.join(self.package_dir, 'a.js'), 'y')
+        result = self.check()
+        self.assertEqual(result['num_warnings'], 1)
+        self.assertIn('do not match known-good copy of a@1.0.0',
+                      result['warnings'][0])
+        self.assertIn("changed: 'a.js'", result['warnings'][0])
+
+    def test_unrelated_projects(self):
+        """Projects of the same name and version are not compared to each
+        other."""
+        self.check('--record-known-good')
+        write_file(os.path.join(self.target_dir, 'index.js'), 'other')
+        self.assertEqual(self.check('--record-known-good')['warnings'], [])
+
+    def test_fewer_extensions(self):
+        """Only the files hashed now are compared to a manifest recorded with
+        more extensions."""
+        self.check('--record-known-good')
+        write_file(os.path.join(self.package_dir, 'package.json'),
+                   '{"name": "a", "version": "1.0.0", "x": 1}')
+        self.assertEqual(self.check('--hashed-extensions', '.js')['warnings'],
+                         [])
+        write_file(os.path.join(self.package_dir, 'a.js'), 'y')
+        result = self.check('--hashed-extensions', '.js')
+        self.assertEqual(result['num_warnings'], 1)
+        self.assertIn("(changed: 'a.js')", result['warnings'][0])
+
+    def test_more_extensions(self):
+        """A manifest recorded with fewer extensions than are hashed now
+        cannot vouch for the package."""
+        self.check('--record-known-good', '--hashed-extensions', '.json')
+        write_file(os.path.join(self.package_dir, 'a.js'), 'y')
+        result = self.check()
+        self.assertEqual(result['num_warnings'], 1)
+        self.assertIn('Skipping comparison', result['warnings'][0])
+
+    def test_unknown_extensions(self):
+        """A manifest that does not record its extensions is not used."""
+        manifest_store = store.ManifestStore(self.store_file)
+        try:
+            manifest_store.add(make_package('a', '1.0.0', []), [])
+            manifest_store._conn.execute(
+                "UPDATE manifests SET manifest = ?",
+                ('{"package_name": "a", "files": [], "merkle_root": "%s"}' %
+                 hasher.merkle_root([]),))
+        finally:
+            manifest_store.close()
+        result = self.check()
+        self.assertEqual(result['num_warnings'], 1)
+        self.assertIn('recorded hashing unknown files', result['warnings'][0])
+
+    def test_no_file_hashes(self):
+        """The store cannot be used without file hashes."""
+        self.assertRaises(ValueError, self.check, '--record-known-good',
+                          '--exclude-file-hash')
+        self.assertRaises(ValueError, self.check, '--exclude-file-hash')
+
+    def test_added_file(self):
+        """A file added to a package is reported, though no file of the
+        known-good copy was changed."""
+        self.check('--record-known-good')
+        write_file(os.path.join(self.package_dir, 'evil.js'), 'y')
+        result = self.check()
+        self.assertEqual(result['num_warnings'], 1)
+        self.assertIn("(added: 'evil.js')", result['warnings'][0])
+
+def write_file(filename, contents):
+    """Create a file with the specified contents."""
+    with open(filename, 'w') as out_file:
+        out_file.write(contents)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""Tests for throttle.py"""
+
+import io
+import os
+import time
+import threading
+import unittest
+
+import throttle # throttle.py
+
+class TestRateLimiter(unittest.TestCase):
+    """Pacing by a shared token bucket."""
+
+    def test_burst(self):
+        """Up to one second's worth of tokens is available at once."""
+        limiter = throttle.RateLimiter(1000)
+        start = time.time()
+        limiter.consume(1000)
+        self.assertLess(time.time() - start, 0.1)
+
+    def test_shared(self):
+        """Threads consuming together share the rate."""
+        limiter = throttle.RateLimiter(1000)
+        threads = [threading.Thread(target=limiter.consume, args=(250,))
+                   for _ in range(6)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 1000 tokens are available at once, the other 500 take half a second
+        self.assertGreaterEqual(time.time() - start, 0.4)
+
+    def test_scaled(self):
+        """A scale slows consumption down."""
+        limiter = throttle.RateLimiter(1000)
+        start = time.time()
+        # at half the rate, at most 500 tokens accumulate
+        limiter.consume(500, 0.5)
+        limiter.consume(250, 0.5)
+        self.assertGreaterEqual(time.time() - start, 0.4)
+
+class TestThrottle(unittest.TestCase):
+    """Pacing file reads."""
+
+    def test_unlimited(self):
+        """Without limits, reads are not paced."""
+        limits = throttle.Throttle()
+        start = time.time()
+        for _ in range(1000):
+            limits.open_file()
+            limits.read(1000000)
+        self.assertLess(time.time() - start, 0.1)
+
+    def test_reader(self):
+        """Bytes read through a `ThrottledReader` are counted."""
+        limits = throttle.Throttle(bytes_per_sec=1000)
+        reader = throttle.ThrottledReader(io.BytesIO('x' * 1500), limits)
+        start = time.time()
+        self.assertEqual(reader.read(), 'x' * 1500)
+        self.assertGreaterEqual(time.time() - start, 0.4)
+
+class TestLoadScale(unittest.TestCase):
+    """Slowing down on a loaded system."""
+
+    def setUp(self):
+        self.getloadavg = os.getloadavg
+
+    def tearDown(self):
+        os.getloadavg = self.getloadavg
+
+    def test_load_scale(self):
+        """Limits are scaled by the number of CPUs over the load, within
+        bounds."""
+        for load, scale in [(2.0, 1.0), (8.0, 0.5),
+                            (1000.0, throttle.MIN_LOAD_SCALE)]:
+            os.getloadavg = lambda: (load, 0.0, 0.0)
+            self.assertEqual(throttle.get_load_scale(4), scale)
+
+    def test_unreadable_load(self):
+        """Full speed is allowed if the load cannot be read."""
+        def getloadavg():
+            raise OSError("Load average is unobtainable")
+        os.getloadavg = getloadavg
+        self.assertEqual(throttle.get_load_scale(4), 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
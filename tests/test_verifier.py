@@ -0,0 +1,119 @@
+"""Tests for the Verifier of npm_dependency_check.py"""
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+import warnings
+
+import npm_dependency_check # npm_dependency_check.py
+
+class TestVerifier(unittest.TestCase):
+    """Running checks from other Python code."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.target_dirs = []
+        for name in ['app1', 'app2']:
+            target_dir = os.path.join(self.tmp_dir, name)
+            os.mkdir(target_dir)
+            write_file(os.path.join(target_dir, 'package.json'),
+                       '{"name": "%s", "version": "1.0.0"}' % name)
+            write_file(os.path.join(target_dir, 'index.js'), name)
+            self.target_dirs.append(target_dir)
+        self.verifier = npm_dependency_check.Verifier()
+
+    def tearDown(self):
+        self.verifier.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def write_baseline(self, target_dir):
+        """Write a baseline of an installation next to it."""
+        filename = target_dir + '.json'
+        with open(filename, 'w') as out_file:
+            json.dump(self.verifier.scan(target_dir)['package_data'],
+                      out_file)
+        return filename
+
+    def test_warnings_per_call(self):
+        """Each call returns only its own warnings, also when calls are made
+        from several threads at once, and nothing is printed."""
+        baselines = [self.write_baseline(target_dir)
+                     for target_dir in self.target_dirs]
+        write_file(os.path.join(self.target_dirs[0], 'index.js'), 'changed')
+        results = [None] * 2
+        def compare(i):
+            """Compare an installation to its baseline several times."""
+            results[i] = [
+                self.verifier.compare(self.target_dirs[i], baselines[i])
+                for _ in range(5)]
+        with warnings.catch_warnings(record=True) as emitted:
+            warnings.simplefilter('always')
+            threads = [threading.Thread(target=compare, args=(i,))
+                       for i in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(emitted, [])
+        for result in results[0]:
+            self.assertEqual(result['num_warnings'], 1)
+            self.assertIn("Hash mismatch for 'index.js'",
+                          result['warnings'][0])
+        for result in results[1]:
+            self.assertEqual(result['warnings'], [])
+            self.assertEqual(result['num_warnings'], 0)
+
+    def test_baseline_parsed_when_changed(self):
+        """A baseline file is only parsed again once it changes."""
+        baseline = self.write_baseline(self.target_dirs[0])
+        index = self.verifier.get_baseline(baseline)
+        self.assertIs(self.verifier.get_baseline(baseline), index)
+        self.verifier.compare(self.target_dirs[0], baseline)
+        self.assertIs(self.verifier.get_baseline(baseline), index)
+
+        write_file(os.path.join(self.target_dirs[0], 'index.js'), 'changed')
+        self.write_baseline(self.target_dirs[0])
+        # the rewritten baseline has the same size, so make sure the change
+        # is seen on file systems with coarse timestamps
+        mtime = os.stat(baseline).st_mtime + 10
+        os.utime(baseline, (mtime, mtime))
+        new_index = self.verifier.get_baseline(baseline)
+        self.assertIsNot(new_index, index)
+        self.assertNotEqual(new_index, index)
+        self.assertEqual(
+            self.verifier.compare(self.target_dirs[0], baseline)['warnings'],
+            [])
+
+    def test_per_call_options(self):
+        """Options naming files to read or write are refused, as each call
+        names its own."""
+        baseline = self.write_baseline(self.target_dirs[0])
+        for option, value in [('--input', baseline),
+                              ('--apply-delta', baseline),
+                              ('--output', baseline),
+                              ('--delta-output', baseline),
+                              ('--previous-lockfile', baseline)]:
+            self.assertRaises(ValueError, npm_dependency_check.Verifier,
+                              [option, value])
+        for option in ['--input', '--output']:
+            with self.assertRaises(ValueError) as context:
+                npm_dependency_check.Verifier([option, baseline])
+            self.assertIn('cannot be used with a Verifier',
+                          str(context.exception))
+
+    def test_invalid_options(self):
+        """Options the command line would refuse are refused."""
+        for options in [['--workers', '0'], ['--record-known-good']]:
+            self.assertRaises(ValueError, npm_dependency_check.Verifier,
+                              options)
+
+def write_file(filename, contents):
+    """Create a file with the specified contents."""
+    with open(filename, 'w') as out_file:
+        out_file.write(contents)
+
+if __name__ == '__main__':
+    unittest.main()
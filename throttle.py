@@ -0,0 +1,135 @@
+"""Limits the rate at which files are read.
+
+A full scan reads every hashed file of every installed package, which on a
+busy host competes with the application being protected. A `Throttle` paces
+reads to a number of bytes and files per second, optionally slowing down
+further while the system is loaded.
+"""
+
+import os
+import time
+import threading
+import multiprocessing
+
+# how often the load average is sampled, in seconds
+LOAD_SAMPLE_INTERVAL = 1.0
+
+# the slowest a loaded system can make a throttled scan, as a fraction of the
+# configured rates, so that a scan always completes
+MIN_LOAD_SCALE = 0.05
+
+class RateLimiter(object):
+    """A token bucket shared by any number of threads.
+
+    Up to one second's worth of tokens can accumulate while idle. Consuming
+    more than is available puts the bucket into debt, which the consuming
+    thread, and any that follow it, wait out.
+    """
+
+    def __init__(self, rate):
+        """
+        Args:
+            rate (float): Tokens added to the bucket per second.
+        """
+        self.rate = float(rate)
+        self._tokens = self.rate
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def consume(self, amount, scale=1.0):
+        """Take `amount` tokens, sleeping until they are available.
+
+        Args:
+            amount (int): The number of tokens to take.
+            scale (float): Fraction of the configured rate currently allowed.
+        """
+        rate = self.rate * scale
+        with self._lock:
+            now = time.time()
+            self._tokens = min(rate, self._tokens + (now - self._last) * rate)
+            self._last = now
+            self._tokens -= amount
+            delay = -self._tokens / rate if self._tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+
+class Throttle(object):
+    """Paces file reads to configured limits. Safe to share between threads."""
+
+    def __init__(self, bytes_per_sec=None, files_per_sec=None,
+                 adapt_to_load=False):
+        """
+        Args:
+            bytes_per_sec (int): The most bytes to read per second, or `None`
+                for no limit.
+            files_per_sec (int): The most files to open per second, or `None`
+                for no limit.
+            adapt_to_load (bool): Whether to scale both limits down by the
+                number of CPUs divided by the 1-minute load average while it
+                exceeds the number of CPUs.
+        """
+        self._bytes = RateLimiter(bytes_per_sec) if bytes_per_sec else None
+        self._files = RateLimiter(files_per_sec) if files_per_sec else None
+        self._adapt_to_load = adapt_to_load
+        self._num_cpus = multiprocessing.cpu_count()
+        self._scale = 1.0
+        self._scale_time = 0
+
+    def open_file(self):
+        """Wait until another file may be opened."""
+        if self._files is not None:
+            self._files.consume(1, self.get_scale())
+
+    def read(self, num_bytes):
+        """Account for `num_bytes` having been read, waiting as needed."""
+        if self._bytes is not None and num_bytes > 0:
+            self._bytes.consume(num_bytes, self.get_scale())
+
+    def get_scale(self):
+        """Get the fraction of the configured limits currently allowed."""
+        if not self._adapt_to_load:
+            return 1.0
+        now = time.time()
+        if now - self._scale_time >= LOAD_SAMPLE_INTERVAL:
+            self._scale_time = now
+            self._scale = get_load_scale(self._num_cpus)
+        return self._scale
+
+class ThrottledReader(object):
+    """Wraps a file, pacing reads through it by a `Throttle`."""
+
+    def __init__(self, in_file, throttle):
+        self._in_file = in_file
+        self._throttle = throttle
+
+    def read(self, size=-1):
+        """Read from the wrapped file."""
+        data = self._in_file.read(size)
+        self._throttle.read(len(data))
+        return data
+
+    def close(self):
+        """Close the wrapped file."""
+        self._in_file.close()
+
+def get_load_scale(num_cpus):
+    """Get the fraction of full speed to run at given the system load.
+
+    Returns 1.0 if the load average cannot be read.
+    """
+    try:
+        load = os.getloadavg()[0]
+    except OSError:
+        return 1.0
+    if load <= num_cpus:
+        return 1.0
+    return max(MIN_LOAD_SCALE, num_cpus / load)
+
+def lower_priority():
+    """Lower the CPU priority of this process to the minimum.
+
+    On Linux, processes without an explicit I/O priority also have their disk
+    reads scheduled according to their CPU priority by the CFQ and BFQ
+    schedulers, so this lowers I/O priority as well.
+    """
+    os.nice(19 - os.nice(0))
@@ -3,8 +3,11 @@
 def standardize_str(string):
     """Returns a standardized form of the string-like argument.
 
-    This will convert from a `unicode` object to a `str` object.
+    This will convert from a `unicode` object to a `str` object, encoded as
+    UTF-8 like the file names read from the file system.
     """
+    if isinstance(string, unicode):
+        return string.encode('utf-8')
     return str(string)
 
 def rstrip_once(string, suffix_char):